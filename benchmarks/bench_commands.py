@@ -0,0 +1,258 @@
+"""
+Times legit commands end to end and SCMRepo methods on a synthetic repository.
+
+Usage::
+
+    python -m benchmarks.bench_commands [--history 2000] [--local-branches 1000]
+        [--remote-branches 1000] [--stash-depth 10] [--files 2000] [--repeat 5]
+        [--replay] [--output results.json] [--compare baseline.json] [--threshold 1.25]
+
+Results are stored as JSON, so two commits can be compared by running the
+suite on each and passing the first result file to ``--compare`` of the
+second run. The exit status is 1 if a timing regressed beyond the threshold.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .repos import git, synthetic_repository
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legit(path, *args):
+    env = dict(os.environ, PYTHONPATH=PACKAGE_ROOT)
+    subprocess.run(
+        [sys.executable, '-m', 'legit'] + list(args), cwd=path, env=env, check=True,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def command_cases(work):
+    """Yields ``(name, setup, run)``; only ``run`` is timed."""
+
+    def noop():
+        pass
+
+    yield 'branches', noop, lambda: legit(work, 'branches')
+
+    targets = iter(['published/branch-00001', 'master'] * 1000)
+    yield 'switch', noop, lambda: legit(work, 'switch', next(targets))
+
+    def reset_master():
+        git(work, 'checkout', '-q', 'master')
+
+    yield 'sync', reset_master, lambda: legit(work, 'sync')
+
+    counter = iter(range(1000000))
+    names = []
+
+    def new_branch():
+        names.append('bench/publish-{}'.format(next(counter)))
+        git(work, 'branch', names[-1], 'master')
+
+    yield 'publish', new_branch, lambda: legit(work, 'publish', names[-1])
+    yield 'unpublish', noop, lambda: legit(work, 'unpublish', names.pop(0))
+
+    def new_commit():
+        git(work, 'commit', '-q', '--allow-empty', '-m', 'to be undone')
+
+    yield 'undo', new_commit, lambda: legit(work, 'undo')
+
+
+def method_cases():
+    """Yields ``(name, call)``, ``call`` is passed a fresh SCMRepo."""
+    yield 'get_branches', lambda scm: scm.get_branches()
+    yield 'get_branch_names(local=False)', lambda scm: scm.get_branch_names(local=False)
+    yield 'get_current_branch_name', lambda scm: scm.get_current_branch_name()
+    yield 'fuzzy_match_branch', lambda scm: scm.fuzzy_match_branch('branch-0042')
+    yield 'suggest_branches', lambda scm: scm.suggest_branches('brnch42')
+    yield 'unstash_index', lambda scm: scm.unstash_index(branch='branch-9999')
+    yield 'get_branch_states', lambda scm: scm.get_branch_states()
+    yield 'has_merges', lambda scm: scm.has_merges('origin/master', 'master')
+    yield 'refresh', lambda scm: scm.refresh()
+    yield 'display_available_branches', lambda scm: scm.display_available_branches()
+
+
+def summarize(timings):
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'runs': timings,
+    }
+
+
+def time_commands(work, repeat):
+    results = {}
+    for name, setup, run in command_cases(work):
+        timings = []
+        for _ in range(repeat):
+            setup()
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        results[name] = summarize(timings)
+        report(name, results[name])
+    return results
+
+
+def time_methods(work, repeat, replay=False):
+    """Times the SCMRepo methods, each run on a fresh SCMRepo.
+
+    With ``replay``, every method is recorded once and then timed replaying
+    the recording, which measures legit's own cost without git's.
+    """
+    from legit.scm import SCMRepo
+
+    results = {}
+    pwd = os.getcwd()
+    os.chdir(work)
+    cassettes = tempfile.TemporaryDirectory()
+    try:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            SCMRepo()
+            timings.append(time.perf_counter() - start)
+        results['SCMRepo()'] = summarize(timings)
+        report('SCMRepo()', results['SCMRepo()'])
+
+        for name, call in method_cases():
+            if replay:
+                cassette = os.path.join(cassettes.name, '{}.json'.format(len(results)))
+                with cassette_env('LEGIT_RECORD', cassette), \
+                        contextlib.redirect_stdout(io.StringIO()):
+                    scm = SCMRepo()
+                    call(scm)
+                    scm.backend.close()
+
+            timings = []
+            for _ in range(repeat):
+                if replay:
+                    with cassette_env('LEGIT_REPLAY', cassette):
+                        scm = SCMRepo()
+                else:
+                    # Every run starts cold, without what earlier calls cached.
+                    scm = SCMRepo()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    call(scm)
+                    timings.append(time.perf_counter() - start)
+            results[name] = summarize(timings)
+            report(name, results[name])
+    finally:
+        os.chdir(pwd)
+        cassettes.cleanup()
+    return results
+
+
+@contextlib.contextmanager
+def cassette_env(name, path):
+    os.environ[name] = path
+    try:
+        yield
+    finally:
+        del os.environ[name]
+
+
+def report(name, result):
+    print('  {:<32} min {:9.1f} ms   median {:9.1f} ms'.format(
+        name, result['min'] * 1000, result['median'] * 1000))
+
+
+def metadata(args):
+    revision = subprocess.run(
+        ['git', '-C', PACKAGE_ROOT, 'rev-parse', 'HEAD'], stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    return {
+        'revision': revision or None,
+        'git': subprocess.run(['git', '--version'], stdout=subprocess.PIPE,
+                              universal_newlines=True).stdout.strip(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'history': args.history,
+            'files': args.files,
+            'local_branches': args.local_branches,
+            'remote_branches': args.remote_branches,
+            'stash_depth': args.stash_depth,
+            'repeat': args.repeat,
+            'replay': args.replay,
+        },
+    }
+
+
+def compare(baseline, results, threshold):
+    """Prints the median ratios against ``baseline``, returns the regressions."""
+    if baseline['meta']['parameters'] != results['meta']['parameters']:
+        print('Warning: the baseline was measured with other parameters.')
+
+    regressions = []
+    print('\n{:<42} {:>10} {:>10} {:>7}'.format('', 'baseline', 'current', 'ratio'))
+    for group in ('commands', 'methods'):
+        for name, current in results[group].items():
+            old = baseline.get(group, {}).get(name)
+            if old is None:
+                continue
+            ratio = current['median'] / old['median'] if old['median'] else float('inf')
+            marker = ''
+            if ratio > threshold:
+                regressions.append('{}:{}'.format(group, name))
+                marker = '  <-- regression'
+            print('{:<42} {:8.1f}ms {:8.1f}ms {:6.2f}x{}'.format(
+                '{}: {}'.format(group, name), old['median'] * 1000,
+                current['median'] * 1000, ratio, marker))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', type=int, default=2000)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--local-branches', type=int, default=1000)
+    parser.add_argument('--remote-branches', type=int, default=1000)
+    parser.add_argument('--stash-depth', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--replay', action='store_true',
+                        help='Time the SCMRepo methods replaying recorded git output.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='JSON results of a baseline run.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Median ratio above which a timing counts as regressed.')
+    args = parser.parse_args()
+
+    results = {'meta': metadata(args)}
+    with tempfile.TemporaryDirectory() as root:
+        print('Generating repository...')
+        work, _ = synthetic_repository(
+            root, history=args.history, files=args.files,
+            local_branches=args.local_branches, remote_branches=args.remote_branches,
+            stash_depth=args.stash_depth)
+
+        print('SCMRepo methods:')
+        results['methods'] = time_methods(work, args.repeat, replay=args.replay)
+        print('Commands:')
+        results['commands'] = time_commands(work, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
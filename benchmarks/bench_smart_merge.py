@@ -0,0 +1,55 @@
+"""
+Compares merge detection used by ``SCMRepo.smart_merge``.
+
+Usage::
+
+    python -m benchmarks.bench_smart_merge [--ahead 50000] [--merge-every 0] [--commit-graph]
+"""
+
+import argparse
+import tempfile
+import time
+
+from .repos import git, init_repo, linear_history
+
+
+def old_has_merges(path):
+    return git(path, 'log', '--merges', 'master..topic').count('commit') > 0
+
+
+def new_has_merges(path):
+    return bool(git(path, 'rev-list', '--merges', '--max-count=1', 'master..topic').strip())
+
+
+def best_of(func, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ahead', type=int, default=50000)
+    parser.add_argument('--merge-every', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--commit-graph', action='store_true',
+                        help='Write a commit-graph before measuring.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        init_repo(path)
+        linear_history(path, 10, args.ahead, merge_every=args.merge_every)
+        if args.commit_graph:
+            git(path, 'commit-graph', 'write', '--reachable')
+
+        for name, func in (('log --merges', old_has_merges),
+                           ('rev-list --merges --max-count=1', new_has_merges)):
+            result, best = best_of(func, path, args.repeat)
+            print('{:<35} merges={!s:<5} {:8.1f} ms'.format(name, result, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
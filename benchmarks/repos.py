@@ -0,0 +1,132 @@
+"""
+benchmarks.repos
+~~~~~~~~~~~~~~~~
+
+Helpers generating synthetic git repositories for the benchmarks.
+"""
+
+import os
+import subprocess
+
+AUTHOR = 'Bench <bench@example.com> 1500000000 +0000'
+
+
+def git(path, *args, **kwargs):
+    return subprocess.run(
+        ['git', '-C', path] + list(args), check=True, stdout=subprocess.PIPE,
+        universal_newlines=True, **kwargs).stdout
+
+
+def init_repo(path, bare=False):
+    os.makedirs(path, exist_ok=True)
+    git(path, 'init', '-q', '-b', 'master', *(['--bare'] if bare else []))
+    if not bare:
+        git(path, 'config', 'user.name', 'Bench')
+        git(path, 'config', 'user.email', 'bench@example.com')
+    return path
+
+
+def _commit(ref, mark, message, parents):
+    lines = [
+        'commit {}'.format(ref),
+        'mark :{}'.format(mark),
+        'committer {}'.format(AUTHOR),
+        'data {}'.format(len(message)),
+        message,
+    ]
+    if parents:
+        lines.append('from :{}'.format(parents[0]))
+        lines.extend('merge :{}'.format(parent) for parent in parents[1:])
+    return '\n'.join(lines) + '\n\n'
+
+
+def linear_history(path, base_commits, ahead, merge_every=0, branch='topic'):
+    """Writes ``base_commits`` commits on master and ``ahead`` more on ``branch``.
+
+    With ``merge_every`` set, every n-th commit of ``branch`` merges a side
+    commit. The whole history is written with one ``git fast-import``.
+    """
+    stream = []
+    mark = 0
+
+    for i in range(base_commits):
+        mark += 1
+        stream.append(_commit('refs/heads/master', mark, 'base {}'.format(i),
+                              [mark - 1] if mark > 1 else []))
+    base = mark
+
+    previous = base
+    for i in range(ahead):
+        parents = [previous] if previous else []
+        if merge_every and i % merge_every == merge_every - 1:
+            mark += 1
+            stream.append(_commit('refs/heads/side', mark, 'side {}'.format(i), [previous]))
+            parents.append(mark)
+        mark += 1
+        stream.append(_commit('refs/heads/{}'.format(branch), mark, 'topic {}'.format(i),
+                              parents))
+        previous = mark
+
+    git(path, 'fast-import', '--quiet', input=''.join(stream))
+    return path
+
+
+def synthetic_repository(root, history=1000, files=1000, local_branches=100,
+                         remote_branches=100, stash_depth=5):
+    """Creates a working repository and the bare repository it publishes to.
+
+    ``master`` gets ``history`` commits over a tree of ``files`` files, and
+    there are ``local_branches`` unpublished and ``remote_branches``
+    published branches (plus ``master``), all pointing into that history.
+    ``stash_depth`` stashes are left on the stash stack. Returns the paths
+    of the working repository and of its remote.
+    """
+    remote = init_repo(os.path.join(root, 'remote.git'), bare=True)
+    work = init_repo(os.path.join(root, 'work'))
+
+    stream = ['blob\nmark :1\ndata 5\nfile\n\n']
+    mark = 1
+    commits = []
+    for i in range(history):
+        mark += 1
+        lines = [
+            'commit refs/heads/master',
+            'mark :{}'.format(mark),
+            'committer {}'.format(AUTHOR),
+            'data {}'.format(len('commit {}'.format(i))),
+            'commit {}'.format(i),
+        ]
+        if commits:
+            lines.append('from :{}'.format(commits[-1]))
+            content = 'change {}\n'.format(i)
+            lines.append('M 100644 inline dir{}/file{}.txt'.format(
+                i % files // 100, i % files))
+            lines.append('data {}\n{}'.format(len(content), content))
+        else:
+            lines.extend('M 100644 :1 dir{}/file{}.txt'.format(n // 100, n)
+                         for n in range(files))
+        stream.append('\n'.join(lines) + '\n\n')
+        commits.append(mark)
+
+    names = (['published/branch-{:05d}'.format(i) for i in range(remote_branches)] +
+             ['local/branch-{:05d}'.format(i) for i in range(local_branches)])
+    for i, name in enumerate(names):
+        stream.append('reset refs/heads/{}\nfrom :{}\n\n'.format(
+            name, commits[-1 - i % min(len(commits), 50)]))
+
+    git(work, 'fast-import', '--quiet', input=''.join(stream))
+    git(work, 'reset', '-q', '--hard')
+
+    git(work, 'remote', 'add', 'origin', remote)
+    git(work, 'push', '-q', 'origin', 'master',
+        *('refs/heads/{0}:refs/heads/{0}'.format(name) for name in names[:remote_branches]))
+    git(work, 'fetch', '-q', 'origin')
+    git(work, 'branch', '-q', '--set-upstream-to', 'origin/master', 'master')
+
+    for i in range(stash_depth):
+        with open(os.path.join(work, 'dir0', 'file0.txt'), 'a') as f:
+            f.write('stash {}\n'.format(i))
+        git(work, 'stash', 'push', '-q', '-m',
+            'Legit: stashing before switch. (legit:switch:branch-{})'.format(i))
+
+    return work, remote
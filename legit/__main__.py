@@ -0,0 +1,24 @@
+import sys
+
+
+def main():
+    # Shell completion skips click, which costs more than a Tab press may take.
+    if sys.argv[1:2] == ['__complete']:
+        from .complete import main as complete
+
+        sys.exit(complete(sys.argv[2:]))
+
+    if sys.argv[1:2] != ['daemon']:
+        from .daemon import run_client
+
+        code = run_client(sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
+
+    from .cli import cli
+
+    cli(prog_name='legit')
+
+
+if __name__ == '__main__':
+    main()
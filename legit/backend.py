@@ -0,0 +1,372 @@
+"""
+legit.backend
+~~~~~~~~~~~~~
+
+This module provides the backends used to execute git commands.
+"""
+
+import atexit
+import json
+import os
+import subprocess
+import tempfile
+import threading
+
+from . import trace
+
+# Commands (or command + sub-command pairs) which never modify the repository.
+READ_ONLY_COMMANDS = frozenset([
+    'cat-file', 'config --get', 'config --list', 'diff-tree', 'for-each-ref', 'log',
+    'ls-remote', 'merge-base', 'patch-id', 'rev-list', 'rev-parse', 'show-ref',
+    'stash list', 'status', 'submodule status', 'worktree list',
+])
+
+# Commands which may write to the repository config.
+CONFIG_WRITING_COMMANDS = frozenset([
+    'branch', 'checkout', 'config', 'remote', 'submodule', 'switch', 'worktree',
+])
+
+
+def is_read_only(command):
+    """Returns True if the git ``command`` (without executable) only reads."""
+    if not command:
+        return False
+    return (command[0] in READ_ONLY_COMMANDS or
+            ' '.join(command[:2]) in READ_ONLY_COMMANDS)
+
+
+def writes_config(command):
+    """Returns True if the git ``command`` (without executable) may change config."""
+    if not command or is_read_only(command):
+        return False
+    if command[0] == 'push':
+        return '-u' in command or '--set-upstream' in command
+    return command[0] in CONFIG_WRITING_COMMANDS
+
+
+class GitBackend:
+    """Spawns a new git process for every command."""
+
+    def __init__(self, repo, git='git'):
+        self.repo = repo
+        self.git = git
+
+    def execute(self, command, input=None, **kwargs):
+        """Executes ``command`` (including the git executable).
+
+        ``input`` is an optional string fed to the command's standard input.
+        """
+        with trace.git_span(command) as span:
+            if input is None:
+                result = self.repo.git.execute(command, **kwargs)
+            else:
+                with tempfile.TemporaryFile() as istream:
+                    istream.write(input.encode())
+                    istream.seek(0)
+                    result = self.repo.git.execute(command, istream=istream, **kwargs)
+            if trace.tracer is not None:
+                span.set(exit_code=result[0] if isinstance(result, tuple) else 0,
+                         bytes=trace.output_size(result))
+            return result
+
+    def stream(self, command):
+        """Yields the output lines of ``command`` as they are produced.
+
+        Closing the generator early terminates the git process, so callers
+        can stop reading as soon as they found what they were looking for.
+        """
+        with trace.git_span(command) as span:
+            proc = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                cwd=self.repo.working_dir, env=self.command_env(command))
+            size = 0
+            try:
+                for line in proc.stdout:
+                    size += len(line)
+                    yield line.decode('utf-8', 'replace').rstrip('\n')
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                proc.stdout.close()
+                span.set(exit_code=proc.wait(), bytes=size)
+
+    def command_env(self, command):
+        """Returns the environment ``command`` is run with, None to inherit."""
+        return None
+
+    def resolve(self, rev):
+        """Returns the object id ``rev`` points to, or None."""
+        status, stdout, _ = self.execute(
+            [self.git, 'rev-parse', '--verify', '--quiet', '{}^{{object}}'.format(rev)],
+            with_extended_output=True, with_exceptions=False)
+        return stdout.strip() if status == 0 else None
+
+    def close(self):
+        pass
+
+
+class PersistentBackend(GitBackend):
+    """Keeps long-lived git helpers alive for the lifetime of the repository.
+
+    Object and ref lookups are answered by a single ``git cat-file`` process,
+    and the remaining read-only commands run with the repository location
+    pinned in the environment, which skips repository discovery and optional
+    lock taking. Mutating commands are spawned as usual.
+    """
+
+    def __init__(self, repo, git='git'):
+        super().__init__(repo, git=git)
+        self._cat_file = None
+        self._read_env = {
+            'GIT_DIR': repo.git_dir,
+            'GIT_OPTIONAL_LOCKS': '0',
+        }
+        if repo.working_tree_dir:
+            self._read_env['GIT_WORK_TREE'] = repo.working_tree_dir
+
+    def execute(self, command, input=None, **kwargs):
+        if is_read_only(command[1:]) and 'env' not in kwargs:
+            kwargs['env'] = self._read_env
+        return super().execute(command, input=input, **kwargs)
+
+    def command_env(self, command):
+        if is_read_only(command[1:]):
+            return dict(os.environ, **self._read_env)
+        return None
+
+    @property
+    def cat_file(self):
+        if self._cat_file is None:
+            self._cat_file = CatFile(self.git, self.repo.working_dir,
+                                     batch_command=self.repo.git.version_info >= (2, 36))
+        return self._cat_file
+
+    def resolve(self, rev):
+        info = self.cat_file.info(rev)
+        return info[0] if info else None
+
+    def close(self):
+        if self._cat_file is not None:
+            self._cat_file.close()
+            self._cat_file = None
+
+
+class CatFile:
+    """A persistent ``git cat-file --batch-command`` (or ``--batch``) process."""
+
+    def __init__(self, git, cwd, batch_command=True):
+        self.git = git
+        self.cwd = cwd
+        self.batch_command = batch_command
+        self.proc = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        mode = '--batch-command' if self.batch_command else '--batch'
+        env = dict(os.environ, GIT_OPTIONAL_LOCKS='0')
+        self.proc = subprocess.Popen(
+            [self.git, 'cat-file', mode],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, cwd=self.cwd, env=env)
+
+    def info(self, rev):
+        """Returns ``(oid, type, size)`` for ``rev``, or None if it is missing."""
+        if not rev or any(c.isspace() for c in rev):
+            return None
+
+        with self.lock:
+            if self.proc is None or self.proc.poll() is not None:
+                self._start()
+
+            line = 'info {}\n'.format(rev) if self.batch_command else rev + '\n'
+            self.proc.stdin.write(line.encode())
+            self.proc.stdin.flush()
+
+            header = self.proc.stdout.readline().decode().split()
+            if len(header) != 3:  # "<rev> missing" or "<rev> ambiguous"
+                return None
+
+            oid, type_, size = header[0], header[1], int(header[2])
+            if not self.batch_command:
+                # ``--batch`` always sends the body, followed by a newline.
+                self.proc.stdout.read(size + 1)
+
+        return oid, type_, size
+
+    def close(self):
+        with self.lock:
+            if self.proc is not None:
+                try:
+                    self.proc.stdin.close()
+                    self.proc.wait()
+                except OSError:
+                    pass
+                self.proc = None
+
+
+class CassetteMissing(LookupError):
+    """A replayed command was never recorded."""
+
+
+class Cassette:
+    """Recorded git interactions, stored as a JSON file.
+
+    Interactions are keyed by their kind (``execute``, ``stream`` or
+    ``resolve``), the git arguments and the standard input. A command run
+    several times is answered with its recordings in order, the last one
+    being repeated once they are used up. The working tree path is stored
+    as ``{worktree}``, so cassettes can be replayed in another checkout.
+    """
+
+    WORKTREE = '{worktree}'
+
+    def __init__(self, path, worktree=None):
+        self.path = path
+        self.worktree = worktree
+        self.interactions = {}
+        self.replayed = {}
+
+    def load(self):
+        with open(self.path) as f:
+            for interaction in json.load(f)['interactions']:
+                key = self._key(interaction['kind'], interaction['args'], interaction['input'])
+                self.interactions.setdefault(key, []).append(interaction)
+        return self
+
+    def save(self):
+        interactions = [i for recorded in self.interactions.values() for i in recorded]
+        interactions.sort(key=lambda interaction: interaction['order'])
+        with open(self.path, 'w') as f:
+            json.dump({'version': 1, 'interactions': interactions}, f, indent=1)
+
+    def _key(self, kind, args, input):
+        return json.dumps([kind, args, input])
+
+    def _encode(self, value):
+        if isinstance(value, str) and self.worktree:
+            return value.replace(self.worktree, self.WORKTREE)
+        if isinstance(value, list):
+            return [self._encode(item) for item in value]
+        return value
+
+    def _decode(self, value):
+        if isinstance(value, str) and self.worktree:
+            return value.replace(self.WORKTREE, self.worktree)
+        if isinstance(value, list):
+            return [self._decode(item) for item in value]
+        return value
+
+    def record(self, kind, command, input, **result):
+        args = self._encode(list(command[1:]))
+        input = self._encode(input)
+        interaction = dict(kind=kind, args=args, input=input,
+                           order=sum(len(i) for i in self.interactions.values()))
+        interaction.update({name: self._encode(value) for name, value in result.items()})
+        self.interactions.setdefault(self._key(kind, args, input), []).append(interaction)
+
+    def replay(self, kind, command, input=None):
+        key = self._key(kind, self._encode(list(command[1:])), self._encode(input))
+        recorded = self.interactions.get(key)
+        if not recorded:
+            raise CassetteMissing('git {} was not recorded in {}'.format(
+                ' '.join(command[1:]), self.path))
+        index = self.replayed.get(key, 0)
+        self.replayed[key] = index + 1
+        interaction = recorded[min(index, len(recorded) - 1)]
+        return {name: self._decode(value) for name, value in interaction.items()}
+
+
+def git_result(command, status, stdout, stderr, with_extended_output=False,
+               with_exceptions=True):
+    """Shapes a command result the way GitPython's ``Git.execute`` returns it."""
+    if with_exceptions and status != 0:
+        from git.exc import GitCommandError
+
+        raise GitCommandError(command, status, stderr, stdout)
+    if with_extended_output:
+        return status, stdout, stderr
+    return stdout
+
+
+class RecordingBackend:
+    """Runs commands through ``backend`` and records them to a cassette.
+
+    The cassette is written when the backend is closed (or at exit).
+    """
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.git = backend.git
+        self.cassette = Cassette(path, worktree=backend.repo.working_tree_dir)
+        atexit.register(self.close)
+
+    def execute(self, command, input=None, with_extended_output=False,
+                with_exceptions=True, **kwargs):
+        status, stdout, stderr = self.backend.execute(
+            command, input=input, with_extended_output=True, with_exceptions=False, **kwargs)
+        self.cassette.record('execute', command, input,
+                             status=status, stdout=stdout, stderr=stderr)
+        return git_result(command, status, stdout, stderr,
+                          with_extended_output, with_exceptions)
+
+    def stream(self, command):
+        lines = []
+        try:
+            for line in self.backend.stream(command):
+                lines.append(line)
+                yield line
+        finally:
+            # Only what was read is recorded, which is all a replay reads too.
+            self.cassette.record('stream', command, None, lines=lines)
+
+    def resolve(self, rev):
+        oid = self.backend.resolve(rev)
+        self.cassette.record('resolve', [self.git, rev], None, oid=oid)
+        return oid
+
+    def close(self):
+        if self.cassette is not None:
+            self.cassette.save()
+            self.cassette = None
+        self.backend.close()
+
+
+class ReplayBackend:
+    """Answers commands from a recorded cassette, without running git."""
+
+    def __init__(self, repo, path, git='git'):
+        self.repo = repo
+        self.git = git
+        self.cassette = Cassette(path, worktree=repo.working_tree_dir).load()
+
+    def execute(self, command, input=None, with_extended_output=False,
+                with_exceptions=True, **kwargs):
+        with trace.git_span(command) as span:
+            recorded = self.cassette.replay('execute', command, input)
+            span.set(exit_code=recorded['status'], replayed=True)
+        return git_result(command, recorded['status'], recorded['stdout'], recorded['stderr'],
+                          with_extended_output, with_exceptions)
+
+    def stream(self, command):
+        return iter(self.cassette.replay('stream', command)['lines'])
+
+    def resolve(self, rev):
+        return self.cassette.replay('resolve', [self.git, rev])['oid']
+
+    def close(self):
+        pass
+
+
+def make_backend(repo, git='git', environ=os.environ):
+    """Returns the backend for ``repo``.
+
+    ``LEGIT_RECORD=<cassette>`` records every git interaction to a file,
+    ``LEGIT_REPLAY=<cassette>`` serves them back without running git.
+    """
+    if environ.get('LEGIT_REPLAY'):
+        return ReplayBackend(repo, environ['LEGIT_REPLAY'], git=git)
+    backend = PersistentBackend(repo, git=git)
+    if environ.get('LEGIT_RECORD'):
+        return RecordingBackend(backend, environ['LEGIT_RECORD'])
+    return backend
@@ -5,22 +5,47 @@ legit.cli
 This module provides the CLI interface to legit.
 """
 import os
+from functools import update_wrapper
 
 import click
 import crayons
-from clint import resources
-from clint.textui import columns
 
+from . import bootstrap, trace  # noqa: F401
 from .core import __version__
-from .scm import SCMRepo
-from .settings import legit_settings
+from .settings import legit_settings, user_config_path, write_default_settings
 from .utils import (
-    black, format_help, git_version, order_manually, output_aliases,
-    status_log, verbose_echo, program_path
+    black, format_help, git_version, is_wildcard_pattern, order_manually,
+    output_aliases, status_log, verbose_echo, program_path
 )
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
-pass_scm = click.make_pass_decorator(SCMRepo)
+
+
+def pass_scm(f):
+    """Passes the shared SCMRepo to ``f``, creating it on first use.
+
+    Unlike ``click.make_pass_decorator(SCMRepo)`` this defers importing
+    GitPython until a command actually needs the repository, so ``--help``
+    and ``--version`` stay fast.
+    """
+    @click.pass_context
+    def new_func(ctx, *args, **kwargs):
+        root = ctx.find_root()
+        if root.obj is None:
+            from . import daemon
+
+            if daemon.warm_repository is not None:
+                root.obj = daemon.warm_repository
+            else:
+                with trace.span('open repository'):
+                    from .scm import SCMRepo
+
+                    root.obj = SCMRepo()
+            root.obj.fake = root.params.get('fake', False)
+            root.obj.verbose = root.obj.fake or root.params.get('verbose', False)
+        with trace.span('legit {}'.format(ctx.info_name), 'command'):
+            return ctx.invoke(f, root.obj, *args, **kwargs)
+    return update_wrapper(new_func, f)
 
 
 class LegitGroup(click.Group):
@@ -78,16 +103,20 @@ class LegitGroup(click.Group):
 @click.option('--install', is_flag=True, help='Install legit git aliases.')
 @click.option('--uninstall', is_flag=True, help='Uninstall legit git aliases.')
 @click.option('--config', is_flag=True, help='Edit legit configuration file.')
+@click.option('--timings', is_flag=True,
+              help='Print where the time went: every step and git command.')
+@click.option('--trace-file', type=click.Path(dir_okay=False, writable=True),
+              envvar='LEGIT_TRACE',
+              help='Write a Chrome trace (for Perfetto) to this file.')
 @click.pass_context
-def cli(ctx, verbose, fake, install, uninstall, config):
+def cli(ctx, verbose, fake, install, uninstall, config, timings, trace_file):
     """legit command line interface"""
-    # Create a repo object and remember it as as the context object.  From
-    # this point onwards other commands can refer to it by using the
-    # @pass_scm decorator.
-    ctx.obj = SCMRepo()
-    ctx.obj.fake = fake
-    ctx.obj.verbose = fake or verbose
+    if timings or trace_file:
+        tracer = trace.enable()
+        ctx.call_on_close(lambda: report_trace(tracer, timings, trace_file))
 
+    # The repo object is created lazily by the @pass_scm decorator the first
+    # time a command refers to it, and is shared through the root context.
     if install:
         do_install(ctx, verbose, fake)
         ctx.exit()
@@ -107,9 +136,18 @@ def cli(ctx, verbose, fake, install, uninstall, config):
 @click.argument('to_branch', required=False)
 @click.option('--verbose', is_flag=True, help='Enables verbose mode.')
 @click.option('--fake', is_flag=True, help='Show but do not invoke git commands.')
+@click.option('--worktree/--no-worktree', default=None,
+              help='Use a separate worktree per branch instead of checking it out.')
+@click.option('--print-path', is_flag=True,
+              help='Only print the path of the worktree, for use with cd.')
 @pass_scm
-def switch(scm, to_branch, verbose, fake):
+def switch(scm, to_branch, verbose, fake, worktree, print_path):
     """Switches from one branch to another, safely stashing and restoring local changes.
+
+    With --worktree (or legit.switchMode set to "worktree") every branch gets
+    its own worktree, so nothing is stashed or checked out:
+
+        cd "$(legit switch --worktree <branch> --print-path)"
     """
     scm.fake = fake
     scm.verbose = fake or verbose
@@ -120,6 +158,14 @@ def switch(scm, to_branch, verbose, fake):
         scm.display_available_branches()
         raise click.BadArgumentUsage('Please specify a branch to switch to')
 
+    to_branch = scm.fuzzy_match_branch(to_branch)
+
+    if worktree is None:
+        worktree = scm.switch_mode() == 'worktree'
+    if worktree:
+        do_switch_worktree(scm, to_branch, print_path)
+        return
+
     scm.stash_log()
     status_log(scm.checkout_branch, 'Switching to {}.'.format(
         crayons.yellow(to_branch)), to_branch)
@@ -130,9 +176,20 @@ def switch(scm, to_branch, verbose, fake):
 @click.argument('to_branch', required=False)
 @click.option('--verbose', is_flag=True, help='Enables verbose mode.')
 @click.option('--fake', is_flag=True, help='Show but do not invoke git commands.')
+@click.option('--all', 'sync_all', is_flag=True,
+              help='Sync every published branch with one fetch and one push.')
+@click.option('--workspace', 'manifest', type=click.Path(exists=True, dir_okay=False),
+              help='Sync every repository listed in a manifest file.')
+@click.option('--recurse-submodules', is_flag=True,
+              help='Also sync all submodules of the current repository.')
+@click.option('--all-remotes/--no-all-remotes', default=None,
+              help='Fetch from every remote concurrently (default: legit.fetchAllRemotes).')
+@click.option('-j', '--jobs', type=click.IntRange(min=1),
+              help='Number of repositories synced (or remotes fetched) concurrently.')
 @pass_scm
 @click.pass_context
-def sync(ctx, scm, to_branch, verbose, fake):
+def sync(ctx, scm, to_branch, verbose, fake, sync_all, manifest, recurse_submodules,
+         all_remotes, jobs):
     """Stashes unstaged changes, Fetches remote data, Performs smart
     pull+merge, Pushes local commits up, and Unstashes changes.
 
@@ -141,8 +198,25 @@ def sync(ctx, scm, to_branch, verbose, fake):
     scm.fake = fake
     scm.verbose = fake or verbose
 
+    if manifest or recurse_submodules:
+        if to_branch:
+            raise click.BadArgumentUsage(
+                'A branch cannot be given when syncing several repositories.')
+        do_sync_workspace(scm, manifest, recurse_submodules, jobs, verbose, fake, sync_all,
+                          all_remotes)
+        return
+
     scm.repo_check(require_remote=True)
 
+    if all_remotes is None:
+        all_remotes = scm.fetch_all_enabled()
+
+    if sync_all:
+        if to_branch:
+            raise click.BadArgumentUsage('A branch cannot be given together with --all.')
+        do_sync_all(scm, all_remotes, jobs)
+        return
+
     if to_branch:
         # Optional branch specifier.
         branch = scm.fuzzy_match_branch(to_branch)
@@ -160,17 +234,20 @@ def sync(ctx, scm, to_branch, verbose, fake):
 
     if branch in scm.get_branch_names(local=False):
         if is_external:
-            ctx.invoke(switch, to_branch=branch, verbose=verbose, fake=fake)
+            ctx.invoke(switch, to_branch=branch, verbose=verbose, fake=fake, worktree=False)
         scm.stash_log(sync=True)
-        status_log(scm.smart_pull, 'Pulling commits from the server.')
+        if all_remotes:
+            do_fetch_remotes(scm, jobs)
+        status_log(scm.smart_pull, 'Pulling commits from the server.', fetch=not all_remotes)
         status_log(scm.push, 'Pushing commits to the server.', branch)
         scm.unstash_log(sync=True)
         if is_external:
-            ctx.invoke(switch, to_branch=original_branch, verbose=verbose, fake=fake)
+            ctx.invoke(switch, to_branch=original_branch, verbose=verbose, fake=fake,
+                       worktree=False)
     else:
         raise click.BadArgumentUsage(
-            "Branch {} is not published. Publish before syncing."
-            .format(crayons.yellow(branch)))
+            "Branch {} is not published. Publish before syncing.{}"
+            .format(crayons.yellow(branch), did_you_mean(scm, branch)))
 
 
 @cli.command(short_help='Publishes specified branch to the remote.')
@@ -184,6 +261,11 @@ def publish(scm, to_branch, verbose, fake):
     scm.verbose = fake or verbose
 
     scm.repo_check(require_remote=True)
+
+    if is_wildcard_pattern(to_branch):
+        do_publish_pattern(scm, to_branch)
+        return
+
     branch = scm.fuzzy_match_branch(to_branch)
 
     if not branch:
@@ -211,13 +293,20 @@ def publish(scm, to_branch, verbose, fake):
 @click.argument('published_branch', required=False)
 @click.option('--verbose', is_flag=True, help='Enables verbose mode.')
 @click.option('--fake', is_flag=True, help='Show but do not invoke git commands.')
+@click.option('-y', '--yes', is_flag=True,
+              help='Do not ask for confirmation when unpublishing by pattern.')
 @pass_scm
-def unpublish(scm, published_branch, verbose, fake):
+def unpublish(scm, published_branch, verbose, fake, yes):
     """Removes a published branch from the remote repository."""
     scm.fake = fake
     scm.verbose = fake or verbose
 
     scm.repo_check(require_remote=True)
+
+    if is_wildcard_pattern(published_branch):
+        do_publish_pattern(scm, published_branch, unpublish=True, yes=yes)
+        return
+
     branch = scm.fuzzy_match_branch(published_branch)
 
     if not branch:
@@ -228,8 +317,8 @@ def unpublish(scm, published_branch, verbose, fake):
 
     if branch not in branch_names:
         raise click.BadArgumentUsage(
-            "Branch {} is not published. Use a branch that is published."
-            .format(crayons.yellow(branch)))
+            "Branch {} is not published. Use a branch that is published.{}"
+            .format(crayons.yellow(branch), did_you_mean(scm, branch)))
 
     status_log(scm.unpublish_branch, 'Unpublishing {}.'.format(
         crayons.yellow(branch)), branch)
@@ -250,23 +339,389 @@ def undo(scm, verbose, fake, hard):
     status_log(scm.undo, 'Last commit removed from history.', hard)
 
 
+@cli.command(short_help='Fetches remotes ahead of the next sync.')
+@click.option('--verbose', is_flag=True, help='Enables verbose mode.')
+@click.option('--fake', is_flag=True, help='Show but do not invoke git commands.')
+@click.option('--daemon', is_flag=True,
+              help='Keep running, prefetching whenever a remote is due.')
+@click.option('--force', is_flag=True, help='Prefetch remotes which are not due yet.')
+@click.option('--systemd-timer', is_flag=True,
+              help='Install a systemd user timer prefetching this repository.')
+@pass_scm
+def prefetch(scm, verbose, fake, daemon, force, systemd_timer):
+    """Fetches all remotes into refs/prefetch/, at most once per
+    legit.prefetchInterval seconds (900 by default), backing off on failures.
+    The next sync then only asks the server for what changed since.
+    """
+    from .prefetch import PrefetchLocked, run_daemon, run_prefetch
+
+    scm.fake = fake
+    scm.verbose = fake or verbose
+
+    scm.repo_check(require_remote=True)
+
+    if systemd_timer:
+        do_install_prefetch_timer(scm, fake)
+        return
+
+    def report(remote_name, ok):
+        if ok:
+            click.echo('Prefetched {}.'.format(crayons.yellow(remote_name)))
+        else:
+            click.echo('{} to prefetch {}, retrying later.'.format(
+                crayons.red('Failed'), crayons.yellow(remote_name)))
+
+    if daemon:
+        run_daemon(scm, callback=report)
+
+    try:
+        run_prefetch(scm, force=force, callback=report)
+    except PrefetchLocked:
+        click.echo('Another prefetch is running in this repository.')
+
+
+@cli.command(short_help='Deletes branches merged into a branch.')
+@click.argument('target', required=False)
+@click.option('--verbose', is_flag=True, help='Enables verbose mode.')
+@click.option('--fake', is_flag=True, help='Show but do not invoke git commands.')
+@click.option('-y', '--yes', is_flag=True, help='Do not ask for confirmation.')
+@click.option('--local-only', is_flag=True, help='Keep the published branches.')
+@pass_scm
+def prune(scm, target, verbose, fake, yes, local_only):
+    """Deletes the branches merged into TARGET (the current branch by
+    default), locally and from the remote. Branches whose commits reached
+    TARGET by a squash merge, rebase or cherry-pick count as merged too.
+    """
+    scm.fake = fake
+    scm.verbose = fake or verbose
+
+    scm.repo_check()
+
+    if target is None:
+        target = scm.get_current_branch_name()
+    elif target not in scm.get_branch_names(remote_branches=False):
+        raise click.BadArgumentUsage(
+            'Branch {} does not exist.{}'.format(crayons.yellow(target), did_you_mean(scm, target)))
+
+    do_prune(scm, target, yes, local_only)
+
+
+@cli.command(short_help='Keeps legit loaded to run commands faster.')
+@click.option('--status', is_flag=True, help='Tell whether the daemon is running.')
+@click.option('--stop', is_flag=True, help='Stop the running daemon.')
+@click.option('--idle-timeout', type=click.IntRange(min=0), default=3600, show_default=True,
+              help='Exit after this many seconds without commands (0 never exits).')
+def daemon(status, stop, idle_timeout):
+    """Runs legit commands in a resident process. While it is running,
+    every legit command is handed to it and starts with the Python modules
+    loaded and the repository already opened. Without it, commands run as
+    usual. Set LEGIT_DAEMON=0 to bypass it.
+    """
+    from .daemon import STATUS, STOP, Daemon, DaemonRunning, request, socket_path
+
+    if status or stop:
+        reply = request(STOP if stop else STATUS)
+        click.echo('Daemon {}.'.format(reply or 'not running'))
+        if reply is None and status:
+            raise click.exceptions.Exit(1)
+        return
+
+    path = socket_path()
+    try:
+        server = Daemon(path, idle_timeout=idle_timeout, log=click.echo)
+        server.bind()
+        click.echo('Listening on {}.'.format(path))
+        server.serve()
+    except DaemonRunning:
+        click.echo('The daemon is running already.')
+    except OSError as e:
+        raise click.ClickException('Can not listen on {}: {}'.format(path, e))
+
+
 @cli.command()
 @click.argument('wildcard_pattern', required=False)
+@click.option('--limit', type=click.IntRange(min=0), default=0,
+              help='Show at most this many branches (0 shows all).')
+@click.option('--pager/--no-pager', default=False,
+              help='Show the branches through the pager.')
+@click.option('--live', is_flag=True,
+              help='Ask the remote which branches are published (cached briefly).')
+@click.option('--status', is_flag=True,
+              help='Show how far branches are ahead of or behind their upstream.')
 @pass_scm
-def branches(scm, wildcard_pattern):
+def branches(scm, wildcard_pattern, limit, pager, live, status):
     """Displays a list of branches."""
     scm.repo_check()
 
     if wildcard_pattern:
-        scm.display_available_branches(wildcard_pattern)
+        scm.display_available_branches(wildcard_pattern, limit=limit, pager=pager, live=live,
+                                       status=status)
     else:
-        scm.display_available_branches()
+        scm.display_available_branches(limit=limit, pager=pager, live=live, status=status)
+
+
+def report_trace(tracer, timings, trace_file):
+    """Prints the timing summary and writes the trace file, as requested."""
+    trace.disable()
+    if timings:
+        click.echo('\n' + tracer.summary(), err=True)
+    if trace_file:
+        tracer.write_chrome_trace(trace_file)
+
+
+def did_you_mean(scm, branch):
+    """Returns a "did you mean" hint if ``branch`` doesn't exist at all."""
+    if branch in scm.branch_index():
+        return ''
+
+    suggestions = scm.suggest_branches(branch)
+    if not suggestions:
+        return ''
+    return '\nDid you mean {}?'.format(
+        ' or '.join(str(crayons.yellow(name)) for name in suggestions))
+
+
+def do_switch_worktree(scm, branch, print_path=False):
+    """Switches to the worktree of ``branch`` and prunes idle worktrees."""
+    if not print_path:
+        click.echo('Switching to {} in its worktree.'.format(crayons.yellow(branch)))
+
+    path = scm.switch_worktree(branch)
+    removed = scm.prune_worktrees(keep=(path, scm.repo.working_tree_dir))
+
+    if print_path:
+        click.echo(path)
+        return
+
+    for removed_path in removed:
+        click.echo(black('Removed idle worktree {}'.format(removed_path)))
+    click.echo('Worktree of {}: {}'.format(crayons.yellow(branch), path))
+
+
+def do_publish_pattern(scm, pattern, unpublish=False, yes=False):
+    """Publishes (or unpublishes) all branches matching a wildcard pattern at once."""
+    branches = [
+        branch.name for branch in scm.get_branches(wildcard_pattern=pattern)
+        if branch.is_published == unpublish
+    ]
+    state = 'published' if unpublish else 'unpublished'
+
+    if not branches:
+        raise click.BadArgumentUsage(
+            'No {} branches match {}.'.format(state, crayons.yellow(pattern)))
+
+    click.echo('{} {} branches match {}:'.format(
+        len(branches), state, crayons.yellow(pattern)))
+    for branch in branches:
+        click.echo('  {}'.format(crayons.yellow(branch)))
+
+    if unpublish:
+        if not (yes or scm.fake) and not click.confirm(
+                '\nUnpublish {} branches?'.format(len(branches))):
+            raise click.Abort
+        status_log(scm.unpublish_branches, 'Unpublishing {} branches.'.format(
+            len(branches)), branches)
+    else:
+        status_log(scm.publish_branches, 'Publishing {} branches.'.format(
+            len(branches)), branches)
+
+
+def do_prune(scm, target, yes=False, local_only=False):
+    """Lists the branches merged into ``target`` and deletes them at once."""
+    merged = scm.get_merged_branches(target)
+    checked_out = {worktree.branch for worktree in scm.get_worktrees()}
+
+    local = [b for b in merged if not b.is_published and b.name not in checked_out]
+    published = [] if local_only else [
+        b for b in merged if b.is_published and b.name not in checked_out]
+
+    if not local and not published:
+        click.echo('No branches are merged into {}.'.format(crayons.yellow(target)))
+        return
+
+    for title, branches in (('Branches', local), ('Published branches', published)):
+        if branches:
+            click.echo('{} merged into {}:'.format(title, crayons.yellow(target)))
+        for branch in branches:
+            click.echo('  {}{}'.format(
+                crayons.yellow(branch.name), black(' (by patch)') if branch.by_patch else ''))
+
+    if not (yes or scm.fake) and not click.confirm(
+            '\nDelete {} local and {} published branches?'.format(len(local), len(published))):
+        raise click.Abort
+
+    if local:
+        status_log(scm.delete_branches, 'Deleting {} branches.'.format(len(local)),
+                   {branch.name: branch.oid for branch in local})
+    if published:
+        status_log(scm.unpublish_branches, 'Unpublishing {} branches.'.format(len(published)),
+                   [branch.name for branch in published])
+
+
+def do_install_prefetch_timer(scm, fake):
+    """Writes the systemd user service and timer running ``legit prefetch``."""
+    from .prefetch import (prefetch_interval, systemd_unit_dir, systemd_unit_name,
+                           systemd_units)
+    from .workspace import legit_command
+
+    path = scm.repo.working_tree_dir
+    name = systemd_unit_name(path)
+    units = systemd_units(path, ' '.join(legit_command()), prefetch_interval(scm))
+
+    unit_dir = systemd_unit_dir()
+    for suffix, content in zip(('.service', '.timer'), units):
+        unit_path = os.path.join(unit_dir, name + suffix)
+        if fake:
+            click.echo(crayons.red('Faked! >>> write {}'.format(unit_path)))
+            continue
+        os.makedirs(unit_dir, exist_ok=True)
+        with open(unit_path, 'w') as f:
+            f.write(content)
+        click.echo('Wrote {}.'.format(unit_path))
+
+    click.echo('Enable it with: systemctl --user enable --now {}.timer'.format(name))
+
+
+def do_fetch_remotes(scm, jobs=None):
+    """Fetches from every remote concurrently, reporting each one as it is done.
+
+    Failures are listed without stopping the other fetches; only a failure
+    of the remote legit syncs with aborts.
+    """
+    from .scm import abort
+
+    remote_names = scm.get_remote_names()
+    click.echo('Fetching from {}.'.format(
+        ', '.join(str(crayons.yellow(name)) for name in remote_names)))
+
+    def report(result):
+        status = crayons.green('ok') if result.ok else crayons.red('failed')
+        click.echo('  {} {} ({:.1f}s)'.format(
+            crayons.yellow(result.remote), status, result.duration))
+        if result.output.strip() and (scm.verbose or not result.ok):
+            click.echo(black('\n'.join(
+                '    ' + line for line in result.output.strip().splitlines())))
+
+    results = scm.fetch_remotes(remote_names, jobs=jobs, callback=report)
+
+    for result in results:
+        if not result.ok and result.remote == scm.remote.name:
+            abort('Fetching from {} failed.'.format(result.remote), log=result.output,
+                  type='fetch')
+
+
+def do_sync_all(scm, all_remotes=False, jobs=None):
+    """Syncs every published branch with a single fetch and a single push.
+
+    Branches other than the current one are only fast-forwarded; branches
+    that would need a real merge or rebase, or are checked out in another
+    worktree, are reported instead.
+    """
+    current = scm.get_current_branch_name()
+    # Moving the branch of another worktree would leave its files behind.
+    checked_out = {worktree.branch for worktree in scm.get_worktrees()} - {current}
+
+    if all_remotes:
+        do_fetch_remotes(scm, jobs)
+    else:
+        status_log(scm.fetch, 'Fetching from {}.'.format(crayons.yellow(scm.remote.name)))
+
+    current_state = None
+    fast_forward = []
+    to_push = []
+    diverged = []
+    in_worktrees = []
+    for state in scm.get_branch_states():
+        if state.name == current:
+            current_state = state
+        elif state.ahead and state.behind:
+            diverged.append(state.name)
+        elif state.behind and state.name in checked_out:
+            in_worktrees.append(state.name)
+        elif state.behind:
+            fast_forward.append(state)
+        elif state.ahead:
+            to_push.append(state.name)
+
+    if current_state is not None and current_state.behind:
+        scm.stash_log(sync=True)
+        status_log(scm.smart_merge, 'Pulling commits into {}.'.format(crayons.yellow(current)),
+                   '{}/{}'.format(scm.remote.name, current), scm.smart_merge_enabled())
+        scm.unstash_log(sync=True)
+    if current_state is not None and current_state.ahead:
+        to_push.insert(0, current)
+
+    if fast_forward:
+        status_log(scm.fast_forward_branches, 'Fast-forwarding {}.'.format(
+            ', '.join(str(crayons.yellow(state.name)) for state in fast_forward)), fast_forward)
+    if to_push:
+        status_log(scm.push_branches, 'Pushing {} to the server.'.format(
+            ', '.join(str(crayons.yellow(name)) for name in to_push)), to_push)
+    if diverged:
+        click.echo('{} (they need a merge or rebase, sync them one at a time): {}'.format(
+            crayons.red('Not synced'),
+            ', '.join(str(crayons.yellow(name)) for name in diverged)))
+    if in_worktrees:
+        click.echo('{} (they are checked out in another worktree, sync them there): {}'.format(
+            crayons.red('Not synced'),
+            ', '.join(str(crayons.yellow(name)) for name in in_worktrees)))
+
+    if not (fast_forward or to_push or diverged or in_worktrees or
+            (current_state is not None and current_state.behind)):
+        click.echo('All published branches are up to date.')
+
+
+def do_sync_workspace(scm, manifest, recurse_submodules, jobs, verbose, fake, sync_all=False,
+                      all_remotes=None):
+    """Syncs several repositories concurrently, grouping the output per repository."""
+    from .workspace import read_manifest, run_workspace
+
+    paths = []
+    if manifest:
+        paths.extend(read_manifest(manifest))
+    if recurse_submodules:
+        scm.repo_check()
+        paths.append(scm.repo.working_tree_dir)
+        paths.extend(scm.get_submodule_paths())
+    # Drop duplicates, keeping the first occurrence.
+    paths = list(dict.fromkeys(paths))
+
+    args = ['sync']
+    if sync_all:
+        args.append('--all')
+    if all_remotes is not None:
+        args.append('--all-remotes' if all_remotes else '--no-all-remotes')
+    if verbose:
+        args.append('--verbose')
+    if fake:
+        args.append('--fake')
+
+    def report(result):
+        status = crayons.green('ok') if result.returncode == 0 else crayons.red('failed')
+        click.echo('{} {} ({:.1f}s)'.format(
+            crayons.yellow(result.path, bold=True), status, result.duration))
+        if result.output.strip():
+            click.echo(result.output.rstrip())
+        click.echo('')
+
+    click.echo('Syncing {} repositories.\n'.format(len(paths)))
+    results = run_workspace(paths, args, jobs=jobs, callback=report)
+
+    failed = [result for result in results if result.returncode != 0]
+    click.echo('{} succeeded, {} failed.'.format(
+        crayons.green(len(results) - len(failed)), crayons.red(len(failed))))
+    for result in failed:
+        click.echo('  {}'.format(crayons.red(result.path)))
+    if failed:
+        raise click.exceptions.Exit(1)
 
 
 def do_install(ctx, verbose, fake):
     """Installs legit git aliases."""
     click.echo('The following git aliases will be installed:\n')
     aliases = cli.list_commands(ctx)
+    # git never runs an alias named like its own "git daemon".
+    aliases.remove('daemon')
     if git_version() >= (2, 23, 0):
         click.echo(
             'As git 2.23.0 introduces a new command "git switch", alias "switch"'
@@ -306,8 +761,9 @@ def do_uninstall(ctx, verbose, fake):
 
 def do_edit_settings(fake):
     """Opens legit settings in editor."""
+    from clint.textui import columns
 
-    path = resources.user.open('config.ini').name
+    path = user_config_path() if fake else write_default_settings()
 
     click.echo('Legit Settings:\n')
 
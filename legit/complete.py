@@ -0,0 +1,420 @@
+"""
+legit.complete
+~~~~~~~~~~~~~~
+
+This module answers the shell completion scripts, ``legit __complete``.
+
+A shell runs a fresh legit process for every press of Tab, so this module
+stays clear of click and GitPython. The branch names are served from
+``.git/legit/completion.txt``, which is checked with a handful of stats:
+that of ``packed-refs``, ``config`` and every directory the names were read
+from. Only when one of them changed are the names listed again, straight
+from the ref files, by the same rules ``RefIndex`` reads them.
+
+When no name starts with the input, the names are ranked by a
+``BranchIndex``, which is stored in ``.git/legit/completion-index.txt``
+the first time it is needed for a list of names.
+
+Published branches are taken from the cached answer of ``git ls-remote``
+instead (see ``SCMRepo.get_live_heads``) as long as it is fresh.
+"""
+
+import os
+import sys
+import time
+from bisect import bisect_left
+
+from .refindex import (
+    RACY_WINDOW, read_loose_refs, read_packed_refs, stable_mtime, stat_signature,
+    walk_ref_directories)
+from .state import LS_REMOTE_TTL, live_heads_name, read_state, state_path
+
+CACHE_VERSION = 3
+
+# Branches a command completes, by the kind of branch it accepts.
+COMMAND_BRANCHES = {
+    'switch': 'all',
+    'sync': 'all',
+    'branches': 'all',
+    'publish': 'unpublished',
+    'unpublish': 'published',
+    'prune': 'all',
+}
+
+# Flags of a cached name: local only, published only or both.
+LOCAL, PUBLISHED, BOTH = 'l', 'p', 'b'
+
+KIND_FLAGS = {
+    'all': (LOCAL, PUBLISHED, BOTH),
+    'unpublished': (LOCAL,),
+    'published': (PUBLISHED, BOTH),
+}
+
+# Signature of a directory changed too recently to be trusted.
+RACY = 'racy'
+
+# At most this many fuzzy matches are offered when no name has the prefix.
+FUZZY_LIMIT = 20
+
+
+def find_git_dirs(path):
+    """Returns ``(git_dir, common_dir)`` of the repository at ``path``, or None.
+
+    This is the part of git's repository discovery completion needs:
+    ``$GIT_DIR``, ``.git`` directories, ``.git`` files of worktrees and
+    submodules, and the ``commondir`` of linked worktrees.
+    """
+    git_dir = os.environ.get('GIT_DIR')
+    if git_dir:
+        git_dir = os.path.abspath(git_dir)
+    else:
+        path = os.path.abspath(path)
+        while True:
+            candidate = os.path.join(path, '.git')
+            if os.path.isdir(candidate):
+                git_dir = candidate
+                break
+            if os.path.isfile(candidate):
+                try:
+                    with open(candidate) as f:
+                        content = f.read().strip()
+                except OSError:
+                    return None
+                if not content.startswith('gitdir:'):
+                    return None
+                git_dir = os.path.join(path, content[len('gitdir:'):].strip())
+                break
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    common_dir = git_dir
+    try:
+        with open(os.path.join(git_dir, 'commondir')) as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        pass
+    return git_dir, common_dir
+
+
+def read_remote_settings(git, git_dir):
+    """Returns ``(remote, url, ls-remote TTL)`` of the remote legit works with.
+
+    The remote is resolved like ``SCMRepo.get_remote``, but never asked
+    for: a missing ``legit.remote`` falls back to the first remote.
+    """
+    import subprocess
+
+    from .config import GitConfig
+
+    try:
+        output = subprocess.run(
+            [git, '--git-dir', git_dir, 'config', '--list', '-z'], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    except OSError:
+        return None, None, 0
+    config = GitConfig.parse(output, with_scope=False)
+    remote_names = config.subsections('remote')
+    remote_name = config.get('legit.remote')
+    if remote_name not in remote_names:
+        remote_name = remote_names[0] if remote_names else None
+    try:
+        ttl = config.get_int('legit.lsRemoteTTL', LS_REMOTE_TTL)
+    except ValueError:
+        ttl = LS_REMOTE_TTL
+    url = config.get('remote.{}.url'.format(remote_name)) if remote_name else None
+    return remote_name, url, ttl
+
+
+def stat_text(path):
+    """Returns the stat signature of a file the way the cache stores it."""
+    signature = stat_signature(path)
+    return '-' if signature is None else '{} {} {}'.format(*signature)
+
+
+def mtime_text(path):
+    """Returns the mtime of a directory the way the cache stores it."""
+    try:
+        return str(os.stat(path).st_mtime_ns)
+    except OSError:
+        return '-'
+
+
+def list_ref_names(common_dir, prefix, directories):
+    """Returns the names of the loose refs below ``prefix``.
+
+    The mtime of every directory read is added to ``directories``, as
+    ``RefIndex`` stores it: a racy one is stored as one which never matches,
+    so it is read again next time.
+    """
+    names = []
+    racy_after = int(time.time() * 1e9) - RACY_WINDOW
+    top = os.path.join(common_dir, *prefix.rstrip('/').split('/'))
+    # A missing directory is noticed when it is created.
+    directories[top] = '-'
+    for directory, ref_dir, mtime in walk_ref_directories(common_dir, prefix):
+        mtime = stable_mtime(mtime, racy_after)
+        directories[directory] = RACY if mtime is None else str(mtime)
+        names.extend(refname[len(prefix):] for refname in read_loose_refs(directory, ref_dir))
+    return names
+
+
+class CompletionCache:
+    """The sorted branch names of a repository, flagged local and/or published.
+
+    The cache file is plain text, as JSON would take longer to load::
+
+        <version> TAB <number of files> TAB <number of directories> TAB <remote> TAB <url>
+            TAB <ls-remote TTL>
+        <signature> TAB <path>      (one line per file)
+        <mtime> TAB <path>          (one line per directory)
+        <flags>                     (one character per name)
+        <name>                      (one line per name)
+    """
+
+    def __init__(self, git_dir, common_dir):
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self.path = os.path.join(common_dir, 'legit', 'completion.txt')
+        self.index_path = os.path.join(common_dir, 'legit', 'completion-index.txt')
+        self.remote = None
+        self.url = None
+        self.ttl = 0
+        self.signatures = {}
+        self.directories = {}
+        self.names = []
+        self.flags = ''
+        # Identifies the list of names, or None if it wasn't stored.
+        self.stamp = None
+
+    def load(self, git='git'):
+        """Loads the cached names, re-listing them if the refs changed."""
+        if (self._read() and
+                all(stat_text(path) == signature
+                    for path, signature in self.signatures.items()) and
+                all(mtime_text(path) == mtime for path, mtime in self.directories.items())):
+            return self
+
+        config = os.path.join(self.common_dir, 'config')
+        if self.signatures.get(config) != stat_text(config):
+            self.remote, self.url, self.ttl = read_remote_settings(git, self.git_dir)
+        self._rebuild()
+        return self
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                # The file read, even if it is replaced meanwhile.
+                stamp = '{} {} {}'.format(*stat_signature_of(f))
+                lines = f.read().split('\n')
+            version, files, directories, remote, url, ttl = lines[0].split('\t')
+            files, directories, ttl = int(files), int(directories), int(ttl)
+        except (OSError, ValueError):
+            return False
+        if version != str(CACHE_VERSION):
+            return False
+
+        self.remote = remote or None
+        self.url = url or None
+        self.ttl = ttl
+        count = files + directories
+        entries = [line.split('\t', 1)[::-1] for line in lines[1:count + 1]]
+        self.signatures = dict(entries[:files])
+        self.directories = dict(entries[files:])
+        self.flags = lines[count + 1]
+        self.names = lines[count + 2:]
+        self.stamp = stamp
+        return len(self.names) == len(self.flags)
+
+    def _rebuild(self):
+        from .settings import legit_settings
+
+        prefixes = ['refs/heads/']
+        if self.remote:
+            prefixes.append('refs/remotes/{}/'.format(self.remote))
+
+        packed_refs = os.path.join(self.common_dir, 'packed-refs')
+        config = os.path.join(self.common_dir, 'config')
+        self.signatures = {packed_refs: stat_text(packed_refs), config: stat_text(config)}
+        self.directories = {}
+        packed = list(read_packed_refs(packed_refs, prefixes))
+
+        flags = {}
+        for prefix, flag in zip(prefixes, (LOCAL, PUBLISHED)):
+            names = list_ref_names(self.common_dir, prefix, self.directories)
+            names.extend(refname[len(prefix):] for refname in packed
+                         if refname.startswith(prefix))
+            for name in names:
+                flags[name] = BOTH if flags.get(name, flag) != flag else flag
+
+        for name in legit_settings.forbidden_branches:
+            flags.pop(name, None)
+
+        self.names = sorted(flags)
+        self.flags = ''.join(flags[name] for name in self.names)
+
+        lines = ['{}\t{}\t{}\t{}\t{}\t{}'.format(
+            CACHE_VERSION, len(self.signatures), len(self.directories), self.remote or '',
+            self.url or '', self.ttl)]
+        lines.extend('{}\t{}'.format(signature, path)
+                     for path, signature in self.signatures.items())
+        lines.extend('{}\t{}'.format(mtime, path) for path, mtime in self.directories.items())
+        lines.append(self.flags)
+        lines.extend(self.names)
+        self.stamp = None
+        try:
+            with atomic_write(self.path) as f:
+                f.write('\n'.join(lines))
+                f.flush()
+                self.stamp = '{} {} {}'.format(*stat_signature_of(f))
+        except OSError:
+            self.stamp = None
+
+    def read_live_heads(self):
+        """Returns the branches of the cached ``git ls-remote`` answer if it is fresh.
+
+        The answer is trusted as long as ``SCMRepo.get_live_heads`` trusts it.
+        """
+        if not self.remote or self.ttl <= 0:
+            return None
+        path = state_path(self.common_dir, live_heads_name(self.remote))
+        if not os.path.exists(path):
+            return None
+        cached = read_state(path)
+        if (isinstance(cached, dict) and cached.get('url') == self.url and
+                0 <= time.time() - cached.get('time', 0) < self.ttl):
+            return cached['heads']
+        return None
+
+    def apply_live_heads(self):
+        """Flags the branches the remote has right now as published, if known."""
+        path = state_path(self.common_dir, live_heads_name(self.remote or ''))
+        signature = stat_text(path)
+        heads = self.read_live_heads()
+        if heads is None:
+            return self
+        if self.stamp is not None:
+            self.stamp += ' ' + signature
+
+        from .settings import legit_settings
+
+        flags = {name: LOCAL for name, flag in zip(self.names, self.flags) if flag != PUBLISHED}
+        for name in heads:
+            flags[name] = BOTH if name in flags else PUBLISHED
+        for name in legit_settings.forbidden_branches:
+            flags.pop(name, None)
+
+        self.names = sorted(flags)
+        self.flags = ''.join(flags[name] for name in self.names)
+        return self
+
+    def candidates(self, kind, incomplete):
+        """Returns the names of ``kind`` (see ``KIND_FLAGS``) to offer for ``incomplete``.
+
+        Names starting with ``incomplete`` are offered as they are. If there
+        are none, the names are ranked like ``SCMRepo.suggest_branches``
+        ranks them, and the best ones are offered instead.
+        """
+        accepted = KIND_FLAGS[kind]
+        start = bisect_left(self.names, incomplete)
+        matches = []
+        for i in range(start, len(self.names)):
+            name = self.names[i]
+            if not name.startswith(incomplete):
+                break
+            if self.flags[i] in accepted:
+                matches.append(name)
+        if matches or not incomplete:
+            return matches
+
+        def is_accepted(name):
+            return self.flags[bisect_left(self.names, name)] in accepted
+
+        ranked = self.branch_index().rank(
+            incomplete, limit=FUZZY_LIMIT,
+            accept=is_accepted if len(accepted) < len(KIND_FLAGS['all']) else None)
+        return [name for _, name in ranked]
+
+    def branch_index(self):
+        """Returns the ``BranchIndex`` of the names, stored for the next Tab.
+
+        The stored index is used as long as it was built from the same list
+        of names, which is identified by the stat signature of the cache file
+        (and of the ``ls-remote`` answer applied to it).
+        """
+        from .fuzzy import BranchIndex
+
+        header = '{}\t{}\n'.format(CACHE_VERSION, self.stamp).encode('utf-8')
+        if self.stamp is not None:
+            try:
+                with open(self.index_path, 'rb') as f:
+                    if f.readline() == header:
+                        import mmap
+
+                        # Mapped, only the pages a lookup touches are read.
+                        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        return BranchIndex.loads(data, start=len(header))
+            except (OSError, ValueError):
+                pass
+
+        index = BranchIndex(self.names)
+        if self.stamp is not None:
+            try:
+                with atomic_write(self.index_path, 'wb') as f:
+                    f.write(header + index.dumps())
+            except OSError:
+                pass
+        return index
+
+
+def stat_signature_of(f):
+    """Returns the stat signature of the open file ``f``, as ``stat_signature`` does."""
+    stat = os.fstat(f.fileno())
+    return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+
+class atomic_write:
+    """Writes a file through a temporary file, which replaces it on success."""
+
+    def __init__(self, path, mode='w'):
+        self.path = path
+        self.mode = mode
+        self.tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.tmp_path, self.mode)
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+        return False
+
+
+def complete(args, cwd=None):
+    """Returns the completions for ``legit __complete <command> [<incomplete>]``."""
+    if not args or args[0] not in COMMAND_BRANCHES:
+        return []
+    incomplete = args[1] if len(args) > 1 else ''
+
+    dirs = find_git_dirs(cwd or os.getcwd())
+    if dirs is None:
+        return []
+    cache = CompletionCache(*dirs).load(os.environ.get('GIT_PYTHON_GIT_EXECUTABLE', 'git'))
+    cache.apply_live_heads()
+    return cache.candidates(COMMAND_BRANCHES[args[0]], incomplete)
+
+
+def main(args):
+    candidates = complete(args)
+    if candidates:
+        sys.stdout.write('\n'.join(candidates) + '\n')
+    return 0
@@ -0,0 +1,278 @@
+"""
+legit.completion
+~~~~~~~~~~~~~~~~
+
+This module generates the shell completion scripts from the click commands.
+
+The scripts complete commands and options by themselves and ask
+``legit __complete`` (see ``legit.complete``) for branch names. Regenerate
+the scripts in ``extra/`` after changing the command line interface::
+
+    python -m legit.completion bash > extra/bash-completion/legit
+    python -m legit.completion zsh > extra/zsh-completion/_legit
+"""
+
+import sys
+from collections import namedtuple
+
+from .complete import COMMAND_BRANCHES
+
+CompletionOption = namedtuple('CompletionOption', ['names', 'help', 'value'])
+CompletionCommand = namedtuple('CompletionCommand', ['name', 'aliases', 'help', 'options'])
+
+
+def command_tree(group):
+    """Returns the commands and options of the click ``group`` as
+    ``(group options, [CompletionCommand])``.
+
+    The ``value`` of an option is None for flags, ``'file'`` for paths and
+    ``''`` for other values.
+    """
+    import click
+
+    def options(command, ctx):
+        result = []
+        for param in command.get_params(ctx):
+            if not isinstance(param, click.Option) or param.hidden:
+                continue
+            if param.is_flag or param.count:
+                value = None
+            elif isinstance(param.type, click.Path):
+                value = 'file'
+            else:
+                value = ''
+            result.append(CompletionOption(param.opts, param.help or '', value))
+            for name in param.secondary_opts:
+                result.append(CompletionOption([name], param.help or '', value))
+        return result
+
+    root = click.Context(group, info_name='legit', **group.context_settings)
+    aliases = getattr(group, 'command_aliases', {})
+    commands = []
+    for name in group.list_commands(root):
+        command = group.get_command(root, name)
+        if command is None or command.hidden:
+            continue
+        ctx = click.Context(command, info_name=name, parent=root)
+        commands.append(CompletionCommand(
+            name, sorted(alias for alias, target in aliases.items() if target == name),
+            command.get_short_help_str(limit=200), options(command, ctx)))
+    return options(group, root), commands
+
+
+BASH_SCRIPT = """\
+# bash completion for legit.
+#
+# Generated from the command line interface by `python -m legit.completion bash`,
+# don't edit. Branch names are completed by `legit __complete`.
+
+__legit_options()
+{{
+    COMPREPLY=( $(compgen -W "$1" -- "${{cur}}") )
+}}
+
+__legit_branches()
+{{
+    local IFS=$'\\n'
+    COMPREPLY=( $(legit __complete "$1" "${{cur}}" 2>/dev/null) )
+}}
+
+_legit()
+{{
+    local cur="${{COMP_WORDS[COMP_CWORD]}}"
+    local prev="${{COMP_WORDS[COMP_CWORD-1]}}"
+    local command="" i
+    for (( i=1; i < COMP_CWORD; i++ )); do
+        case "${{COMP_WORDS[i]}}" in
+{value_options}\
+            -*) ;;
+            *) command="${{COMP_WORDS[i]}}"; break ;;
+        esac
+    done
+
+    case "${{prev}}" in
+{value_arguments}\
+    esac
+
+    case "${{command}}" in
+{commands}\
+    esac
+}}
+
+complete -F _legit legit
+{git_aliases}"""
+
+BASH_COMMAND = """\
+        {patterns})
+            if [[ "${{cur}}" == -* ]]; then
+                __legit_options "{options}"
+            else
+                {arguments}
+            fi
+            ;;
+"""
+
+BASH_GIT_ALIAS = """
+_git_{name}()
+{{
+    [[ "${{cur}}" == -* ]] || __legit_branches {name}
+}}
+"""
+
+
+def bash_script(group):
+    """Returns the bash completion script of the click ``group``."""
+    group_options, commands = command_tree(group)
+
+    def names(options):
+        return ' '.join(name for option in options for name in option.names)
+
+    value_names = set()
+    file_names = set()
+    for option in group_options + [o for command in commands for o in command.options]:
+        if option.value is not None:
+            (file_names if option.value == 'file' else value_names).update(option.names)
+
+    arms = [BASH_COMMAND.format(
+        patterns='""', options=names(group_options),
+        arguments='__legit_options "{}"'.format(
+            ' '.join(command.name for command in commands)))]
+    for command in commands:
+        if command.name in COMMAND_BRANCHES:
+            arguments = '__legit_branches {}'.format(command.name)
+        else:
+            arguments = 'COMPREPLY=()'
+        arms.append(BASH_COMMAND.format(
+            patterns='|'.join([command.name] + command.aliases),
+            options=names(command.options), arguments=arguments))
+
+    # `git switch` is completed by git itself, legit doesn't install it as alias.
+    git_aliases = ''.join(BASH_GIT_ALIAS.format(name=name)
+                          for name in COMMAND_BRANCHES if name not in ('switch', 'branches'))
+
+    value_arguments = ''
+    if file_names:
+        value_arguments += '        {}) COMPREPLY=( $(compgen -f -- "${{cur}}") ); return ;;\n'.format(
+            '|'.join(sorted(file_names)))
+    if value_names:
+        value_arguments += '        {}) COMPREPLY=(); return ;;\n'.format(
+            '|'.join(sorted(value_names)))
+
+    return BASH_SCRIPT.format(
+        value_options='            {}) (( i++ )) ;;\n'.format(
+            '|'.join(sorted(value_names | file_names))) if value_arguments else '',
+        value_arguments=value_arguments, commands=''.join(arms), git_aliases=git_aliases)
+
+
+ZSH_SCRIPT = """\
+#compdef legit
+#
+# zsh completion for legit.
+#
+# Generated from the command line interface by `python -m legit.completion zsh`,
+# don't edit. Branch names are completed by `legit __complete`.
+
+__legit_branches()
+{{
+    local -a branches
+    branches=(${{(f)"$(_call_program branches legit __complete $1 ${{(q)PREFIX}} 2>/dev/null)"}})
+    # Fuzzy matches don't start with the typed prefix, -U keeps them.
+    compadd -U -- $branches
+}}
+
+_legit()
+{{
+    local curcontext="$curcontext" state line
+    typeset -A opt_args
+
+    local -a commands
+    commands=(
+{descriptions}\
+    )
+
+    _arguments -C \\
+{group_options}\
+        '1:command:->command' \\
+        '*::argument:->argument'
+
+    case $state in
+        (command)
+            _describe -t commands 'legit command' commands
+            ;;
+        (argument)
+            case $line[1] in
+{commands}\
+            esac
+            ;;
+    esac
+}}
+
+_legit "$@"
+"""
+
+ZSH_COMMAND = """\
+                ({patterns})
+                    _arguments \\
+{options}\
+                        {argument}
+                    ;;
+"""
+
+
+def zsh_quote(text):
+    return text.replace("'", "'\\''")
+
+
+def zsh_option(option, indent):
+    help = zsh_quote(option.help).replace('[', '\\[').replace(']', '\\]')
+    if option.value is None:
+        action = ''
+    else:
+        action = ':{}:{}'.format(
+            option.names[-1].lstrip('-'), '_files' if option.value == 'file' else ' ')
+    if len(option.names) == 1:
+        spec = "'{}[{}]{}'".format(option.names[0], help, action)
+    else:
+        spec = "'({})'{{{}}}'[{}]{}'".format(
+            ' '.join(option.names), ','.join(option.names), help, action)
+    return '{}{} \\\n'.format(' ' * indent, spec)
+
+
+def zsh_script(group):
+    """Returns the zsh completion script of the click ``group``."""
+    group_options, commands = command_tree(group)
+
+    descriptions = ''.join("        '{}:{}'\n".format(
+        command.name, zsh_quote(command.help).replace(':', '\\:')) for command in commands)
+
+    arms = []
+    for command in commands:
+        if command.name in COMMAND_BRANCHES:
+            argument = "'1:branch:{{__legit_branches {}}}'".format(command.name)
+        else:
+            argument = ''
+        options = ''.join(zsh_option(option, 24) for option in command.options)
+        if not argument:
+            options = options[:-len(' \\\n')] + '\n'
+        arms.append(ZSH_COMMAND.format(
+            patterns='|'.join([command.name] + command.aliases), options=options,
+            argument=argument).replace('                        \n', ''))
+
+    return ZSH_SCRIPT.format(
+        descriptions=descriptions,
+        group_options=''.join(zsh_option(option, 8) for option in group_options),
+        commands=''.join(arms))
+
+
+SCRIPTS = {
+    'bash': bash_script,
+    'zsh': zsh_script,
+}
+
+
+if __name__ == '__main__':
+    from .cli import cli
+
+    if sys.argv[1:] not in [[shell] for shell in SCRIPTS]:
+        sys.exit('usage: python -m legit.completion {}'.format('|'.join(SCRIPTS)))
+    sys.stdout.write(SCRIPTS[sys.argv[1]](cli))
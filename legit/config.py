@@ -0,0 +1,152 @@
+"""
+legit.config
+~~~~~~~~~~~~
+
+This module provides a read-only snapshot of the effective git config.
+"""
+
+from collections.abc import Mapping
+
+GIT_BOOLEAN_STATES = {
+    'true': True, 'yes': True, 'on': True,
+    'false': False, 'no': False, 'off': False, '': False,
+}
+
+INTEGER_SUFFIXES = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+class GitConfig(Mapping):
+    """All effective git config entries, read with a single ``git config`` call.
+
+    Keys are normalized the way git prints them: section and variable names
+    lowercased, subsection names kept as is (``branch.Feature.remote``).
+    Every key maps to the tuple of its values, in the order git reads them,
+    so the last one wins for single-valued lookups. A value is None for keys
+    set without ``=`` (which git treats as true).
+    """
+
+    def __init__(self, entries=()):
+        values = {}
+        scopes = {}
+        for scope, key, value in entries:
+            key = normalize_key(key)
+            values.setdefault(key, []).append(value)
+            scopes[key] = scope
+        self._values = {key: tuple(value) for key, value in values.items()}
+        self._scopes = scopes
+
+    @classmethod
+    def parse(cls, output, with_scope=True):
+        """Builds a snapshot from the output of ``git config --list -z``.
+
+        ``with_scope`` tells whether the output was produced with
+        ``--show-scope``, in which case every entry is preceded by its scope.
+        """
+        fields = output.split('\0')
+        if fields and fields[-1] == '':
+            fields.pop()
+
+        if with_scope:
+            pairs = zip(fields[::2], fields[1::2])
+        else:
+            pairs = ((None, field) for field in fields)
+
+        entries = []
+        for scope, entry in pairs:
+            key, newline, value = entry.partition('\n')
+            entries.append((scope, key, value if newline else None))
+        return cls(entries)
+
+    def __getitem__(self, key):
+        return self._values[normalize_key(key)]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return normalize_key(key) in self._values
+
+    def get(self, key, default=None):
+        """Returns the last value of ``key``, or ``default`` if it is unset."""
+        values = self._values.get(normalize_key(key))
+        if not values:
+            return default
+        return values[-1]
+
+    def get_all(self, key):
+        """Returns all values of the multi-valued ``key``."""
+        return list(self._values.get(normalize_key(key), ()))
+
+    def get_bool(self, key, default=False):
+        """Returns ``key`` as a bool, the way ``git config --type=bool`` would.
+
+        Raises ValueError if the value isn't a boolean.
+        """
+        key = normalize_key(key)
+        if key not in self._values:
+            return default
+        return parse_bool(self._values[key][-1])
+
+    def get_int(self, key, default=0):
+        """Returns ``key`` as an int, honoring git's ``k``, ``m`` and ``g`` suffixes.
+
+        Raises ValueError if the value isn't an integer.
+        """
+        value = self.get(key)
+        if value is None:
+            return default
+        return parse_int(value)
+
+    def scope(self, key):
+        """Returns the scope (``system``, ``global``, ``local``, ...) ``key`` is set in."""
+        return self._scopes.get(normalize_key(key))
+
+    def subsections(self, section):
+        """Returns the subsection names of ``section``, in config order.
+
+        ``subsections('remote')`` lists the names of the configured remotes.
+        """
+        prefix = section.lower() + '.'
+        names = []
+        for key in self._values:
+            if key.startswith(prefix):
+                name, dot, _ = key[len(prefix):].rpartition('.')
+                if dot and name not in names:
+                    names.append(name)
+        return names
+
+
+def normalize_key(key):
+    """Lowercases the section and variable names of ``key``."""
+    section, _, rest = key.partition('.')
+    subsection, dot, name = rest.rpartition('.')
+    if not dot:
+        return key.lower()
+    return '{}.{}.{}'.format(section.lower(), subsection, name.lower())
+
+
+def parse_bool(value):
+    if value is None:
+        return True
+    try:
+        return GIT_BOOLEAN_STATES[value.strip().lower()]
+    except KeyError:
+        pass
+    try:
+        return parse_int(value) != 0
+    except ValueError:
+        raise ValueError('bad boolean config value {!r}'.format(value))
+
+
+def parse_int(value):
+    value = value.strip()
+    factor = INTEGER_SUFFIXES.get(value[-1:].lower())
+    if factor:
+        value = value[:-1]
+    try:
+        return int(value) * (factor or 1)
+    except ValueError:
+        raise ValueError('bad numeric config value {!r}'.format(value))
@@ -13,9 +13,6 @@ if not sys.warnoptions:
         import warnings
         warnings.simplefilter("ignore", category=SyntaxWarning)
 
-from . import bootstrap
-del bootstrap
-
 __version__ = '1.2.1'
 __author__ = 'Kenneth Reitz'
 __license__ = 'BSD'
@@ -0,0 +1,472 @@
+"""
+legit.daemon
+~~~~~~~~~~~~
+
+This module runs legit commands in a resident process, ``legit daemon``.
+
+Every legit command otherwise starts a fresh interpreter, imports click,
+GitPython and clint, and opens the repository from scratch. The daemon
+keeps all of that loaded, together with an SCMRepo per repository, and
+forks a child for every command. The ``legit`` entry point hands its
+arguments, working directory, environment and standard streams over a
+Unix socket, so the command reads from and writes to the terminal of the
+client directly. Without a daemon listening, commands run in-process.
+
+The client side only needs ``os`` and ``socket``; everything else is
+imported by the daemon.
+"""
+
+import os
+import sys
+
+from .core import __version__
+
+# Seconds without any command after which the daemon exits.
+DEFAULT_IDLE_TIMEOUT = 3600
+
+# The SCMRepo the daemon warmed up for the command a child runs, see
+# ``cli.pass_scm``.
+warm_repository = None
+
+RUN, STATUS, STOP = 'run', 'status', 'stop'
+
+# Environment variables of a client which select a different repository
+# (or backend) for the same directory.
+REPOSITORY_ENVIRONMENT = ('GIT_', 'LEGIT_')
+
+# Backends which must not outlive a command.
+UNPOOLED_ENVIRONMENT = ('LEGIT_RECORD', 'LEGIT_REPLAY')
+
+
+class DaemonRunning(Exception):
+    """Another daemon is listening on the socket already."""
+
+
+def socket_path(environ=os.environ):
+    """Returns the path of the per-user socket of the daemon."""
+    runtime_dir = environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'legit', 'daemon.sock')
+    return os.path.join(environ.get('TMPDIR') or '/tmp',
+                        'legit-{}'.format(os.getuid()), 'daemon.sock')
+
+
+def is_private_directory(path):
+    """Returns True if only the current user can access the directory ``path``."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o077
+
+
+def encode_request(kind, cwd='', argv=(), environ=None):
+    fields = [kind, __version__, cwd, str(len(argv))] + list(argv)
+    fields.extend('{}={}'.format(name, value) for name, value in (environ or {}).items())
+    return '\0'.join(fields).encode('utf-8', 'surrogateescape')
+
+
+def decode_request(data):
+    """Returns ``(kind, version, cwd, argv, environ)`` of an encoded request."""
+    fields = data.decode('utf-8', 'surrogateescape').split('\0')
+    kind, version, cwd, argc = fields[:4]
+    argv = fields[4:4 + int(argc)]
+    environ = dict(field.split('=', 1) for field in fields[4 + int(argc):])
+    return kind, version, cwd, argv, environ
+
+
+def send_request(sock, data, fds=()):
+    """Sends the length of ``data`` together with ``fds``, then ``data`` itself."""
+    import array
+    import socket
+
+    header = '{}\n'.format(len(data)).encode()
+    ancillary = []
+    if fds:
+        ancillary.append((socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds)))
+    sock.sendmsg([header], ancillary)
+    sock.sendall(data)
+
+
+def receive_request(sock):
+    """Returns ``(data, fds)`` of a request sent by ``send_request``."""
+    import array
+    import socket
+
+    fds = array.array('i')
+    chunk, ancillary, _, _ = sock.recvmsg(64, socket.CMSG_SPACE(3 * fds.itemsize))
+    for level, kind, cmsg_data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - len(cmsg_data) % fds.itemsize])
+
+    header, _, data = chunk.partition(b'\n')
+    size = int(header)
+    while len(data) < size:
+        more = sock.recv(size - len(data))
+        if not more:
+            raise ConnectionError('incomplete request')
+        data += more
+    return data, list(fds)
+
+
+def connect(path):
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def request(kind, environ=os.environ):
+    """Sends a ``status`` or ``stop`` request, returns the reply or None."""
+    try:
+        with connect(socket_path(environ)) as sock:
+            send_request(sock, encode_request(kind))
+            return sock.makefile('rb').readline().decode().strip() or None
+    except OSError:
+        return None
+
+
+def run_client(argv, environ=os.environ):
+    """Runs ``legit <argv>`` in the daemon, returns its exit code.
+
+    None is returned if the command has to run in-process: no daemon is
+    listening, it runs another version of legit, or it is disabled with
+    ``LEGIT_DAEMON=0``. Signals the client gets are passed on to the
+    command.
+    """
+    if environ.get('LEGIT_DAEMON') == '0' or not hasattr(os, 'getuid'):
+        return None
+    path = socket_path(environ)
+    # Checked first, so a missing daemon costs a stat instead of importing socket.
+    if not os.path.exists(path) or not is_private_directory(os.path.dirname(path)):
+        return None
+
+    try:
+        sock = connect(path)
+    except OSError:
+        return None
+
+    with sock:
+        try:
+            send_request(sock, encode_request(RUN, os.getcwd(), argv, environ), fds=(0, 1, 2))
+            replies = sock.makefile('rb')
+            started = replies.readline().split()
+        except OSError:
+            return None
+        # Nothing ran yet unless the child reported its start.
+        if len(started) != 2 or started[0] != b'started':
+            return None
+
+        import signal
+
+        pid = int(started[1])
+
+        def forward(signum, frame):
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, forward)
+
+        finished = replies.readline().split()
+        if len(finished) == 2 and finished[0] == b'exit':
+            return int(finished[1])
+        sys.stderr.write('legit: the daemon lost the command.\n')
+        return 1
+
+
+def config_paths(git_dir, common_dir, environ):
+    """Returns the config files git reads for a repository.
+
+    Files pulled in with ``include.path`` are not covered.
+    """
+    home = environ.get('HOME', '')
+    config_home = environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+    return [
+        os.path.join(common_dir, 'config'),
+        os.path.join(git_dir, 'config.worktree'),
+        environ.get('GIT_CONFIG_GLOBAL') or os.path.join(home, '.gitconfig'),
+        os.path.join(config_home, 'git', 'config'),
+        environ.get('GIT_CONFIG_SYSTEM') or '/etc/gitconfig',
+    ]
+
+
+class Daemon:
+    """Serves the commands sent to ``path``, one forked child per command.
+
+    An SCMRepo is kept per repository (and per set of ``GIT_*`` and
+    ``LEGIT_*`` variables of the client). Before each command it is brought
+    up to date the way ``RefIndex`` stays up to date, by stat signatures: a
+    change of any config file re-reads the config and remote, and the ref
+    index re-reads only the refs which changed.
+    """
+
+    def __init__(self, path, idle_timeout=DEFAULT_IDLE_TIMEOUT, log=None):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.log = log or (lambda message: None)
+        self.repositories = {}
+        self.children = set()
+        self.sock = None
+        self.running = False
+
+    def bind(self):
+        import socket
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if not is_private_directory(directory):
+            raise OSError('{} is accessible by other users'.format(directory))
+
+        if os.path.exists(self.path):
+            try:
+                connect(self.path).close()
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise DaemonRunning(self.path)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(16)
+        self.sock.settimeout(1)
+
+    def serve(self):
+        """Serves until stopped or idle for ``idle_timeout`` seconds."""
+        import signal
+        import time
+
+        if self.sock is None:
+            self.bind()
+        # Clean up on SIGTERM as on Ctrl-C.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.running = True
+        last_activity = time.monotonic()
+        try:
+            while self.running:
+                try:
+                    conn, _ = self.sock.accept()
+                except OSError:  # timed out
+                    pass
+                else:
+                    conn.settimeout(None)
+                    self.handle(conn)
+                    last_activity = time.monotonic()
+
+                self.reap()
+                if self.children:
+                    last_activity = time.monotonic()
+                elif self.idle_timeout and time.monotonic() - last_activity > self.idle_timeout:
+                    self.log('Idle for {} seconds, exiting.'.format(self.idle_timeout))
+                    break
+        finally:
+            self.sock.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if not pid:
+                return
+            self.children.discard(pid)
+
+    def handle(self, conn):
+        fds = []
+        try:
+            data, fds = receive_request(conn)
+            kind, version, cwd, argv, environ = decode_request(data)
+            if version != __version__:
+                conn.sendall('rejected version {}\n'.format(__version__).encode())
+            elif kind == STATUS:
+                conn.sendall('running pid {} version {}, {} repositories, {} commands\n'.format(
+                    os.getpid(), __version__, len(self.repositories),
+                    len(self.children)).encode())
+            elif kind == STOP:
+                self.running = False
+                conn.sendall(b'stopping\n')
+            elif kind == RUN and len(fds) == 3:
+                self.run(conn, cwd, argv, environ, fds)
+                fds = []
+            else:
+                conn.sendall(b'rejected request\n')
+        except (OSError, ValueError) as e:
+            self.log('Bad request: {}'.format(e))
+        finally:
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+
+    def run(self, conn, cwd, argv, environ, fds):
+        scm = self.warm_up(cwd, environ)
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self.sock.close()
+                conn.sendall('started {}\n'.format(os.getpid()).encode())
+                code = run_command(scm, cwd, argv, environ, fds)
+            except Exception:
+                import traceback
+
+                # As in-process, the traceback goes to the client's stderr,
+                # which run_command moved to fd 2.
+                try:
+                    os.write(2, traceback.format_exc().encode('utf-8', 'backslashreplace'))
+                except OSError:
+                    pass
+            finally:
+                try:
+                    conn.sendall('exit {}\n'.format(code).encode())
+                finally:
+                    os._exit(code)
+
+        for fd in fds:
+            os.close(fd)
+        self.children.add(pid)
+        self.log('{} legit {} in {}'.format(pid, ' '.join(argv), cwd))
+
+    def warm_up(self, cwd, environ):
+        """Returns the up to date SCMRepo for a command in ``cwd``, or None.
+
+        None leaves it to the command to open the repository, as it does
+        in-process; then prompts and errors reach the user.
+        """
+        from .complete import find_git_dirs
+        from .refindex import stat_signature
+
+        if any(name in environ for name in UNPOOLED_ENVIRONMENT):
+            return None
+
+        with client_context(cwd, environ):
+            dirs = find_git_dirs(cwd)
+            if dirs is None:
+                return None
+            key = (dirs[0],) + tuple(sorted(
+                item for item in environ.items() if item[0].startswith(REPOSITORY_ENVIRONMENT)))
+            signature = [stat_signature(path) for path in config_paths(*dirs, environ)]
+
+            scm, old_signature = self.repositories.pop(key, (None, None))
+            try:
+                if scm is None:
+                    from .scm import SCMRepo
+
+                    scm = SCMRepo()
+                elif signature != old_signature:
+                    scm.refresh()
+                if scm.repo is None:
+                    return None
+                scm.revalidate()
+                # Children must not share the persistent git processes of the
+                # daemon: GitPython's cat-file helpers and the backend's.
+                scm.repo.git.clear_cache()
+                scm.backend.close()
+            except (Exception, SystemExit) as e:
+                self.log('Could not open {}: {!r}'.format(dirs[0], e))
+                return None
+
+            self.repositories[key] = (scm, signature)
+            return scm
+
+
+class client_context:
+    """Runs the enclosed code in the directory and environment of a client.
+
+    Prompts read an empty stdin and output is discarded, the daemon has no
+    terminal.
+    """
+
+    def __init__(self, cwd, environ):
+        self.cwd = cwd
+        self.environ = environ
+
+    def __enter__(self):
+        import contextlib
+        import io
+
+        self.saved = (os.getcwd(), dict(os.environ), sys.stdin)
+        os.chdir(self.cwd)
+        os.environ.clear()
+        os.environ.update(self.environ)
+        sys.stdin = io.StringIO()
+        self.redirect = contextlib.redirect_stdout(io.StringIO())
+        self.redirect.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.redirect.__exit__(*exc_info)
+        cwd, environ, sys.stdin = self.saved
+        os.environ.clear()
+        os.environ.update(environ)
+        os.chdir(cwd)
+        return False
+
+
+def run_command(scm, cwd, argv, environ, fds):
+    """Runs ``legit <argv>`` in a forked child of the daemon, returns the exit code."""
+    global warm_repository
+    import io
+    import signal
+
+    import crayons
+    from clint.textui import colored
+
+    from . import bootstrap
+    from .cli import cli
+
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(environ)
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    encoding = sys.stdout.encoding
+    sys.stdin = io.TextIOWrapper(io.open(0, 'rb', closefd=False), encoding=encoding)
+    sys.stdout, sys.stderr = (
+        io.TextIOWrapper(io.open(fd, 'wb', closefd=False), encoding=encoding,
+                         errors='backslashreplace' if fd == 2 else 'strict',
+                         line_buffering=os.isatty(fd), write_through=fd == 2)
+        for fd in (1, 2))
+
+    # The user settings, and so the colors, may differ per client.
+    crayons.DISABLE_COLOR = colored.DISABLE_COLOR = environ.get('TERM') == 'dumb'
+    bootstrap.apply_settings()
+
+    warm_repository = scm
+    try:
+        cli.main(args=argv, prog_name='legit')
+        code = 0
+    except SystemExit as e:
+        code = e.code
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except OSError:
+                pass
+
+    if code is None:
+        return 0
+    if not isinstance(code, int):
+        sys.stderr.write('{}\n'.format(code))
+        sys.stderr.flush()
+        return 1
+    return code
@@ -0,0 +1,306 @@
+"""
+legit.fuzzy
+~~~~~~~~~~~
+
+This module provides ranked fuzzy matching of branch names.
+"""
+
+SEGMENT_SEPARATORS = '/_-.'
+
+# Scores of the match kinds, best first.
+EXACT = 100
+PREFIX = 90
+SEGMENT_PREFIX = 70
+INITIALS = 60
+SUBSEQUENCE = 40
+
+# Matches at least this good may be picked automatically when unambiguous.
+RESOLVE_THRESHOLD = SEGMENT_PREFIX
+
+# At most this many subsequence matches are scored.
+MAX_SUBSEQUENCE_MATCHES = 1000
+
+
+def normalize_separators(lower):
+    """Replaces every segment separator (``/``, ``-``, ``_``, ``.``) by ``/``."""
+    return lower.replace('-', '/').replace('_', '/').replace('.', '/')
+
+
+class SortedPrefixIndex:
+    """Maps keys to values and finds all keys starting with a prefix.
+
+    The pairs are kept sorted in one UTF-8 buffer, a ``\\n<key>\\t<value>``
+    line each, where all keys sharing a prefix are adjacent, so a lookup is a
+    binary search followed by a scan over the matches only. It answers the
+    same queries as a prefix trie but is built with a single sort. As UTF-8
+    keeps the order of the characters, the buffer is searched as it is, also
+    when it is a stored index mapped into memory; keys and values never hold
+    a tab or newline, as branch names can't.
+    """
+
+    def __init__(self, data=b'', start=0, end=None):
+        self.data = data
+        self.start = start
+        self.end = len(data) if end is None else end
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        return cls(''.join(
+            '\n{}\t{}'.format(key, value) for key, value in sorted(pairs)).encode('utf-8'))
+
+    def __bytes__(self):
+        return bytes(self.data[self.start:self.end])
+
+    def __len__(self):
+        return bytes(self).count(b'\n')
+
+    def _first_line_from(self, prefix):
+        """Returns the offset of the first line whose key is not below ``prefix``."""
+        data = self.data
+        # Both ends are at the newline starting a line, or at the end.
+        low, high = self.start, self.end
+        while low < high:
+            start = data.rfind(b'\n', low, (low + high) // 2 + 1)
+            tab = data.find(b'\t', start, self.end)
+            if data[start + 1:tab] < prefix:
+                low = data.find(b'\n', tab, self.end)
+                if low < 0:
+                    low = self.end
+            else:
+                high = start
+        return low
+
+    def starting_with(self, prefix):
+        data = self.data
+        prefix = prefix.encode('utf-8')
+        start = self._first_line_from(prefix)
+        while start < self.end:
+            tab = data.find(b'\t', start, self.end)
+            end = data.find(b'\n', tab, self.end)
+            if end < 0:
+                end = self.end
+            key = data[start + 1:tab]
+            if not key.startswith(prefix):
+                return
+            yield key.decode('utf-8'), data[tab + 1:end].decode('utf-8')
+            start = end
+
+
+class BranchIndex:
+    """Ranks branch names against a (partial) name typed by the user.
+
+    Candidates are looked up by full-name prefix, then by a prefix starting
+    at any ``/``, ``-``, ``_`` or ``.`` separated segment, then by segment
+    initials (``fal`` for ``feature/add-login``). Only if none of these
+    match, the names are scanned for a subsequence match.
+
+    ``dumps`` and ``loads`` store the index as text, so a short-lived
+    process such as shell completion can rank without building it again.
+    """
+
+    def __init__(self, names=()):
+        # Most names are lowercase already, those are stored only once.
+        self.by_lower_name = SortedPrefixIndex.from_pairs(
+            (lower, '' if lower == name else name)
+            for lower, name in ((name.lower(), name) for name in set(names)))
+        self._by_segment = None
+        self._by_initials = None
+
+    @classmethod
+    def loads(cls, data, start=0):
+        """Returns the index ``dumps`` stored at ``start`` of ``data``.
+
+        ``data`` may be any buffer with the methods of ``bytes`` used by
+        ``SortedPrefixIndex``, such as an ``mmap``.
+        """
+        header_end = data.find(b'\n', start)
+        sizes = [int(size) for size in data[start:header_end].split(b'\t')]
+        start = header_end + 1
+        if header_end < 0 or len(sizes) != 3 or start + sum(sizes) != len(data):
+            raise ValueError('Invalid branch index')
+
+        index = cls()
+        sections = []
+        for size in sizes:
+            sections.append(SortedPrefixIndex(data, start, start + size))
+            start += size
+        index.by_lower_name, index._by_segment, index._by_initials = sections
+        return index
+
+    def dumps(self):
+        """Returns the index as bytes, see ``loads``."""
+        sections = [bytes(self.by_lower_name), bytes(self.by_segment), bytes(self.by_initials)]
+        header = '\t'.join(str(len(section)) for section in sections) + '\n'
+        return header.encode('utf-8') + b''.join(sections)
+
+    def _build_segment_indexes(self):
+        segment_pairs = []
+        initials_pairs = []
+        for lower, name in self.lower_names_from(''):
+            initials = []
+            offset = 0
+            for part in normalize_separators(lower).split('/'):
+                if part:
+                    initials.append(part[0])
+                    # The start of the name is covered by the full-name lookup.
+                    if offset:
+                        segment_pairs.append((lower[offset:], name))
+                offset += len(part) + 1
+            if len(initials) > 1:
+                initials_pairs.append((''.join(initials), name))
+        self._by_segment = SortedPrefixIndex.from_pairs(segment_pairs)
+        self._by_initials = SortedPrefixIndex.from_pairs(initials_pairs)
+
+    @property
+    def by_segment(self):
+        if self._by_segment is None:
+            self._build_segment_indexes()
+        return self._by_segment
+
+    @property
+    def by_initials(self):
+        if self._by_initials is None:
+            self._build_segment_indexes()
+        return self._by_initials
+
+    def lower_names_from(self, prefix):
+        """Yields ``(lowercase name, name)`` for the names starting with ``prefix``."""
+        for lower, name in self.by_lower_name.starting_with(prefix):
+            yield lower, name or lower
+
+    def __contains__(self, name):
+        lower = name.lower()
+        # Names equal to the key come first among those starting with it.
+        for key, other in self.lower_names_from(lower):
+            if key != lower:
+                break
+            if other == name:
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.by_lower_name)
+
+    def tiers(self, query, subsequence=True, accept=None):
+        """Yields lists of ``(score, name)`` candidates, best kind of match first.
+
+        Only names ``accept`` returns True for are candidates, if given. The
+        indexes for the weaker kinds of matches are only built (and searched)
+        when the caller asks for them.
+        """
+        def accepted(pairs):
+            return [(key, name) for key, name in pairs if accept is None or accept(name)]
+
+        lower = query.lower()
+        prefixed = accepted(self.lower_names_from(lower))
+        if any(name == query for _, name in prefixed):
+            yield [(EXACT, query)]
+
+        # Prefer the shortest completions.
+        yield [(PREFIX - min(len(key) - len(lower), 9), name) for key, name in prefixed]
+        yield [(SEGMENT_PREFIX, name)
+               for _, name in accepted(self.by_segment.starting_with(lower))]
+        yield [(INITIALS, name) for _, name in accepted(self.by_initials.starting_with(lower))]
+        if subsequence:
+            yield self._subsequence_matches(lower, accept)
+
+    def _subsequence_matches(self, lower, accept=None):
+        section = self.by_lower_name
+        data = section.data
+        chars = [char.encode('utf-8') for char in lower]
+        if b'\t' in chars or b'\n' in chars or any(
+                data.find(char, section.start, section.end) < 0 for char in chars):
+            return []
+
+        import re
+
+        # The keys are the lowercase names. Skipping up to the next character
+        # matched makes the search linear; a character of several bytes is
+        # searched for as a sequence.
+        pattern = re.compile(b'\n' + b''.join(
+            b'[^' + re.escape(char) + b'\t\n]*' + re.escape(char) if len(char) == 1 else
+            b'[^\t\n]*?' + re.escape(char) for char in chars))
+        matches = []
+        for match in pattern.finditer(data, section.start, section.end):
+            tab = data.find(b'\t', match.end(), section.end)
+            end = data.find(b'\n', tab, section.end)
+            if end < 0:
+                end = section.end
+            key = data[match.start() + 1:tab].decode('utf-8')
+            name = data[tab + 1:end].decode('utf-8') or key
+            if accept is not None and not accept(name):
+                continue
+            matches.append((subsequence_score(lower, key), name))
+            if len(matches) >= MAX_SUBSEQUENCE_MATCHES:
+                break
+        return matches
+
+    def rank(self, query, limit=10, accept=None):
+        """Returns up to ``limit`` ``(score, name)`` pairs, best match first.
+
+        Only names ``accept`` returns True for are ranked, if given.
+        """
+        if not query:
+            return []
+
+        scores = {}
+        for candidates in self.tiers(query, subsequence=False, accept=accept):
+            for score, name in candidates:
+                if score > scores.get(name, 0):
+                    scores[name] = score
+            if len(scores) >= limit:
+                break
+
+        # Subsequences are only scanned for when nothing else matches.
+        if not scores:
+            for score, name in self._subsequence_matches(query.lower(), accept):
+                if score > scores.get(name, 0):
+                    scores[name] = score
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, name) for name, score in ranked[:limit]]
+
+    def resolve(self, query):
+        """Returns the branch ``query`` unambiguously refers to, or None.
+
+        That is the only candidate of the best kind of match found, if that
+        kind is good enough to be picked without asking.
+        """
+        if not query:
+            return None
+
+        for candidates in self.tiers(query):
+            if not candidates:
+                continue
+            score, name = candidates[0]
+            if len(candidates) == 1 and score >= RESOLVE_THRESHOLD:
+                return name
+            return None
+
+    def suggest(self, query, limit=3):
+        """Returns names to offer as "did you mean" suggestions."""
+        return [name for _, name in self.rank(query, limit=limit)]
+
+
+def subsequence_score(query, name):
+    """Scores ``query`` as a subsequence of ``name``, or returns 0.
+
+    Characters matched at the start of a segment earn a bonus, gaps between
+    matched characters cost a little.
+    """
+    score = SUBSEQUENCE - 10
+    position = 0
+    previous = -1
+
+    for char in query:
+        position = name.find(char, position)
+        if position < 0:
+            return 0
+        if position == 0 or name[position - 1] in SEGMENT_SEPARATORS:
+            score += 2
+        elif previous >= 0 and position > previous + 1:
+            score -= 1
+        previous = position
+        position += 1
+
+    return max(1, min(score, SUBSEQUENCE))
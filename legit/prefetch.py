@@ -0,0 +1,211 @@
+"""
+legit.prefetch
+~~~~~~~~~~~~~~
+
+This module fetches remotes in the background, so syncs start with warm refs.
+
+Like ``git maintenance``, the remote branches are fetched into the side
+namespace ``refs/prefetch/remotes/<remote>/``, which leaves the
+remote-tracking branches (and so ``legit branches``) untouched until the
+next real fetch.
+"""
+
+import hashlib
+import os
+import random
+import re
+import time
+
+from .state import read_state, write_state
+
+PREFETCH_REF_PREFIX = 'refs/prefetch/remotes/{}/'
+PREFETCH_REFSPEC = '+refs/heads/*:' + PREFETCH_REF_PREFIX + '*'
+
+# Defaults of legit.prefetchInterval and legit.prefetchMaxBackoff, in seconds.
+DEFAULT_INTERVAL = 900
+DEFAULT_MAX_BACKOFF = 6 * 3600
+
+# Share of the interval added as random delay, so many repositories (or
+# machines) don't hit the server at the same moment.
+JITTER = 0.1
+
+# A lock older than this is left over from a crashed prefetch.
+STALE_LOCK_AGE = 3600
+
+SYSTEMD_SERVICE = """\
+[Unit]
+Description=legit prefetch for {path}
+
+[Service]
+Type=oneshot
+WorkingDirectory={path}
+ExecStart={command} prefetch
+"""
+
+SYSTEMD_TIMER = """\
+[Unit]
+Description=Periodic legit prefetch for {path}
+
+[Timer]
+OnBootSec={interval}
+OnUnitInactiveSec={interval}
+RandomizedDelaySec={jitter}
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+"""
+
+
+class PrefetchLocked(Exception):
+    """Another prefetch is running in the same repository."""
+
+
+class PrefetchLock:
+    """An exclusive lock file, taken with ``O_EXCL`` like git's own locks."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        for _ in range(2):
+            try:
+                self.fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._remove_stale():
+                    raise PrefetchLocked(self.path)
+            else:
+                os.write(self.fd, str(os.getpid()).encode())
+                return self
+        raise PrefetchLocked(self.path)
+
+    def __exit__(self, *exc_info):
+        os.close(self.fd)
+        os.unlink(self.path)
+
+    def _remove_stale(self):
+        try:
+            if time.time() - os.stat(self.path).st_mtime < STALE_LOCK_AGE:
+                return False
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        return True
+
+
+def prefetch_interval(scm):
+    return scm.config().get_int('legit.prefetchInterval', DEFAULT_INTERVAL)
+
+
+def next_delay(interval, failures, max_backoff=DEFAULT_MAX_BACKOFF):
+    """Returns the seconds to wait before the next fetch of a remote.
+
+    The interval doubles with every consecutive failure, up to
+    ``max_backoff``, and a random jitter is added on top.
+    """
+    delay = min(interval * 2 ** failures, max(interval, max_backoff))
+    return delay + random.uniform(0, delay * JITTER)
+
+
+def read_prefetch_state(scm):
+    """Returns ``{remote: {'time': ..., 'failures': ..., 'next': ...}}``."""
+    state = read_state(scm.state_path('prefetch.json'), {})
+    return state if isinstance(state, dict) else {}
+
+
+def is_fresh(scm, remote_name, now=None):
+    """Returns True if ``remote_name`` was prefetched within the last interval."""
+    entry = read_prefetch_state(scm).get(remote_name)
+    if not entry or entry.get('failures'):
+        return False
+    now = time.time() if now is None else now
+    return now - entry.get('time', 0) <= prefetch_interval(scm) * 2
+
+
+def prefetch_remote(scm, remote_name):
+    """Fetches the branches of ``remote_name`` into its prefetch namespace."""
+    command = ['fetch', remote_name, '--prune', '--no-tags']
+    # Before git 2.29, fetches always write FETCH_HEAD.
+    if scm.repo.git.version_info >= (2, 29):
+        command.append('--no-write-fetch-head')
+    return scm.git_exec(
+        command + ['--recurse-submodules=no', '--refmap=', PREFETCH_REFSPEC.format(remote_name)],
+        with_extended_output=True, with_exceptions=False)
+
+
+def run_prefetch(scm, force=False, callback=None):
+    """Prefetches every remote that is due, holding the prefetch lock.
+
+    ``callback`` is called with ``(remote, ok)`` after each fetch. Returns
+    the seconds until the next remote is due. A faked prefetch neither takes
+    the lock nor stores its state.
+    """
+    interval = prefetch_interval(scm)
+
+    if scm.fake:
+        state = prefetch_due(scm, interval, force, callback)
+    else:
+        with PrefetchLock(scm.state_path('prefetch.lock')):
+            state = prefetch_due(scm, interval, force, callback)
+            write_state(scm.state_path('prefetch.json'), state)
+
+    due = [entry['next'] for entry in state.values() if 'next' in entry]
+    return max(0, min(due) - time.time()) if due else interval
+
+
+def prefetch_due(scm, interval, force=False, callback=None):
+    """Fetches the remotes that are due, returns their updated prefetch state."""
+    max_backoff = scm.config().get_int('legit.prefetchMaxBackoff', DEFAULT_MAX_BACKOFF)
+    state = read_prefetch_state(scm)
+    now = time.time()
+
+    for remote_name in scm.get_remote_names():
+        entry = state.get(remote_name, {})
+        if not force and entry.get('next', 0) > now:
+            continue
+
+        status, _, _ = prefetch_remote(scm, remote_name)
+        now = time.time()
+        if status == 0:
+            entry = {'time': now, 'failures': 0}
+        else:
+            entry = dict(entry, failures=entry.get('failures', 0) + 1)
+        entry['next'] = now + next_delay(interval, entry['failures'], max_backoff)
+        state[remote_name] = entry
+
+        if callback is not None:
+            callback(remote_name, status == 0)
+
+    return state
+
+
+def run_daemon(scm, callback=None):
+    """Prefetches forever, sleeping until the next remote is due."""
+    while True:
+        scm.refresh()
+        try:
+            delay = run_prefetch(scm, callback=callback)
+        except PrefetchLocked:
+            delay = prefetch_interval(scm)
+        time.sleep(max(delay, 1))
+
+
+def systemd_units(path, command, interval):
+    """Returns the ``(service, timer)`` unit files prefetching ``path``."""
+    values = dict(path=path, command=command, interval='{}s'.format(interval),
+                  jitter='{}s'.format(int(interval * JITTER)))
+    return SYSTEMD_SERVICE.format(**values), SYSTEMD_TIMER.format(**values)
+
+
+def systemd_unit_dir():
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+    return os.path.join(config_home, 'systemd', 'user')
+
+
+def systemd_unit_name(path):
+    """Returns the name (without suffix) of the units prefetching ``path``."""
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return 'legit-prefetch-{}-{}'.format(
+        re.sub(r'[^A-Za-z0-9_.-]', '_', os.path.basename(path)), digest[:8])
@@ -0,0 +1,223 @@
+"""
+legit.refindex
+~~~~~~~~~~~~~~
+
+This module provides a persistent index of the branches of a repository.
+"""
+
+import os
+import time
+
+from .state import read_state, state_path, write_state
+
+INDEX_VERSION = 2
+
+# Directories modified this recently (in ns) may still change within the same
+# timestamp, so their content is re-read on the next load.
+RACY_WINDOW = 2 * 10 ** 9
+
+
+class RefIndex:
+    """Local branches, published branches and HEAD of a repository.
+
+    The index is stored in ``.git/legit/refs-<remote>.json`` together with
+    the stat signature of ``HEAD``, ``packed-refs`` and every
+    directory below ``refs/heads`` and ``refs/remotes/<remote>``. Loading it
+    only stats those paths; ``packed-refs`` is re-read only when it changed,
+    and loose refs only in the directories that changed.
+    """
+
+    def __init__(self, git_dir, common_dir, remote=None):
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self.remote = remote
+        self.path = state_path(common_dir, 'refs-{}.json'.format(remote or ''))
+
+        self.head = None
+        self.local = {}
+        self.published = {}
+        self.changed = False
+        self.data = None
+
+    @staticmethod
+    def is_supported(common_dir):
+        """Returns False for ref storage backends the index can't read."""
+        return not os.path.exists(os.path.join(common_dir, 'reftable'))
+
+    @property
+    def prefixes(self):
+        prefixes = ['refs/heads/']
+        if self.remote:
+            prefixes.append('refs/remotes/{}/'.format(self.remote))
+        return prefixes
+
+    def load(self):
+        """Loads the index, bringing it up to date with the repository.
+
+        Loading an index again starts from the data it holds instead of
+        reading the file.
+        """
+        data = self.data if self.data is not None else read_state(self.path)
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            data = {'version': INDEX_VERSION, 'files': {}, 'packed': {}, 'loose': {}}
+
+        files = data['files']
+        changed = set()
+        dirty = False
+
+        for name, path in (('HEAD', os.path.join(self.git_dir, 'HEAD')),
+                           ('packed-refs', os.path.join(self.common_dir, 'packed-refs'))):
+            signature = stat_signature(path)
+            if files.get(name) != signature:
+                files[name] = signature
+                changed.add(name)
+
+        if 'packed-refs' in changed:
+            data['packed'] = read_packed_refs(
+                os.path.join(self.common_dir, 'packed-refs'), self.prefixes)
+
+        loose = data['loose']
+        seen = set()
+        racy_after = int(time.time() * 1e9) - RACY_WINDOW
+        for prefix in self.prefixes:
+            for directory, ref_dir, mtime in walk_ref_directories(self.common_dir, prefix):
+                seen.add(ref_dir)
+                entry = loose.get(ref_dir)
+                if entry is None or entry[0] != mtime:
+                    dirty = True
+                    dir_refs = read_loose_refs(directory, ref_dir)
+                    if entry is None or entry[1] != dir_refs:
+                        changed.add(ref_dir)
+                    loose[ref_dir] = [stable_mtime(mtime, racy_after), dir_refs]
+        for ref_dir in set(loose) - seen:
+            del loose[ref_dir]
+            changed.add(ref_dir)
+
+        refs = dict(data['packed'])
+        for _, dir_refs in loose.values():
+            refs.update(dir_refs)
+
+        self.changed = bool(changed)
+        if self.changed or dirty:
+            try:
+                write_state(self.path, data)
+            except OSError:
+                pass
+
+        self.data = data
+        self.head = read_head(os.path.join(self.git_dir, 'HEAD'))
+        self.local = {}
+        self.published = {}
+        remote_prefix = self.prefixes[-1] if self.remote else None
+        for refname, oid in refs.items():
+            if refname.startswith('refs/heads/'):
+                self.local[refname[len('refs/heads/'):]] = oid
+            elif remote_prefix and refname.startswith(remote_prefix):
+                self.published[refname[len(remote_prefix):]] = oid
+
+        return self
+
+
+def stat_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+
+def walk_directories(top):
+    """Yields ``(path, mtime)`` for ``top`` and all directories below it."""
+    try:
+        mtime = os.stat(top).st_mtime_ns
+    except OSError:
+        return
+    yield top, mtime
+
+    pending = [top]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    yield entry.path, entry.stat(follow_symlinks=False).st_mtime_ns
+                except OSError:
+                    continue
+                pending.append(entry.path)
+
+
+def walk_ref_directories(common_dir, prefix):
+    """Yields ``(path, ref_dir, mtime)`` for the directories of the loose refs below ``prefix``.
+
+    ``ref_dir`` is the refname prefix of the refs in the directory, such as
+    ``refs/heads/feature/``.
+    """
+    top = os.path.join(common_dir, *prefix.rstrip('/').split('/'))
+    for directory, mtime in walk_directories(top):
+        ref_dir = prefix
+        if directory != top:
+            ref_dir += os.path.relpath(directory, top).replace(os.sep, '/') + '/'
+        yield directory, ref_dir, mtime
+
+
+def stable_mtime(mtime, racy_after):
+    """Returns ``mtime`` to compare a directory by later, or None if it is racy.
+
+    A directory modified after ``racy_after`` may still change within the
+    same timestamp, so it must be read again next time.
+    """
+    return mtime if mtime < racy_after else None
+
+
+def read_loose_refs(directory, ref_dir):
+    """Returns ``{refname: oid}`` for the loose refs directly in ``directory``."""
+    refs = {}
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return refs
+
+    for entry in entries:
+        if not entry.is_file(follow_symlinks=False) or entry.name.endswith('.lock'):
+            continue
+        try:
+            with open(entry.path) as f:
+                content = f.read(256).strip()
+        except OSError:
+            continue
+        # Symbolic refs such as refs/remotes/origin/HEAD are skipped.
+        if content and not content.startswith('ref:'):
+            refs[ref_dir + entry.name] = content
+    return refs
+
+
+def read_packed_refs(path, prefixes):
+    """Returns ``{refname: oid}`` for the refs in ``packed-refs`` under ``prefixes``."""
+    refs = {}
+    prefixes = tuple(prefixes)
+    try:
+        with open(path) as f:
+            for line in f:
+                if line[0] in '#^':
+                    continue
+                oid, _, refname = line.rstrip('\n').partition(' ')
+                if refname.startswith(prefixes):
+                    refs[refname] = oid
+    except OSError:
+        pass
+    return refs
+
+
+def read_head(path):
+    """Returns the branch HEAD points to, or None if it is detached."""
+    try:
+        with open(path) as f:
+            content = f.read().strip()
+    except OSError:
+        return None
+    if content.startswith('ref: refs/heads/'):
+        return content[len('ref: refs/heads/'):]
+    return None
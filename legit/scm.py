@@ -7,38 +7,70 @@ This module provides the main interface to Git.
 
 import fnmatch
 import os
+import re
 import sys
-from collections import namedtuple
+import time
+from collections import OrderedDict, namedtuple
 from operator import attrgetter
 
 import click
-from clint.textui import colored, columns
+from clint.textui import colored
 import crayons
-from git import Repo
-from git.exc import BadName, GitCommandError, InvalidGitRepositoryError
+from git import Remote, Repo
+from git.exc import GitCommandError, InvalidGitRepositoryError
 
+from .backend import is_read_only, make_backend, writes_config
 from .settings import legit_settings
+from .state import LS_REMOTE_TTL, live_heads_name, read_state, state_path, write_state
 from .utils import black, status_log
 
 LEGIT_TEMPLATE = 'Legit: stashing before {0}.'
+# Machine-readable tag appended to the message of stashes created by legit.
+LEGIT_STASH_TAG = '(legit:{verb}:{branch})'
+LEGIT_STASH_TAG_RE = re.compile(r'\(legit:(?P<verb>switch|sync):(?P<branch>\S+)\)$')
+
+# Maximum number of refspecs sent with a single push.
+PUSH_CHUNK_SIZE = 500
+
+# Number of rows of the branch list written at once.
+RENDER_CHUNK_SIZE = 1000
+
+# Maximum number of refs named on the command line of a single git command.
+REF_CHUNK_SIZE = 500
+
+# Number of ahead/behind counts kept in .git/legit/ahead-behind.json.
+AHEAD_BEHIND_CACHE_SIZE = 4096
 
 
 Branch = namedtuple('Branch', ['name', 'is_published'])
+# A Branch with its ahead/behind counts, which are None without an upstream.
+BranchStatus = namedtuple('BranchStatus', Branch._fields + ('ahead', 'behind'))
+Worktree = namedtuple('Worktree', ['path', 'branch'])
+PushStatus = namedtuple('PushStatus', ['branch', 'ok', 'summary'])
+FetchResult = namedtuple('FetchResult', ['remote', 'ok', 'output', 'duration'])
+BranchState = namedtuple('BranchState', ['name', 'oid', 'remote_oid', 'ahead', 'behind'])
+MergedBranch = namedtuple('MergedBranch', ['name', 'oid', 'is_published', 'by_patch'])
 
 
 class SCMRepo:
     git = None
     repo = None
+    backend = None
     remote = None
     verbose = False
     fake = False
     stash_index = None
+    stash_oid = None
+    _branch_index = None
+    _ref_index = None
+    _config = None
 
     def __init__(self):
         self.git = os.environ.get('GIT_PYTHON_GIT_EXECUTABLE', 'git')
 
         try:
             self.repo = Repo(search_parent_directories=True)
+            self.backend = make_backend(self.repo, git=self.git)
             self.remote = self.get_remote()
         except InvalidGitRepositoryError:
             self.repo = None
@@ -53,9 +85,19 @@ class SCMRepo:
         else:
             verbose = self.verbose
         verbose_echo(' '.join(command), verbose, self.fake)
+        for line in (kwargs.get('input') or '').splitlines():
+            verbose_echo('    {}'.format(line), verbose, self.fake)
+
+        if not is_read_only(command[1:]):
+            self._branch_index = None  # refs may change
+            self._ref_index = None
+        if writes_config(command[1:]):
+            self._config = None
+        if command[1:2] == ['push'] and not self.fake:
+            self.forget_live_heads()
 
         if not self.fake:
-            result = self.repo.git.execute(command, **kwargs)
+            result = self.backend.execute(command, **kwargs)
         else:
             if 'with_extended_output' in kwargs:
                 result = (0, '', '')
@@ -63,6 +105,67 @@ class SCMRepo:
                 result = ''
         return result
 
+    def git_stream(self, command, no_verbose=False):
+        """Execute git commands, yielding output lines as they are produced"""
+        from .cli import verbose_echo
+
+        command.insert(0, self.git)
+        verbose_echo(' '.join(command), self.verbose and not no_verbose, self.fake)
+
+        if not self.fake:
+            return self.backend.stream(command)
+        else:
+            return iter(())
+
+    def config(self):
+        """Returns the GitConfig snapshot of the effective git config.
+
+        It is read once and reused until legit itself changes the config.
+        """
+        if self._config is None:
+            from .config import GitConfig
+
+            command = [self.git, 'config', '--list', '-z']
+            status, stdout, _ = self.backend.execute(
+                command + ['--show-scope'], with_extended_output=True, with_exceptions=False)
+            if status == 0:
+                self._config = GitConfig.parse(stdout)
+            else:  # git < 2.26
+                self._config = GitConfig.parse(
+                    self.backend.execute(command, with_exceptions=False), with_scope=False)
+        return self._config
+
+    def refresh(self):
+        """Forgets everything read from the repository so far.
+
+        Long-running processes call it before acting on a repository which
+        may have been changed by others in the meantime.
+        """
+        self._config = None
+        self._ref_index = None
+        self._branch_index = None
+        self.remote = self.get_remote()
+
+    def revalidate(self):
+        """Brings the ref index up to date, keeping the config read so far.
+
+        Long-running processes call it when the config is known to be
+        unchanged. Only refs which changed are read again.
+        """
+        index = self._ref_index
+        if index is None or index.remote != (self.remote.name if self.remote else None):
+            self._branch_index = None
+            self.ref_index()
+            return
+        index.load()
+        if index.changed:
+            self._branch_index = None
+
+    def get_remote_names(self):
+        """Returns the names of the configured remotes."""
+
+        return self.config().subsections('remote')
+
     def repo_check(self, require_remote=False, require_refs=False):
         if self.repo is None:
             click.echo('Not a git repository.')
@@ -73,57 +176,73 @@ class SCMRepo:
             sys.exit(128)
 
         if require_refs:
-            try:
-                self.repo.commit('HEAD^')
-            except BadName:
+            if self.rev_parse('HEAD^') is None:
                 click.echo('Repo only contains root commit.')
                 sys.exit(128)
 
         # TODO: no remote fail
-        if not self.repo.remotes and require_remote:
+        if not self.get_remote_names() and require_remote:
             click.echo('No git remotes configured. Please add one.')
             sys.exit(128)
 
         # TODO: You're in a merge state.
 
+    def is_dirty(self):
+        """Returns True if the index or the working tree has changes.
+
+        Untracked files don't count, as with GitPython's ``Repo.is_dirty``.
+        """
+        output = self.backend.execute(
+            [self.git, 'status', '--porcelain', '--untracked-files=no'])
+
+        return bool(output.strip())
+
     def stash_log(self, sync=False):
-        if self.repo.is_dirty():
+        if self.is_dirty():
             status_log(self.stash_it, 'Saving local changes.', sync=sync)
 
     def unstash_log(self, sync=False):
         self.stash_index = self.unstash_index(sync=sync)
-        if self.stash_index:
+        if self.stash_index is not None:
             status_log(self.unstash_it, 'Restoring local changes.', sync=sync)
 
     def unstash_index(self, sync=False, branch=None):
-        """Returns an unstash index if one is available."""
-
-        stash_list = self.git_exec(['stash', 'list'], no_verbose=True)
+        """Returns an unstash index if one is available.
 
+        The stash reflog is walked newest first and the walk stops at the
+        first stash legit made for ``branch``. Its object id is remembered in
+        ``stash_oid`` so that the right stash is popped even if the stack
+        changed in the meantime.
+        """
         if branch is None:
             branch = self.get_current_branch_name()
 
-        for stash in stash_list.splitlines():
+        verb = 'sync' if sync else 'switch'
+        self.stash_oid = None
 
-            verb = 'syncing' if sync else 'switching'
+        if not self.fake and self.rev_parse('refs/stash') is None:
+            return None
 
-            if (
-                (('Legit' in stash) and
-                 ('On {}:'.format(branch) in stash) and
-                 (verb in stash)
-                 ) or
-                (('GitHub' in stash) and
-                 ('On {}:'.format(branch) in stash) and
-                 (verb in stash)
-                 )
-            ):
-                return stash[7]
+        lines = self.git_stream(
+            ['log', '--walk-reflogs', '--format=%H%x00%gs', 'refs/stash'], no_verbose=True)
+        try:
+            for index, line in enumerate(lines):
+                oid, _, subject = line.partition('\0')
+                if is_legit_stash(subject, branch, verb):
+                    self.stash_oid = oid
+                    return index
+        finally:
+            if hasattr(lines, 'close'):
+                lines.close()
 
     def stash_it(self, sync=False):
         msg = 'syncing branch' if sync else 'switching branches'
+        tag = LEGIT_STASH_TAG.format(
+            verb='sync' if sync else 'switch', branch=self.get_current_branch_name())
 
         return self.git_exec(
-            ['stash', 'save', '--include-untracked', LEGIT_TEMPLATE.format(msg)])
+            ['stash', 'save', '--include-untracked',
+             '{} {}'.format(LEGIT_TEMPLATE.format(msg), tag)])
 
     def unstash_it(self, sync=False):
         """
@@ -131,36 +250,127 @@ class SCMRepo:
         Requires prior code setting self.stash_index.
         """
         if self.stash_index is not None:
-            return self.git_exec(
-                ['stash', 'pop', 'stash@{{{0}}}'.format(self.stash_index)])
+            stash = 'stash@{{{0}}}'.format(self.stash_index)
+            if self.stash_oid is not None and self.rev_parse(stash) != self.stash_oid:
+                # The stash stack changed, look the stash up again.
+                self.stash_index = self.unstash_index(sync=sync)
+                if self.stash_index is None:
+                    return None
+                stash = 'stash@{{{0}}}'.format(self.stash_index)
+            return self.git_exec(['stash', 'pop', stash])
+
+    def fetch(self, negotiation_tips=()):
+        """Fetches from the remote.
+
+        ``negotiation_tips`` limits the commits offered to the server as
+        already present to the history of those refs (or ref globs).
+        """
+
+        return self.git_exec(['fetch', self.remote.name] + [
+            '--negotiation-tip={}'.format(tip) for tip in negotiation_tips])
+
+    def fetch_branch(self, branch, negotiation_tips=()):
+        """Fetches only ``branch`` from the remote, into its remote-tracking branch.
+
+        No tags are fetched, and only the history of the branch (local and
+        remote-tracking) and of ``negotiation_tips`` is offered to the server
+        as already present, so neither the other refs of the remote nor of
+        the repository weigh on the fetch. A partial clone fetches with the
+        filter it was cloned with.
+        """
+        tracking = 'refs/remotes/{}/{}'.format(self.remote.name, branch)
+        tips = ['refs/heads/{}'.format(branch), tracking] + list(negotiation_tips)
+        command = ['fetch', self.remote.name, '--no-tags'] + [
+            '--negotiation-tip={}'.format(tip) for tip in tips if self.rev_parse(tip)]
+
+        object_filter = self.partial_clone_filter()
+        if object_filter:
+            command.append('--filter={}'.format(object_filter))
+
+        return self.git_exec(command + ['+refs/heads/{}:{}'.format(branch, tracking)])
+
+    def fetch_scope(self):
+        """Returns 'branch' or 'remote' (the default) from ``legit.fetchScope``."""
+        scope = self.config().get('legit.fetchScope', 'remote').lower()
+        return 'branch' if scope == 'branch' else 'remote'
+
+    def partial_clone_filter(self):
+        """Returns the object filter of the remote if it is a partial clone's, or None."""
+        config = self.config()
+        if not config.get_bool('remote.{}.promisor'.format(self.remote.name), False):
+            return None
+        return config.get('remote.{}.partialCloneFilter'.format(self.remote.name))
+
+    def fetch_all_enabled(self):
+        return self.config().get_bool('legit.fetchAllRemotes', False)
 
-    def smart_pull(self):
+    def fetch_remotes(self, remote_names=None, jobs=None, callback=None):
+        """Fetches from several remotes (all of them by default) concurrently.
+
+        At most ``jobs`` fetches run at a time. A failing fetch doesn't stop
+        the others; ``callback`` is called with each FetchResult as soon as
+        it is available. Returns all results in the order of the remotes.
         """
-        'git log --merges origin/master..master'
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from .workspace import default_jobs
+
+        if remote_names is None:
+            remote_names = self.get_remote_names()
+
+        def fetch(remote_name):
+            start = time.time()
+            status, stdout, stderr = self.git_exec(
+                ['fetch', remote_name], with_extended_output=True, with_exceptions=False)
+            output = '\n'.join(part for part in (stderr, stdout) if part)
+            return FetchResult(remote_name, status == 0, output, time.time() - start)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=jobs or default_jobs()) as pool:
+            futures = {pool.submit(fetch, name): name for name in remote_names}
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if callback is not None:
+                    callback(result)
+
+        return [results[name] for name in remote_names]
+
+    def smart_pull(self, fetch=True):
         """
+        'git rev-list --merges --max-count=1 origin/master..master'
+
+        Set ``fetch`` to False if the remote has just been fetched. With
+        ``legit.fetchScope`` set to ``branch``, only the current branch is
+        fetched (see ``fetch_branch``).
+        """
+        from .prefetch import PREFETCH_REF_PREFIX, is_fresh
+
         branch = self.get_current_branch_name()
 
-        self.git_exec(['fetch', self.remote.name])
+        if fetch:
+            fresh = is_fresh(self, self.remote.name)
+            prefetched = PREFETCH_REF_PREFIX.format(self.remote.name)
+            if self.fetch_scope() == 'branch':
+                self.fetch_branch(branch, [prefetched + branch] if fresh else ())
+            elif fresh:
+                # The objects are here already, only the prefetched tips
+                # need to be offered to the server.
+                self.fetch([prefetched + '*'])
+            else:
+                self.fetch()
 
         return self.smart_merge('{}/{}'.format(self.remote.name, branch),
                                 self.smart_merge_enabled())
 
     def smart_merge_enabled(self):
-        reader = self.repo.config_reader()
-        if reader.has_option('legit', 'smartMerge'):
-            return reader.getboolean('legit', 'smartMerge')
-        else:
-            return True
+        return self.config().get_bool('legit.smartMerge', True)
 
     def smart_merge(self, branch, allow_rebase=True):
 
         from_branch = self.get_current_branch_name()
 
-        merges = self.git_exec(
-            ['log', '--merges', '{}..{}'.format(branch, from_branch)])
-
         if allow_rebase:
-            verb = 'merge' if merges.count('commit') else 'rebase'
+            verb = 'merge' if self.has_merges(branch, from_branch) else 'rebase'
         else:
             if self.pull_rebase():
                 verb = 'rebase'
@@ -177,22 +387,22 @@ class SCMRepo:
                 abort('Merge failed. Reverting.',
                       log='{}\n{}'.format(why, log), type='merge')
 
+    def has_merges(self, upstream, branch):
+        """Returns True if ``branch`` has merge commits which are not in ``upstream``.
+
+        The history walk stops at the first merge found and nothing but its
+        object id is printed.
+        """
+        merge = self.git_exec(
+            ['rev-list', '--merges', '--max-count=1', '{}..{}'.format(upstream, branch)])
+
+        return bool(merge.strip())
+
     def pull_rebase(self):
-        reader = self.repo.config_reader()
-        if reader.has_option('pull', 'rebase'):
-            return reader.getboolean('pull', 'rebase')
-        else:
-            return False
+        return self.config().get_bool('pull.rebase', False)
 
     def pull_ff_only(self):
-        reader = self.repo.config_reader()
-        if reader.has_option('pull', 'ff'):
-            if reader.get('pull', 'ff') == 'only':
-                return True
-            else:
-                return False
-        else:
-            return False
+        return self.config().get('pull.ff') == 'only'
 
     def push(self, branch=None):
 
@@ -201,6 +411,303 @@ class SCMRepo:
         else:
             return self.git_exec(['push', self.remote.name, branch])
 
+    def push_branches(self, branches):
+        """Pushes all given branches with a single push."""
+
+        return self.git_exec(['push', self.remote.name] + list(branches))
+
+    def fast_forward_branches(self, states):
+        """Moves the given (not checked out) branches to their remote commits.
+
+        All refs are updated in one ``git update-ref --stdin`` transaction,
+        which fails as a whole if any branch moved in the meantime.
+        """
+        commands = ''.join(
+            'update refs/heads/{} {} {}\n'.format(state.name, state.remote_oid, state.oid)
+            for state in states)
+
+        return self.git_exec(['update-ref', '-m', 'legit: fast-forward to {}'.format(
+            self.remote.name), '--stdin'], input=commands)
+
+    def get_branch_states(self):
+        """Returns a BranchState for every local branch which is also published.
+
+        Ahead/behind counts come from ``%(upstream:track)`` of a single
+        ``git for-each-ref`` call when the branch tracks its published
+        counterpart, and from ``git rev-list`` otherwise.
+        """
+        remote_prefix = 'refs/remotes/{}/'.format(self.remote.name)
+        forbidden = set(legit_settings.forbidden_branches)
+
+        remote_oids = {}
+        local = []
+        for refname, oid, upstream, track in self.for_each_ref(
+                ['refname', 'objectname', 'upstream', 'upstream:track'],
+                'refs/heads/', remote_prefix):
+            if refname.startswith(remote_prefix):
+                remote_oids[refname[len(remote_prefix):]] = oid
+            elif refname.startswith('refs/heads/'):
+                local.append((refname[len('refs/heads/'):], oid, upstream, track))
+
+        states = []
+        for name, oid, upstream, track in local:
+            remote_oid = remote_oids.get(name)
+            if remote_oid is None or name in forbidden:
+                continue
+
+            if oid == remote_oid:
+                ahead, behind = 0, 0
+            elif upstream == remote_prefix + name and track != '[gone]':
+                ahead, behind = parse_track(track)
+            else:
+                ahead, behind = self.ahead_behind(oid, remote_oid)
+
+            states.append(BranchState(name, oid, remote_oid, ahead, behind))
+
+        return states
+
+    def ahead_behind(self, local, upstream):
+        """Returns how many commits ``local`` is ahead of and behind ``upstream``."""
+
+        output = self.backend.execute(
+            [self.git, 'rev-list', '--left-right', '--count',
+             '{}...{}'.format(local, upstream)])
+        ahead, behind = output.split()
+
+        return int(ahead), int(behind)
+
+    def get_ahead_behind(self, names, jobs=None):
+        """Returns ``{branch: (ahead, behind)}`` for the local branches ``names``.
+
+        Branches are compared with their upstream, or with their published
+        counterpart if they have none; branches with neither are left out.
+        Counts are cached in ``.git/legit/`` by the pair of commits compared.
+        Missing counts of branches tracking an upstream come from
+        ``%(upstream:track)`` of a single ``git for-each-ref`` call, the others
+        from ``git rev-list`` calls running ``jobs`` at a time.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from .workspace import default_jobs
+
+        wanted = set(names)
+        oids = {}
+        upstreams = {}
+        for refname, oid, upstream in self.for_each_ref(
+                ['refname', 'objectname', 'upstream'], 'refs/heads/', 'refs/remotes/'):
+            oids[refname] = oid
+            if refname.startswith('refs/heads/') and refname[len('refs/heads/'):] in wanted:
+                upstreams[refname[len('refs/heads/'):]] = upstream
+
+        remote_prefix = 'refs/remotes/{}/'.format(self.remote.name) if self.remote else None
+        pairs = {}
+        tracked = set()
+        for name, upstream in upstreams.items():
+            if upstream in oids:
+                tracked.add(name)
+            elif remote_prefix and remote_prefix + name in oids:
+                upstream = remote_prefix + name
+            else:
+                continue
+            pairs[name] = (oids['refs/heads/' + name], oids[upstream])
+
+        path = self.state_path('ahead-behind.json')
+        # Oldest first, the entries beyond AHEAD_BEHIND_CACHE_SIZE are evicted.
+        cached = read_state(path, object_pairs_hook=OrderedDict)
+        if not isinstance(cached, OrderedDict):
+            cached = OrderedDict()
+
+        counts = {}
+        computed = {}
+        missing_tracked = []
+        missing_untracked = []
+        for name, (local, upstream) in pairs.items():
+            key = '{} {}'.format(local, upstream)
+            if local == upstream:
+                counts[name] = (0, 0)
+            elif key in cached:
+                counts[name] = tuple(cached[key])
+            elif name in tracked:
+                missing_tracked.append(name)
+            else:
+                missing_untracked.append(name)
+
+        for i in range(0, len(missing_tracked), REF_CHUNK_SIZE):
+            refnames = ['refs/heads/' + name for name in missing_tracked[i:i + REF_CHUNK_SIZE]]
+            for refname, track in self.for_each_ref(['refname', 'upstream:track'], *refnames):
+                name = refname[len('refs/heads/'):]
+                if name in pairs and track != '[gone]':
+                    counts[name] = computed[' '.join(pairs[name])] = parse_track(track)
+        # Branches whose upstream vanished meanwhile are counted with rev-list.
+        missing_untracked += [name for name in missing_tracked if name not in counts]
+
+        if missing_untracked:
+            with ThreadPoolExecutor(max_workers=jobs or default_jobs()) as pool:
+                results = pool.map(lambda name: self.ahead_behind(*pairs[name]),
+                                   missing_untracked)
+                for name, result in zip(missing_untracked, results):
+                    counts[name] = computed[' '.join(pairs[name])] = result
+
+        if computed:
+            cached.update(computed)
+            entries = list(cached.items())[-AHEAD_BEHIND_CACHE_SIZE:]
+            try:
+                write_state(path, OrderedDict((key, list(value)) for key, value in entries))
+            except OSError:
+                pass
+
+        return counts
+
+    def get_merged_branches(self, target):
+        """Returns a MergedBranch for every branch merged into the branch ``target``.
+
+        Local branches and branches published on the remote are listed
+        separately (by ``is_published``), except ``target`` itself, the
+        default branch of the remote and the forbidden branches.
+
+        Branches merged as they are come from a single ``git for-each-ref
+        --merged`` query. The others count as merged (``by_patch``) when their
+        changes reached ``target`` with other commits, as ``git cherry`` would
+        tell: either all of their commits, or their whole diff as one squashed
+        commit, match the patch id of a commit of ``target`` since where the
+        branch forks off. Patch ids are computed by a git call per
+        REF_CHUNK_SIZE commits, each commit once, however many branches
+        there are.
+        """
+        patterns = ['refs/heads/']
+        if self.remote is not None:
+            patterns.append('refs/remotes/{}/'.format(self.remote.name))
+        forbidden = set(legit_settings.forbidden_branches) | {target, 'HEAD'}
+        target_ref = 'refs/heads/' + target
+
+        def branch_name(refname):
+            prefix = next(prefix for prefix in patterns if refname.startswith(prefix))
+            return refname[len(prefix):]
+
+        listed = self.for_each_ref(['refname', 'objectname', 'symref'], *patterns)
+        # refs/remotes/<remote>/HEAD points at the default branch.
+        forbidden.update(branch_name(symref) for _, _, symref in listed
+                         if symref.startswith(tuple(patterns)))
+        refs = {refname: oid for refname, oid, symref in listed
+                if not symref and branch_name(refname) not in forbidden}
+        merged = {refname for (refname,) in self.for_each_ref(
+            ['refname'], '--merged={}'.format(target_ref), *patterns)}
+
+        tips = {oid for refname, oid in refs.items() if refname not in merged}
+        by_patch = self.find_patch_merged(target_ref, tips) if tips else set()
+
+        return [
+            MergedBranch(branch_name(refname), oid, not refname.startswith('refs/heads/'),
+                         refname not in merged)
+            for refname, oid in sorted(refs.items())
+            if refname in merged or oid in by_patch
+        ]
+
+    def find_patch_merged(self, target, tips):
+        """Returns the commits of ``tips`` whose changes are in ``target`` by patch id."""
+        # All commits of the tips which are not in target, with their parents.
+        log = self.backend.execute(
+            [self.git, 'log', '-p', '--format=commit %H %P', '--stdin'],
+            input=''.join('{}\n'.format(tip) for tip in sorted(tips)) + '^{}\n'.format(target))
+        parents = {}
+        for line in log.splitlines():
+            if line.startswith('commit '):
+                oids = line.split()[1:]
+                parents[oids[0]] = oids[1:]
+        boundary = {parent for oids in parents.values() for parent in oids
+                    if parent not in parents}
+        if not boundary:
+            return set()
+        patch_ids = dict((oid, patch_id) for patch_id, oid in self.patch_ids(log))
+
+        # Each tip's own commits, and where they fork off target.
+        commits = {}
+        fork_points = {}
+        for tip in tips:
+            own = commits[tip] = set()
+            forks = fork_points[tip] = set()
+            pending = [tip]
+            while pending:
+                oid = pending.pop()
+                if oid in own or oid in forks:
+                    continue
+                if oid in parents:
+                    own.add(oid)
+                    pending.extend(parents[oid])
+                else:
+                    forks.add(oid)
+
+        # A tip forking off once has one diff to compare with a squashed commit.
+        squashable = {tip: next(iter(forks))
+                      for tip, forks in fork_points.items() if len(forks) == 1}
+        squashed = dict((oid, patch_id) for patch_id, oid in self.patch_ids(self.backend.execute(
+            [self.git, 'diff-tree', '-p', '--stdin'],
+            input=''.join('{} {}\n'.format(tip, fork) for tip, fork in squashable.items()))))
+
+        # As with ``git cherry``, a tip's changes may be in the target commits
+        # since where it forks off. Tips forking off at the same commits share
+        # that range, the patch ids of each target commit are computed once.
+        groups = {}
+        for tip, forks in fork_points.items():
+            groups.setdefault(frozenset(forks), []).append(tip)
+        ranges = {}
+        for forks in groups:
+            ranges[forks] = self.backend.execute(
+                [self.git, 'rev-list', '--no-merges', '--stdin'],
+                input='{}\n'.format(target) + ''.join('^{}\n'.format(fork) for fork in sorted(forks))
+            ).split()
+        upstream_oids = sorted({oid for oids in ranges.values() for oid in oids})
+        upstream_ids = {}
+        for i in range(0, len(upstream_oids), REF_CHUNK_SIZE):
+            target_log = self.backend.execute(
+                [self.git, 'log', '-p', '--no-walk=unsorted', '--format=commit %H', '--stdin'],
+                input=''.join('{}\n'.format(oid) for oid in upstream_oids[i:i + REF_CHUNK_SIZE]))
+            upstream_ids.update((oid, patch_id) for patch_id, oid in self.patch_ids(target_log))
+
+        found = set()
+        for forks, group in groups.items():
+            upstream = {upstream_ids[oid] for oid in ranges[forks] if oid in upstream_ids}
+            for tip in group:
+                # Merge commits have no patch id, a tip needs some commit with one.
+                own = [patch_ids[oid] for oid in commits[tip] if oid in patch_ids]
+                if own and all(patch_id in upstream for patch_id in own):
+                    found.add(tip)
+                elif squashed.get(tip) in upstream:
+                    found.add(tip)
+        return found
+
+    def patch_ids(self, patches):
+        """Returns ``(patch id, commit)`` pairs of ``git patch-id --stable``."""
+        if not patches.strip():
+            return []
+        output = self.backend.execute([self.git, 'patch-id', '--stable'], input=patches)
+        return [tuple(line.split()) for line in output.splitlines()]
+
+    def delete_branches(self, branches):
+        """Deletes local branches, given as ``{name: oid}``, in one transaction.
+
+        ``git update-ref --stdin`` deletes all of them or, if any branch moved
+        in the meantime, none. Their ``branch.<name>`` config goes with them,
+        as with ``git branch -d``, so a new branch of the same name doesn't
+        inherit the upstream.
+        """
+        commands = ''.join(
+            'delete refs/heads/{} {}\n'.format(name, oid) for name, oid in branches.items())
+        configured = set(self.config().subsections('branch'))
+
+        log = self.git_exec(['update-ref', '--stdin'], input=commands)
+        sections = ['branch "{}"'.format(name) for name in branches if name in configured]
+        if sections and not self.fake:
+            # One rewrite of the config file, where ``git config
+            # --remove-section`` would take a process per section.
+            writer = self.repo.config_writer()
+            try:
+                for section in sections:
+                    writer.remove_section(section)
+            finally:
+                writer.release()
+            self._config = None
+        return log
+
     def checkout_branch(self, branch):
         """Checks out given branch."""
 
@@ -209,6 +716,107 @@ class SCMRepo:
             with_extended_output=True)
         return '\n'.join([stderr, stdout])
 
+    def switch_mode(self):
+        """Returns 'worktree' or 'checkout' (the default) from ``legit.switchMode``."""
+        return self.config().get('legit.switchMode', 'checkout')
+
+    def worktree_dir(self):
+        """Returns the directory holding worktrees managed by legit.
+
+        Configurable with ``legit.worktreeDir``, defaults to a
+        ``<repo>.worktrees`` directory next to the main working tree.
+        """
+        main = self.get_worktrees()[0].path
+        path = self.config().get('legit.worktreeDir')
+        if path is not None:
+            path = os.path.expanduser(path)
+            return os.path.normpath(os.path.join(main, path))
+        else:
+            return main + '.worktrees'
+
+    def state_path(self, name):
+        """Returns the path of a legit state file inside the git directory."""
+        return state_path(self.repo.common_dir, name)
+
+    def get_worktrees(self):
+        """Returns all worktrees of the repository, the main one first."""
+        output = self.backend.execute([self.git, 'worktree', 'list', '--porcelain'])
+
+        worktrees = []
+        for block in output.strip().split('\n\n'):
+            attrs = dict(line.partition(' ')[::2] for line in block.splitlines())
+            if 'worktree' not in attrs:
+                continue
+            branch = attrs.get('branch', '')
+            if branch.startswith('refs/heads/'):
+                branch = branch[len('refs/heads/'):]
+            worktrees.append(Worktree(os.path.normpath(attrs['worktree']), branch or None))
+
+        return worktrees
+
+    def switch_worktree(self, branch):
+        """Returns the worktree of ``branch``, adding a managed one if needed."""
+        for worktree in self.get_worktrees():
+            if worktree.branch == branch:
+                path = worktree.path
+                break
+        else:
+            safe_name = re.sub(r'[^\w.-]+', '-', branch)
+            path = os.path.join(self.worktree_dir(), safe_name)
+            self.git_exec(['worktree', 'add', path, branch])
+
+        self.touch_worktree(path)
+        return path
+
+    def _read_worktree_usage(self):
+        return read_state(self.state_path('worktrees.json'), {})
+
+    def touch_worktree(self, path):
+        """Records ``path`` as used just now."""
+        if self.fake:
+            return
+        usage = self._read_worktree_usage()
+        usage[path] = time.time()
+        write_state(self.state_path('worktrees.json'), usage)
+
+    def prune_worktrees(self, keep=()):
+        """Removes idle managed worktrees.
+
+        Worktrees unused for more than ``legit.worktreeMaxAge`` days are
+        removed, then the least recently used ones until at most
+        ``legit.worktreeMaxCount`` are left. Worktrees with local changes are
+        kept, and so are the paths in ``keep``. Returns the removed paths.
+        """
+        config = self.config()
+        max_age = config.get_int('legit.worktreeMaxAge', 30) * 86400
+        max_count = config.get_int('legit.worktreeMaxCount', 10)
+
+        root = os.path.join(self.worktree_dir(), '')
+        usage = self._read_worktree_usage()
+        managed = sorted(
+            (usage.get(w.path, 0), w.path) for w in self.get_worktrees()
+            if w.path.startswith(root))
+
+        now = time.time()
+        candidates = [
+            path for index, (last_used, path) in enumerate(managed)
+            if now - last_used > max_age or len(managed) - index > max_count
+        ]
+
+        removed = []
+        for path in candidates:
+            if path in keep:
+                continue
+            status, _, _ = self.git_exec(
+                ['worktree', 'remove', path], with_extended_output=True, with_exceptions=False)
+            if status == 0:
+                removed.append(path)
+                usage.pop(path, None)
+
+        if removed and not self.fake:
+            write_state(self.state_path('worktrees.json'), usage)
+        return removed
+
     def unpublish_branch(self, branch):
         """Unpublishes given branch."""
 
@@ -227,6 +835,66 @@ class SCMRepo:
         return self.git_exec(
             ['push', '-u', self.remote.name, branch])
 
+    def publish_branches(self, branches):
+        """Publishes all given branches, pushing many refspecs at once."""
+
+        results = self.push_refspecs(
+            ['refs/heads/{0}:refs/heads/{0}'.format(b) for b in branches], set_upstream=True)
+        failed = [r for r in results if not r.ok]
+        if failed:
+            abort('Publish failed for {} of {} branches.'.format(len(failed), len(results)),
+                  log=format_push_results(failed), type='publish')
+
+        return format_push_results(results)
+
+    def unpublish_branches(self, branches):
+        """Unpublishes all given branches, pushing many deletions at once."""
+
+        results = self.push_refspecs([':refs/heads/{}'.format(b) for b in branches])
+        failed = [r for r in results if not r.ok]
+        if failed:
+            _, _, log = self.git_exec(
+                ['fetch', self.remote.name, '--prune'],
+                with_extended_output=True)
+            abort('Unpublish failed for {} of {} branches. Fetching.'.format(
+                len(failed), len(results)),
+                log='{}\n{}'.format(format_push_results(failed), log), type='unpublish')
+
+        return format_push_results(results)
+
+    def push_refspecs(self, refspecs, set_upstream=False):
+        """Pushes ``refspecs`` to the remote and returns a PushStatus per branch.
+
+        Refspecs are sent in chunks of PUSH_CHUNK_SIZE per ``git push`` and
+        the outcome of every ref is read from ``--porcelain`` output.
+        """
+        results = []
+
+        for i in range(0, len(refspecs), PUSH_CHUNK_SIZE):
+            chunk = refspecs[i:i + PUSH_CHUNK_SIZE]
+            command = ['push', '--porcelain']
+            if set_upstream:
+                command.append('-u')
+
+            status, stdout, stderr = self.git_exec(
+                command + [self.remote.name] + chunk,
+                with_extended_output=True, with_exceptions=False)
+            reported = parse_push_porcelain(stdout)
+
+            for refspec in chunk:
+                ref = refspec.split(':', 1)[1]
+                branch = ref[len('refs/heads/'):]
+                if ref in reported:
+                    ok, summary = reported[ref]
+                elif status == 0:
+                    ok, summary = True, ''
+                else:
+                    ok, summary = False, stderr.strip() or 'not pushed'
+
+                results.append(PushStatus(branch, ok, summary))
+
+        return results
+
     def undo(self, hard=False):
         """Makes last commit not exist"""
 
@@ -241,13 +909,13 @@ class SCMRepo:
 
         self.repo_check()
 
-        reader = self.repo.config_reader()
+        config = self.config()
 
         # If there is no remote option in legit section, return default
-        if reader.has_option('legit', 'remote'):
-            remote_name = reader.get('legit', 'remote')
-            if remote_name not in [r.name for r in self.repo.remotes]:
-                if fallback_enabled(reader):
+        if 'legit.remote' in config:
+            remote_name = config.get('legit.remote')
+            if remote_name not in self.get_remote_names():
+                if fallback_enabled(config):
                     return self.get_default_remote()
                 else:
                     click.echo('Remote "{}" does not exist!'.format(remote_name))
@@ -260,126 +928,349 @@ class SCMRepo:
                     else:
                         writer = self.repo.config_writer()
                         writer.set_value('legit', 'remoteFallback', 'true')
+                        writer.release()
+                        self._config = None
                         click.echo('\n`legit.RemoteFallback` changed to true for current repo.')
                         return self.get_default_remote()
             else:
-                return self.repo.remote(remote_name)
+                return Remote(self.repo, remote_name)
         else:
             return self.get_default_remote()
 
     def get_default_remote(self):
-        if len(self.repo.remotes) == 0:
+        remote_names = self.get_remote_names()
+        if len(remote_names) == 0:
             return None
         else:
-            return self.repo.remotes[0]
+            return Remote(self.repo, remote_names[0])
+
+    def get_submodule_paths(self):
+        """Returns the absolute paths of all initialized submodules, recursively."""
+
+        root = self.repo.working_tree_dir
+        output = self.backend.execute(
+            [self.git, 'submodule', 'status', '--recursive'])
+
+        paths = []
+        for line in output.splitlines():
+            # "<state><sha1> <path> (<describe>)", '-' marks uninitialized ones.
+            if not line or line[0] == '-':
+                continue
+            path = line[1:].split(' ', 1)[1].rsplit(' (', 1)[0]
+            paths.append(os.path.join(root, path))
+
+        return paths
 
     def get_current_branch_name(self):
         """Returns current branch name"""
 
         return self.repo.head.ref.name
 
+    def branch_index(self):
+        """Returns the fuzzy BranchIndex of all branches, built once per run."""
+        if self._branch_index is None:
+            from .fuzzy import BranchIndex
+
+            self._branch_index = BranchIndex(self.get_branch_names())
+        return self._branch_index
+
     def fuzzy_match_branch(self, branch):
         if not branch:
             return False
 
-        all_branches = self.get_branch_names()
-        if branch in all_branches:
-            return branch
+        return self.branch_index().resolve(branch) or branch
 
-        def branch_fuzzy_match(b):
-            return b.startswith(branch)
+    def suggest_branches(self, branch):
+        """Returns branch names close to ``branch`` for "did you mean" hints."""
 
-        possible_branches = list(filter(branch_fuzzy_match, all_branches))
+        return self.branch_index().suggest(branch)
 
-        if len(possible_branches) == 1:
-            return possible_branches[0]
+    def for_each_ref(self, fields, *patterns):
+        """Returns one tuple of ``fields`` per ref matching ``patterns``.
 
-        return branch
+        All refs are listed by a single ``git for-each-ref`` call, so the cost
+        grows linearly with the number of refs.
+        """
+        fmt = '%00'.join('%({})'.format(field) for field in fields)
+        output = self.backend.execute(
+            [self.git, 'for-each-ref', '--format={}'.format(fmt)] + list(patterns))
 
-    def get_branches(self, local=True, remote_branches=True, wildcard_pattern='*'):
-        """Returns a list of local and remote branches matching wildcard_pattern."""
+        return [tuple(line.split('\0')) for line in output.splitlines()]
 
-        if not self.repo.remotes:
-            remote_branches = False
+    def rev_parse(self, rev):
+        """Returns the object id ``rev`` resolves to, or None."""
 
-        branches = []
+        return self.backend.resolve(rev)
 
-        if remote_branches:
+    def ref_index(self):
+        """Returns the up to date RefIndex of the repository, or None.
 
-            # Remote refs.
-            try:
-                for b in self.remote.refs:
-                    name = '/'.join(b.name.split('/')[1:])
+        None is returned for repositories whose refs the index can't read,
+        callers then fall back to ``git for-each-ref``.
+        """
+        if self._ref_index is None:
+            from .refindex import RefIndex
+
+            if not RefIndex.is_supported(self.repo.common_dir):
+                return None
+            index = RefIndex(self.repo.git_dir, self.repo.common_dir,
+                             remote=self.remote.name if self.remote else None)
+            self._ref_index = index.load()
+        return self._ref_index
+
+    def get_branches(self, local=True, remote_branches=True, wildcard_pattern='*', live=False,
+                     status=False):
+        """Returns a list of local and remote branches matching wildcard_pattern.
+
+        With ``live``, the published branches are the ones the remote has
+        right now (see ``get_live_heads``) instead of the remote-tracking
+        branches of the last fetch. With ``status``, the ahead/behind counts
+        of the local branches are filled in (see ``with_status``).
+        """
 
-                    if name not in legit_settings.forbidden_branches:
-                        branches.append(Branch(name, is_published=True))
-            except (IndexError, AssertionError):
-                pass
+        if not self.get_remote_names() or self.remote is None:
+            remote_branches = False
+        if not local and not remote_branches:
+            return []
 
-        if local:
+        forbidden = set(legit_settings.forbidden_branches)
+        published = set()
+        unpublished = set()
 
-            # Local refs.
-            for b in [h.name for h in self.repo.heads]:
+        if remote_branches and live:
+            published.update(self.get_live_heads())
+            remote_branches = False
 
-                if (not remote_branches) or (b not in [br.name for br in branches]):
-                    if b not in legit_settings.forbidden_branches:
-                        branches.append(Branch(b, is_published=False))
+        refs = self.ref_index()
+        if refs is not None:
+            if local:
+                unpublished.update(refs.local)
+            if remote_branches:
+                published.update(refs.published)
+        elif local or remote_branches:
+            patterns = []
+            if local:
+                patterns.append('refs/heads/')
+            if remote_branches:
+                remote_prefix = 'refs/remotes/{}/'.format(self.remote.name)
+                patterns.append(remote_prefix)
+
+            for (refname,) in self.for_each_ref(['refname'], *patterns):
+                if refname.startswith('refs/heads/'):
+                    unpublished.add(refname[len('refs/heads/'):])
+                elif remote_branches and refname.startswith(remote_prefix):
+                    published.add(refname[len(remote_prefix):])
+
+        unpublished -= published
+
+        # Same semantics as fnmatch.filter, but the pattern is compiled once.
+        match = re.compile(fnmatch.translate(os.path.normcase(wildcard_pattern))).match
+        branches = [
+            Branch(name, is_published=is_published)
+            for names, is_published in ((published, True), (unpublished, False))
+            for name in names
+            if name not in forbidden and match(os.path.normcase(name))
+        ]
+        branches.sort(key=attrgetter('name'))
+
+        return self.with_status(branches) if status else branches
+
+    def with_status(self, branches):
+        """Returns ``branches`` as BranchStatus, counted by ``get_ahead_behind``."""
+        counts = self.get_ahead_behind([branch.name for branch in branches])
+
+        return [BranchStatus(*branch, *counts.get(branch.name, (None, None)))
+                for branch in branches]
+
+    def get_branch_names(self, local=True, remote_branches=True, live=False):
+
+        branches = self.get_branches(local=local, remote_branches=remote_branches, live=live)
 
-        matching_branch_names = fnmatch.filter(
-            [branch.name for branch in branches], wildcard_pattern
-        )
-        branches = [branch for branch in branches if branch.name in matching_branch_names]
+        return [b.name for b in branches]
 
-        return sorted(branches, key=attrgetter('name'))
+    def get_live_heads(self):
+        """Returns ``{branch: oid}`` for the branches the remote has right now.
 
-    def get_branch_names(self, local=True, remote_branches=True):
+        ``git ls-remote --heads`` is only run when the answer cached in
+        ``.git/legit/`` is older than ``legit.lsRemoteTTL`` seconds (60 by
+        default). Pushes made by legit drop the cached answer.
+        """
+        path = self.state_path(live_heads_name(self.remote.name))
+        ttl = self.config().get_int('legit.lsRemoteTTL', LS_REMOTE_TTL)
+
+        cached = read_state(path)
+        if (isinstance(cached, dict) and cached.get('url') == self.remote_url() and
+                0 <= time.time() - cached.get('time', 0) < ttl):
+            return cached['heads']
+
+        output = self.backend.execute([self.git, 'ls-remote', '--heads', self.remote.name])
+        heads = {}
+        for line in output.splitlines():
+            oid, _, refname = line.partition('\t')
+            if refname.startswith('refs/heads/'):
+                heads[refname[len('refs/heads/'):]] = oid
+
+        if ttl > 0:
+            write_state(path, {'time': time.time(), 'url': self.remote_url(), 'heads': heads})
+        return heads
+
+    def forget_live_heads(self):
+        """Drops the cached ``ls-remote`` answer of the remote."""
+        if self.remote is None:
+            return
+        try:
+            os.unlink(self.state_path(live_heads_name(self.remote.name)))
+        except FileNotFoundError:
+            pass
 
-        branches = self.get_branches(local=local, remote_branches=remote_branches)
+    def remote_url(self):
+        return self.config().get('remote.{}.url'.format(self.remote.name))
 
-        return [b.name for b in branches]
+    def display_available_branches(self, wildcard_pattern='*', limit=None, pager=False,
+                                   live=False, status=False):
+        """Displays available branches.
 
-    def display_available_branches(self, wildcard_pattern='*'):
-        """Displays available branches."""
+        At most ``limit`` branches are shown, and the output goes through
+        the pager if ``pager`` is True. With ``live``, the published status
+        reflects the remote as it is now. With ``status``, the shown
+        branches get a column of how far ahead/behind their upstream they are.
+        """
 
-        if not self.repo.remotes:
+        if not self.get_remote_names():
             remote_branches = False
         else:
             remote_branches = True
 
         branches = self.get_branches(
-            local=True, remote_branches=remote_branches, wildcard_pattern=wildcard_pattern
+            local=True, remote_branches=remote_branches, wildcard_pattern=wildcard_pattern,
+            live=live
         )
         if not branches:
             click.echo(crayons.red('No branches available'))
             return
 
-        branch_col = len(max([b.name for b in branches], key=len)) + 1
-
-        for branch in branches:
-
+        refs = self.ref_index()
+        if refs is not None:
+            current_branch = refs.head
+        else:
             try:
-                branch_is_selected = (branch.name == self.get_current_branch_name())
+                current_branch = self.get_current_branch_name()
             except TypeError:
-                branch_is_selected = False
-
-            marker = '*' if branch_is_selected else ' '
-            color = colored.green if branch_is_selected else colored.yellow
-            pub = '(published)' if branch.is_published else '(unpublished)'
-
-            click.echo(columns(
-                [colored.red(marker), 2],
-                [color(branch.name, bold=True), branch_col],
-                [black(pub), 14]
-            ))
-
-
-# Instead of getboolean('legit', 'remoteFallback', fallback=False)
-# since getboolean in Python 2 does not have fallback argument.
-def fallback_enabled(reader):
-    if reader.has_option('legit', 'remoteFallback'):
-        return reader.getboolean('legit', 'remoteFallback')
-    else:
-        return False
+                current_branch = None
+
+        hidden = 0
+        if limit and len(branches) > limit:
+            hidden = len(branches) - limit
+            branches = branches[:limit]
+        if status:
+            branches = self.with_status(branches)
+
+        chunks = render_branches(branches, current_branch, status=status)
+        if pager:
+            click.echo_via_pager(chunks)
+        else:
+            for chunk in chunks:
+                click.echo(chunk, nl=False)
+
+        if hidden:
+            click.echo(black('... {} more branches, use --limit 0 to show all'.format(hidden)))
+
+
+def color_codes(colorize):
+    """Returns the ``(start, end)`` escape codes ``colorize`` wraps text with."""
+    start, _, end = str(colorize('\0')).partition('\0')
+    return start, end
+
+
+def render_branches(branches, current_branch, chunk_size=RENDER_CHUNK_SIZE, status=False):
+    """Yields the rows of the branch list, ``chunk_size`` rows per string.
+
+    The rows look like the ones ``clint.textui.columns`` lays out, but the
+    color codes are looked up once, so each row is a single string format.
+    With ``status``, a column shows the ahead/behind counts of each branch.
+    """
+    branch_col = max(len(branch.name) for branch in branches) + 1
+
+    marker_start, marker_end = color_codes(colored.red)
+    selected = color_codes(colored.green)
+    unselected = color_codes(colored.yellow)
+
+    rows = []
+    for branch in branches:
+        is_selected = branch.name == current_branch
+        start, end = selected if is_selected else unselected
+        rows.append('{}{}{}  {}{}{}{} {:<14} \n'.format(
+            marker_start, '*' if is_selected else ' ', marker_end,
+            start, branch.name, end, ' ' * (branch_col - len(branch.name)),
+            '(published)' if branch.is_published else '(unpublished)'))
+        if status:
+            rows[-1] = '{}{}\n'.format(rows[-1][:-1], format_track(branch.ahead, branch.behind))
+        if len(rows) == chunk_size:
+            yield ''.join(rows)
+            rows = []
+
+    if rows:
+        yield ''.join(rows)
+
+
+def fallback_enabled(config):
+    return config.get_bool('legit.remoteFallback', False)
+
+
+def is_legit_stash(subject, branch, verb):
+    """Returns True if a stash reflog ``subject`` is a legit stash of ``branch``.
+
+    Stashes are recognized by their tag, with a fallback on the message
+    format of older legit (and GitHub client) versions.
+    """
+    match = LEGIT_STASH_TAG_RE.search(subject)
+    if match:
+        return match.group('branch') == branch and match.group('verb') == verb
+
+    legacy_verb = 'syncing' if verb == 'sync' else 'switching'
+    return (
+        ('Legit' in subject or 'GitHub' in subject) and
+        subject.startswith('On {}:'.format(branch)) and
+        legacy_verb in subject
+    )
+
+
+def parse_push_porcelain(output):
+    """Maps each ref of ``git push --porcelain`` output to ``(ok, summary)``."""
+    reported = {}
+
+    for line in output.splitlines():
+        parts = line.split('\t')
+        if len(parts) < 3 or ':' not in parts[1]:
+            continue
+        flag, refspec, summary = parts[0], parts[1], parts[2]
+        reported[refspec.split(':', 1)[1]] = (flag != '!', summary)
+
+    return reported
+
+
+def format_push_results(results):
+    return '\n'.join('{} {}'.format(r.branch, r.summary) for r in results)
+
+
+def parse_track(track):
+    """Parses ``%(upstream:track)`` output like ``[ahead 1, behind 2]``."""
+    ahead = re.search(r'ahead (\d+)', track)
+    behind = re.search(r'behind (\d+)', track)
+
+    return (int(ahead.group(1)) if ahead else 0,
+            int(behind.group(1)) if behind else 0)
+
+
+def format_track(ahead, behind):
+    """Formats ahead/behind counts like ``%(upstream:track)`` does, without brackets."""
+    if ahead is None:
+        return ''
+    if not ahead and not behind:
+        return 'up to date'
+    return ', '.join(
+        '{} {}'.format(word, count) for word, count in (('ahead', ahead), ('behind', behind))
+        if count)
 
 
 class Aborted:
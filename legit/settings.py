@@ -6,6 +6,15 @@ This module provides the Legit settings feature set.
 
 """
 
+import os
+import sys
+
+BOOLEAN_STATES = {
+    'true': True, '1': True, 'yep': True, 'sure': True, 'yes': True, 'on': True,
+    'false': False, '0': False, 'nope': False, 'nadda': False, 'nah': False,
+    'no': False, 'off': False,
+}
+
 
 class Settings:
     _singleton = {}
@@ -40,14 +49,6 @@ class Settings:
         self.__dict__.update(self.__cache.copy())
         del self.__cache
 
-    def __getattribute__(self, key):
-        if key in object.__getattribute__(self, '__attrs__'):
-            try:
-                return object.__getattribute__(self, key)
-            except AttributeError:
-                return None
-        return object.__getattribute__(self, key)
-
 
 legit_settings = Settings()
 
@@ -62,3 +63,164 @@ legit_settings.config_defaults = (
 
 legit_settings.update_url = 'https://api.github.com/repos/frostming/legit/tags'
 legit_settings.forbidden_branches = ['HEAD']
+
+
+class UserSettings:
+    """Typed, validated view of the user configuration file."""
+
+    __slots__ = tuple(option for (option, _, _) in legit_settings.config_defaults)
+
+    def __init__(self, **values):
+        for (option, default, _) in legit_settings.config_defaults:
+            value = to_bool(values.get(option))
+            setattr(self, option, to_bool(default) if value is None else value)
+
+    def as_dict(self):
+        return {option: getattr(self, option) for option in self.__slots__}
+
+
+def to_bool(value):
+    """Maps a boolean-ish string (or bool) to a bool, or None if it isn't one."""
+    if isinstance(value, bool) or value is None:
+        return value
+    return BOOLEAN_STATES.get(str(value).strip().lower())
+
+
+def user_config_dir():
+    """Returns the directory which holds ``config.ini``."""
+    if sys.platform.startswith('win'):
+        from clint.packages.appdirs import user_data_dir
+        return user_data_dir('legit', 'kennethreitz')
+    elif sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Application Support/legit')
+    return os.path.join(os.getenv('XDG_CONFIG_HOME', os.path.expanduser('~/.config')), 'legit')
+
+
+def user_config_path():
+    return os.path.join(user_config_dir(), 'config.ini')
+
+
+def user_cache_dir():
+    """Returns the directory which holds legit's caches of user files."""
+    if sys.platform.startswith('win'):
+        from clint.packages.appdirs import user_cache_dir
+        return user_cache_dir('legit', 'kennethreitz')
+    elif sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Caches/legit')
+    return os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'legit')
+
+
+def settings_cache_path():
+    return os.path.join(user_cache_dir(), 'settings.json')
+
+
+_cache = {}
+
+
+def load_settings(path=None, environ=os.environ):
+    """Loads the user settings.
+
+    The parsed result is cached in memory and in the user cache directory,
+    keyed by the file's path, mtime and size, so the INI file is only parsed
+    after it has been changed. Nothing is written to the config directory.
+    Every option can be overridden by a ``LEGIT_<OPTION>`` environment
+    variable.
+    """
+    path = path or user_config_path()
+
+    try:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        key = None
+
+    values = {}
+    if key is not None:
+        values = _cache.get(key)
+        if values is None:
+            values = _read_cache_file(key)
+        if values is None:
+            values = _parse_config(path)
+            _write_cache_file(key, values)
+        _cache[key] = values
+
+    for option in UserSettings.__slots__:
+        override = environ.get('LEGIT_{}'.format(option.upper()))
+        if override is not None:
+            values = dict(values, **{option: override})
+
+    return UserSettings(**values)
+
+
+def _read_cache_file(key):
+    import json
+
+    try:
+        with open(settings_cache_path()) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('key') != list(key):
+        return None
+    return cached.get('values')
+
+
+def _write_cache_file(key, values):
+    import json
+
+    cache_path = settings_cache_path()
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': list(key), 'values': values}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def _parse_config(path):
+    import configparser
+
+    config = configparser.ConfigParser()
+    try:
+        config.read(path)
+    except configparser.Error:
+        return {}
+    if not config.has_section('legit'):
+        return {}
+
+    values = {}
+    for option in UserSettings.__slots__:
+        value = to_bool(config.get('legit', option, fallback=None))
+        if value is not None:
+            values[option] = value
+    return values
+
+
+def write_default_settings(path=None):
+    """Adds missing options with their defaults to the config file."""
+    import configparser
+
+    path = path or user_config_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    config = configparser.ConfigParser()
+    config.read(path)
+    if not config.has_section('legit'):
+        config.add_section('legit')
+
+    modified = False
+    for (option, default, _) in legit_settings.config_defaults:
+        if not config.has_option('legit', option):
+            config.set('legit', option, default)
+            modified = True
+
+    if modified or not os.path.exists(path):
+        with open(path, 'w') as f:
+            config.write(f)
+    return path
+
+
+for _option, _value in UserSettings().as_dict().items():
+    setattr(legit_settings, _option, _value)
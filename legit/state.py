@@ -0,0 +1,47 @@
+"""
+legit.state
+~~~~~~~~~~~
+
+This module stores legit's per-repository state under ``.git/legit/``.
+"""
+
+import os
+
+# Default of legit.lsRemoteTTL, in seconds.
+LS_REMOTE_TTL = 60
+
+
+def state_path(common_dir, name):
+    """Returns the path of the legit state file ``name`` of a repository."""
+    return os.path.join(common_dir, 'legit', name)
+
+
+def live_heads_name(remote_name):
+    """Returns the name of the state file caching ``ls-remote`` of a remote."""
+    return 'ls-remote-{}.json'.format(remote_name)
+
+
+def read_state(path, default=None, object_pairs_hook=None):
+    """Returns the JSON content of a state file, or ``default`` if unreadable.
+
+    ``object_pairs_hook`` is passed on to ``json.load``, such as
+    ``OrderedDict`` to keep the order of the keys.
+    """
+    import json
+
+    try:
+        with open(path) as f:
+            return json.load(f, object_pairs_hook=object_pairs_hook)
+    except (OSError, ValueError):
+        return default
+
+
+def write_state(path, data):
+    """Atomically writes a state file as JSON."""
+    import json
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
@@ -0,0 +1,31 @@
+import os
+import subprocess
+
+import pytest
+
+# The source checkout holding the legit package.
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def git(path, *args):
+    return subprocess.check_output(('git', '-C', str(path)) + args, universal_newlines=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A repository whose 'master' and 'feature/login' are published.
+
+    'feature/logout' and 'fix-typo' are local branches only.
+    """
+    remote = tmp_path / 'remote.git'
+    work = tmp_path / 'work'
+    git(tmp_path, 'init', '-q', '--bare', '-b', 'master', str(remote))
+    git(tmp_path, 'init', '-q', '-b', 'master', str(work))
+    git(work, 'config', 'user.name', 'Legit')
+    git(work, 'config', 'user.email', 'legit@example.com')
+    git(work, 'commit', '-q', '--allow-empty', '-m', 'root commit')
+    for branch in ('feature/login', 'feature/logout', 'fix-typo'):
+        git(work, 'branch', branch)
+    git(work, 'remote', 'add', 'origin', str(remote))
+    git(work, 'push', '-q', 'origin', 'master', 'feature/login')
+    return work
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+from git import Repo
+
+from legit.backend import PersistentBackend, is_read_only
+
+
+@pytest.fixture
+def backend():
+    pwd = os.getcwd()
+    os.chdir("test_repo")
+    backend = PersistentBackend(Repo(search_parent_directories=True))
+    yield backend
+    backend.close()
+    os.chdir(pwd)
+
+
+def test_is_read_only():
+    assert is_read_only(['stash', 'list'])
+    assert is_read_only(['for-each-ref', '--format=%(refname)'])
+    assert not is_read_only(['stash', 'save'])
+    assert not is_read_only(['push', 'origin', 'master'])
+
+
+def test_resolve_reuses_cat_file(backend):
+    head = backend.resolve('HEAD')
+    assert head == backend.repo.head.commit.hexsha
+    proc = backend.cat_file.proc
+    assert backend.resolve('HEAD^') == backend.repo.head.commit.parents[0].hexsha
+    assert backend.resolve('no-such-branch') is None
+    assert backend.cat_file.proc is proc
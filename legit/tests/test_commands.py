@@ -6,6 +6,8 @@ from click.testing import CliRunner
 from legit.cli import cli
 from legit.core import __version__
 
+from .conftest import git
+
 
 @pytest.fixture
 def runner():
@@ -30,6 +32,9 @@ def test_help(runner):
     assert "Options" in result.output
     assert "Usage Examples" in result.output
     assert "Commands" in result.output
+    assert "legit prune" in result.output
+    assert "legit prefetch" in result.output
+    assert "legit daemon" in result.output
 
 
 @pytest.mark.cli
@@ -203,3 +208,167 @@ def test_branches_with_wildcard(runner):
     """Test branches command with wildcard filename pattern"""
     result = runner.invoke(cli, ["branches", "ma*"])
     assert result.exit_code == 0
+
+
+@pytest.mark.cli
+def test_branches_published_status(runner):
+    """Test branches command marks remote branches as published"""
+    result = runner.invoke(cli, ["branches", "master"])
+    assert result.exit_code == 0
+    assert "master" in result.output
+    assert "(published)" in result.output
+
+
+@pytest.mark.cli
+def test_sync_all_remotes(runner):
+    """Test sync command fetching every remote first"""
+    result = runner.invoke(cli, ["sync", "--all-remotes", "--fake"])
+    assert result.exit_code == 0
+    assert "Fetching from origin." in result.output
+    assert "origin ok" in result.output
+    assert "Faked! >>> git fetch origin" in result.output
+    # The remote has just been fetched, smart_pull doesn't fetch it again.
+    assert result.output.count("git fetch") == 1
+
+
+@pytest.mark.cli
+def test_timings(runner, tmp_path):
+    """Test --timings summary and LEGIT_TRACE trace file"""
+    trace_file = tmp_path / "trace.json"
+    result = runner.invoke(cli, ["--timings", "sync", "--fake"],
+                           env={"LEGIT_TRACE": str(trace_file)})
+    assert result.exit_code == 0
+    assert "legit sync" in result.output
+    assert "  Pulling commits from the server." in result.output
+    assert trace_file.exists()
+
+
+@pytest.mark.cli
+def test_sync_reads_config_once(runner, monkeypatch):
+    """Test sync command parses the git config a single time"""
+    from legit.config import GitConfig
+
+    parses = []
+    parse = GitConfig.parse.__func__
+    monkeypatch.setattr(GitConfig, "parse", classmethod(
+        lambda cls, *args, **kwargs: parses.append(args) or parse(cls, *args, **kwargs)))
+
+    result = runner.invoke(cli, ["sync", "--fake"])
+    assert result.exit_code == 0
+    assert len(parses) == 1
+
+
+@pytest.mark.cli
+def test_branches_with_limit(runner):
+    """Test branches command shows at most --limit branches"""
+    result = runner.invoke(cli, ["branches", "--limit", "1"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert len(lines) == 2
+    assert "1 more branches" in lines[1]
+
+
+@pytest.mark.cli
+def test_sync_workspace(runner, tmp_path):
+    """Test sync command over a workspace manifest"""
+    manifest = tmp_path / "workspace.txt"
+    manifest.write_text("# repositories\n{}\n{}\n".format(
+        os.getcwd(), tmp_path / "missing"))
+    result = runner.invoke(cli, ["sync", "--workspace", str(manifest), "--fake"])
+    assert result.exit_code == 1
+    assert "Pulling commits from the server." in result.output
+    assert "1 succeeded, 1 failed." in result.output
+    assert "No such directory." in result.output
+
+
+def test_workspace_child_environment(tmp_path, monkeypatch):
+    """Test only a source checkout is put on the PYTHONPATH of children"""
+    from legit import workspace
+
+    checkout = os.path.dirname(os.path.dirname(os.path.abspath(workspace.__file__)))
+    assert workspace.child_environment()['PYTHONPATH'].split(os.pathsep)[0] == checkout
+
+    site_packages = tmp_path / "site-packages"
+    (site_packages / "legit").mkdir(parents=True)
+    monkeypatch.setattr(workspace, "__file__", str(site_packages / "legit" / "workspace.py"))
+    assert workspace.child_environment() is None
+
+
+@pytest.mark.cli
+def test_sync_workspace_with_branch(runner, tmp_path):
+    """Test sync command rejects a branch in workspace mode"""
+    result = runner.invoke(cli, ["sync", "master", "--recurse-submodules", "--fake"])
+    assert result.exit_code == 2
+
+
+@pytest.mark.cli
+def test_sync_all(runner):
+    """Test sync command for all published branches"""
+    result = runner.invoke(cli, ["sync", "--all", "--fake"])
+    assert result.exit_code == 0
+    assert "Fetching from origin." in result.output
+    assert "Faked! >>> git fetch origin" in result.output
+
+
+@pytest.mark.cli
+def test_sync_all_with_branch(runner):
+    """Test sync --all rejects a branch argument"""
+    result = runner.invoke(cli, ["sync", "master", "--all", "--fake"])
+    assert result.exit_code == 2
+    assert "Faked!" not in result.output
+
+
+@pytest.mark.cli
+def test_unpublish_pattern(runner):
+    """Test unpublish command with a wildcard pattern"""
+    result = runner.invoke(cli, ["unpublish", "mas*", "--fake"])
+    assert result.exit_code == 0
+    assert "Unpublishing 1 branches." in result.output
+    assert "Faked! >>> git push --porcelain origin :refs/heads/master" in result.output
+
+
+@pytest.mark.cli
+def test_publish_pattern_no_match(runner):
+    """Test publish command with a wildcard pattern matching nothing"""
+    result = runner.invoke(cli, ["publish", "no-such-branch-*", "--fake"])
+    assert result.exit_code == 2
+    assert "No unpublished branches match" in result.output
+    assert "Faked!" not in result.output
+
+
+@pytest.mark.cli
+def test_prune(runner):
+    """Test prune command deleting branches merged into master"""
+    result = runner.invoke(cli, ["prune", "--fake"])
+    assert result.exit_code == 0
+    assert "Branches merged into master" in result.output
+    assert "Faked! >>> git update-ref --stdin" in result.output
+    assert "delete refs/heads/dev" in result.output
+    assert "refs/heads/master" not in result.output
+
+
+@pytest.mark.cli
+def test_prune_unknown_target(runner):
+    result = runner.invoke(cli, ["prune", "no-such-branch", "--fake"])
+    assert result.exit_code == 2
+    assert "Faked!" not in result.output
+
+
+@pytest.mark.cli
+def test_sync_all_skips_branches_of_other_worktrees(repo, tmp_path, monkeypatch):
+    """Test sync --all leaves branches checked out in other worktrees alone"""
+    git(repo, 'push', '-q', 'origin', 'fix-typo')
+    git(repo, 'worktree', 'add', '-q', str(tmp_path / 'login'), 'feature/login')
+    old_login = git(repo, 'rev-parse', 'feature/login')
+    git(repo, 'commit', '-q', '--allow-empty', '-m', 'remote commit')
+    git(repo, 'push', '-q', 'origin', 'HEAD:feature/login', 'HEAD:fix-typo')
+    git(repo, 'reset', '-q', '--hard', 'HEAD~1')
+
+    monkeypatch.chdir(str(repo))
+    result = CliRunner().invoke(cli, ["sync", "--all"])
+    assert result.exit_code == 0, result.output
+    assert "Fast-forwarding fix-typo." in result.output
+    assert "checked out in another worktree, sync them there): feature/login" in result.output
+    assert git(repo, 'rev-parse', 'feature/login') == old_login
+    assert git(repo, 'rev-parse', 'fix-typo') == git(repo, 'rev-parse', 'origin/fix-typo')
+    assert 'legit: fast-forward to origin' in git(repo, 'reflog', '-1', 'fix-typo')
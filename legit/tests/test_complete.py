@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from legit.cli import cli
+from legit.complete import complete, find_git_dirs
+from legit.completion import SCRIPTS
+from legit.fuzzy import BranchIndex
+
+from .conftest import ROOT, git
+
+
+def test_complete_branches(repo, monkeypatch):
+    assert complete(['switch'], cwd=str(repo)) == [
+        'feature/login', 'feature/logout', 'fix-typo', 'master']
+    assert complete(['sync', 'feature/'], cwd=str(repo)) == ['feature/login', 'feature/logout']
+    assert complete(['publish', ''], cwd=str(repo)) == ['feature/logout', 'fix-typo']
+    assert complete(['unpublish', ''], cwd=str(repo)) == ['feature/login', 'master']
+    # Without a name starting with it, the input is matched fuzzily.
+    assert complete(['switch', 'typo'], cwd=str(repo)) == ['fix-typo']
+    assert complete(['publish', 'logt'], cwd=str(repo)) == ['feature/logout']
+    assert complete(['unpublish', 'logt'], cwd=str(repo)) == []
+    assert complete(['undo', ''], cwd=str(repo)) == []
+    assert complete(['unknown', ''], cwd=str(repo)) == []
+    assert os.path.exists(str(repo / '.git' / 'legit' / 'completion.txt'))
+    assert os.path.exists(str(repo / '.git' / 'legit' / 'completion-index.txt'))
+
+    # While the refs are unchanged, the stored index is loaded, not built again.
+    def fail(self):
+        raise AssertionError('branch index built again')
+
+    with monkeypatch.context() as patched:
+        patched.setattr('legit.complete.RACY_WINDOW', 0)
+        assert complete(['switch', 'ftyp'], cwd=str(repo)) == ['fix-typo']
+        patched.setattr(BranchIndex, '_build_segment_indexes', fail)
+        assert complete(['switch', 'ftyp'], cwd=str(repo)) == ['fix-typo']
+
+    # Symbolic refs aren't branches to complete.
+    git(repo, 'symbolic-ref', 'refs/heads/alias', 'refs/heads/master')
+    assert 'alias' not in complete(['switch', ''], cwd=str(repo))
+
+    git(repo, 'branch', 'feature/signup')
+    git(repo, 'pack-refs', '--all')
+    git(repo, 'branch', '-D', 'fix-typo')
+    assert complete(['publish', 'f'], cwd=str(repo)) == ['feature/logout', 'feature/signup']
+
+
+def test_complete_from_live_heads(repo, monkeypatch):
+    from legit.scm import SCMRepo
+
+    # Published behind legit's back, the remote-tracking branch doesn't know.
+    git(repo, 'push', '-q', 'origin', 'fix-typo')
+    git(repo, 'update-ref', '-d', 'refs/remotes/origin/fix-typo')
+    assert complete(['unpublish', ''], cwd=str(repo)) == ['feature/login', 'master']
+
+    monkeypatch.chdir(str(repo))
+    SCMRepo().get_live_heads()
+    assert complete(['unpublish', ''], cwd=str(repo)) == ['feature/login', 'fix-typo', 'master']
+    assert complete(['publish', ''], cwd=str(repo)) == ['feature/logout']
+
+    git(repo, 'config', 'legit.lsRemoteTTL', '0')
+    assert complete(['unpublish', ''], cwd=str(repo)) == ['feature/login', 'master']
+
+
+def test_complete_from_worktree(repo, tmp_path):
+    worktree = tmp_path / 'worktree'
+    git(repo, 'worktree', 'add', '-q', str(worktree), 'fix-typo')
+    subdirectory = worktree / 'sub'
+    subdirectory.mkdir()
+
+    git_dir, common_dir = find_git_dirs(str(subdirectory))
+    assert os.path.samefile(common_dir, str(repo / '.git'))
+    assert complete(['unpublish', 'm'], cwd=str(subdirectory)) == ['master']
+    assert complete(['switch', ''], cwd=str(tmp_path)) == []
+
+
+@pytest.mark.parametrize('shell, path', [
+    ('bash', 'extra/bash-completion/legit'),
+    ('zsh', 'extra/zsh-completion/_legit'),
+])
+def test_completion_scripts_up_to_date(shell, path):
+    with open(os.path.join(ROOT, path)) as f:
+        assert f.read() == SCRIPTS[shell](cli), \
+            'regenerate it with: python -m legit.completion {} > {}'.format(shell, path)
@@ -0,0 +1,46 @@
+import pytest
+
+from legit.config import GitConfig
+
+OUTPUT = (
+    'system\0core.editor\nvim\0'
+    'global\0pull.rebase\ntrue\0'
+    'local\0pull.rebase\nfalse\0'
+    'local\0legit.worktreemaxage\n2k\0'
+    'local\0legit.smartmerge\0'
+    'local\0remote.origin.url\n/srv/origin.git\0'
+    'local\0remote.origin.fetch\n+refs/heads/*:refs/remotes/origin/*\0'
+    'local\0remote.my.fork.url\n/srv/fork.git\0'
+    'local\0remote.pushdefault\norigin\0'
+    'local\0branch.Feature.remote\norigin\0'
+)
+
+
+def test_parse_and_typed_getters():
+    config = GitConfig.parse(OUTPUT)
+    assert config.get('core.editor') == 'vim'
+    assert config.get('Core.Editor') == 'vim'
+    assert config.get('core.pager', 'less') == 'less'
+
+    # The last value wins, but all of them are kept.
+    assert config.get_bool('pull.rebase') is False
+    assert config['pull.rebase'] == ('true', 'false')
+    assert config.scope('pull.rebase') == 'local'
+
+    # A key without value is true.
+    assert config.get_bool('legit.smartMerge') is True
+    assert config.get_bool('legit.remoteFallback', False) is False
+    assert config.get_int('legit.worktreeMaxAge') == 2048
+    assert config.get_int('legit.worktreeMaxCount', 10) == 10
+    with pytest.raises(ValueError):
+        config.get_bool('core.editor')
+
+    assert 'branch.Feature.remote' in config
+    assert 'branch.feature.remote' not in config
+    assert config.subsections('remote') == ['origin', 'my.fork']
+
+
+def test_parse_without_scope():
+    config = GitConfig.parse('user.name\nLegit\0legit.remote\nupstream\0', with_scope=False)
+    assert dict(config) == {'user.name': ('Legit',), 'legit.remote': ('upstream',)}
+    assert config.scope('user.name') is None
@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from legit.daemon import Daemon, decode_request, encode_request, socket_path
+
+from .conftest import ROOT, git
+
+
+@pytest.fixture
+def environ(tmp_path):
+    runtime_dir = tmp_path / 'runtime'
+    runtime_dir.mkdir(mode=0o700)
+    environ = dict(os.environ, XDG_RUNTIME_DIR=str(runtime_dir), PYTHONPATH=ROOT)
+    environ.pop('LEGIT_DAEMON', None)
+    return environ
+
+
+def legit(repo, environ, *args):
+    return subprocess.run(
+        [sys.executable, '-m', 'legit'] + list(args), cwd=str(repo), env=environ,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+
+@pytest.fixture
+def daemon(repo, environ, tmp_path):
+    log = open(str(tmp_path / 'daemon.log'), 'w+')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'legit', 'daemon', '--idle-timeout', '60'],
+        cwd=str(repo), env=environ, stdout=log, stderr=subprocess.STDOUT)
+    path = socket_path(environ)
+    deadline = time.time() + 20
+    while not os.path.exists(path):
+        assert process.poll() is None and time.time() < deadline, 'the daemon did not start'
+        time.sleep(0.05)
+    yield log
+    process.terminate()
+    process.wait(10)
+    log.close()
+    assert not os.path.exists(path)
+
+
+def test_request_encoding():
+    data = encode_request('run', '/tmp/r\xe9po', ['sync', ''], {'A': 'x=y', 'B': ''})
+    assert decode_request(data)[2:] == ('/tmp/r\xe9po', ['sync', ''], {'A': 'x=y', 'B': ''})
+
+
+def test_warm_up_closes_git_processes(repo, tmp_path):
+    daemon = Daemon(str(tmp_path / 'daemon.sock'))
+    scm = daemon.warm_up(str(repo), dict(os.environ))
+    assert scm.rev_parse('HEAD')
+    assert scm.backend._cat_file is not None
+
+    # Forked children would share the pipes of the daemon's cat-file.
+    assert daemon.warm_up(str(repo), dict(os.environ)) is scm
+    assert scm.backend._cat_file is None
+
+
+@pytest.mark.cli
+def test_daemon_runs_commands(repo, environ, daemon):
+    in_process = legit(repo, dict(environ, LEGIT_DAEMON='0'), 'branches')
+    result = legit(repo, environ, 'branches')
+    assert result.returncode == 0
+    assert result.stdout == in_process.stdout
+    assert 'feature/logout' in result.stdout
+
+    git(repo, 'branch', 'other')
+    assert 'other' in legit(repo, environ, 'branches').stdout
+
+    result = legit(repo, environ, 'sync', 'feature/logout')
+    assert result.returncode == 2
+    assert 'is not published' in result.stdout
+
+    daemon.seek(0)
+    assert daemon.read().count('legit branches in') == 2
+    assert 'running' in legit(repo, environ, 'daemon', '--status').stdout
+
+
+@pytest.mark.cli
+def test_daemon_reports_errors(repo, environ, daemon, tmp_path):
+    git(repo, 'remote', 'set-url', 'origin', str(tmp_path / 'missing.git'))
+    result = legit(repo, environ, 'publish', 'fix-typo')
+    assert result.returncode == 1
+    assert 'Publishing fix-typo.' in result.stdout
+    assert 'GitCommandError' in result.stdout
+    assert 'does not appear to be a git repository' in result.stdout
+
+
+@pytest.mark.cli
+def test_client_falls_back_without_daemon(repo, environ):
+    result = legit(repo, environ, 'branches')
+    assert result.returncode == 0
+    assert 'feature/logout' in result.stdout
+
+    result = legit(repo, environ, 'daemon', '--status')
+    assert result.returncode == 1
+    assert 'not running' in result.stdout
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from legit.fuzzy import BranchIndex
+
+BRANCHES = [
+    'master', 'develop', 'feature/add-login', 'feature/add-logout',
+    'fix/login_redirect', 'release-1.0', 'release-1.1',
+]
+
+
+def test_resolve_exact_and_unique_prefix():
+    index = BranchIndex(BRANCHES)
+    assert index.resolve('master') == 'master'
+    assert index.resolve('mas') == 'master'
+    assert index.resolve('dev') == 'develop'
+    # Two completions are equally good.
+    assert index.resolve('release') is None
+    assert index.resolve('feature/add-log') is None
+
+
+def test_resolve_segment_prefix():
+    index = BranchIndex(BRANCHES)
+    assert index.resolve('redirect') == 'fix/login_redirect'
+    assert index.resolve('logout') == 'feature/add-logout'
+    assert index.resolve('login') is None
+
+
+def test_rank_and_suggestions():
+    index = BranchIndex(BRANCHES)
+    ranked = index.rank('fal')
+    assert [name for _, name in ranked] == ['feature/add-login', 'feature/add-logout']
+
+    assert index.resolve('mstr') is None
+    assert index.suggest('mstr') == ['master']
+    assert index.suggest('zzz') == []
+
+
+def test_stored_index():
+    names = BRANCHES + ['Feature/UPPER', 'release/1.0-hotfix', 'x', '-/x_y']
+    index = BranchIndex(names)
+    loaded = BranchIndex.loads(index.dumps())
+    assert len(loaded) == len(names)
+    assert 'Feature/UPPER' in loaded and 'feature/upper' not in loaded
+    for query in ['f', 'fal', 'login', 'LOG', 'mstr', 'rel', '1.0', '-', 'x', 'fixlr', 'zzz']:
+        for limit in (1, 3, 10):
+            assert loaded.rank(query, limit) == index.rank(query, limit)
+        assert loaded.resolve(query) == index.resolve(query)
+
+
+def test_rank_accepted_names():
+    index = BranchIndex(BRANCHES)
+    published = {'master', 'release-1.1', 'fix/login_redirect'}
+    assert index.rank('rel', accept=published.__contains__) == [(82, 'release-1.1')]
+    assert index.rank('flr', accept=published.__contains__) == [(60, 'fix/login_redirect')]
+    assert index.rank('mstr', accept=published.__contains__) == [(30, 'master')]
+    assert index.rank('mstr', accept=lambda name: False) == []
+
+
+@pytest.mark.timing
+def test_resolution_time_at_scale():
+    names = ['team{}/feature-{}_{}'.format(i % 50, i, i * 7) for i in range(50000)]
+    index = BranchIndex(names)
+    index.by_segment  # build the lazy indexes up front
+
+    queries = ['team{}/feature-{}'.format(i % 50, i) for i in range(0, 50000, 500)]
+    queries += ['feature-{}_'.format(i) for i in range(7, 50000, 500)]
+    start = time.perf_counter()
+    for query in queries:
+        assert index.rank(query)
+    elapsed = (time.perf_counter() - start) / len(queries)
+
+    assert elapsed < 0.001
@@ -0,0 +1,419 @@
+import os
+import subprocess
+
+import pytest
+
+from legit.scm import SCMRepo
+
+from .conftest import git
+
+
+def commit(path, message):
+    git(path, 'commit', '-q', '--allow-empty', '-m', message)
+
+
+@pytest.fixture
+def scm(repo, monkeypatch):
+    """The SCMRepo of the ``repo`` fixture, which is the working directory."""
+    monkeypatch.chdir(str(repo))
+    return SCMRepo()
+
+
+@pytest.fixture
+def origin(repo):
+    """The path of the bare repository 'origin' of the ``repo`` fixture."""
+    return git(repo, 'remote', 'get-url', 'origin').strip()
+
+
+def record_commands(scm):
+    """Return the list of git commands *scm* runs from now on."""
+    calls = []
+    execute = scm.backend.execute
+
+    def spy(command, **kwargs):
+        calls.append(command)
+        return execute(command, **kwargs)
+
+    scm.backend.execute = spy
+    return calls
+
+
+def test_has_merges(scm, repo):
+    git(repo, 'checkout', '-q', '-b', 'topic')
+    commit(repo, 'commit commit commit')
+    assert not scm.has_merges('master', 'topic')
+
+    git(repo, 'checkout', '-q', '-b', 'side', 'master')
+    commit(repo, 'side')
+    git(repo, 'checkout', '-q', 'topic')
+    git(repo, 'merge', '-q', '--no-edit', 'side')
+    assert scm.has_merges('master', 'topic')
+    assert not scm.has_merges('topic', 'master')
+
+
+def stash(path, message):
+    with open(os.path.join(str(path), 'file.txt'), 'a') as f:
+        f.write(message + '\n')
+    git(path, 'stash', 'save', '--include-untracked', message)
+
+
+def test_unstash_index_multi_digit(scm, repo):
+    with open('file.txt', 'a') as f:
+        f.write('mine\n')
+    scm.stash_it(sync=True)
+    for i in range(12):
+        stash(repo, 'unrelated {}'.format(i))
+
+    assert scm.unstash_index(sync=True) == 12
+    assert scm.stash_oid == git(repo, 'rev-parse', 'stash@{12}').strip()
+    assert scm.unstash_index(sync=False) is None
+    assert scm.unstash_index(sync=True, branch='other') is None
+
+
+def test_unstash_index_legacy_message(scm, repo):
+    stash(repo, 'Legit: stashing before switching branches.')
+    stash(repo, 'unrelated')
+    assert scm.unstash_index(sync=False) == 1
+
+
+def test_unstash_it_follows_moved_stash(scm, repo):
+    stash(repo, 'legit changes')
+    scm.stash_it(sync=False)
+    # stash_it saves nothing without local changes.
+    assert scm.unstash_index() is None
+
+    with open('file.txt', 'a') as f:
+        f.write('mine\n')
+    scm.stash_it(sync=False)
+    scm.stash_index = scm.unstash_index()
+    assert scm.stash_index == 0
+
+    stash(repo, 'pushed on top in the meantime')
+    scm.unstash_it()
+    assert 'mine' in open('file.txt').read()
+    assert git(repo, 'stash', 'list').count('\n') == 2
+
+
+def test_unstash_index_without_stashes(scm):
+    assert scm.unstash_index() is None
+
+
+def test_switch_worktree(scm, repo):
+    git(repo, 'branch', 'topic')
+    path = scm.switch_worktree('topic')
+    assert path == os.path.join(str(repo) + '.worktrees', 'topic')
+    assert git(path, 'symbolic-ref', '--short', 'HEAD').strip() == 'topic'
+
+    # Switching again reuses the worktree, and the main one is found too.
+    assert scm.switch_worktree('topic') == path
+    assert scm.switch_worktree('master') == str(repo)
+
+
+def test_prune_worktrees(scm, repo):
+    git(repo, 'config', 'legit.worktreeMaxCount', '1')
+    for branch in ('one', 'two', 'three'):
+        git(repo, 'branch', branch)
+        scm.switch_worktree(branch)
+    dirty = scm.switch_worktree('two')
+    with open(os.path.join(dirty, 'file.txt'), 'w') as f:
+        f.write('local changes\n')
+
+    three = scm.switch_worktree('three')
+    removed = scm.prune_worktrees(keep=(three,))
+    assert [os.path.basename(path) for path in removed] == ['one']
+    assert sorted(w.branch for w in scm.get_worktrees()) == ['master', 'three', 'two']
+
+
+def test_ref_index(scm, repo):
+    from legit.refindex import RefIndex
+
+    def load():
+        return RefIndex(scm.repo.git_dir, scm.repo.common_dir, remote='origin').load()
+
+    index = load()
+    assert index.changed
+    assert sorted(index.local) == ['feature/login', 'feature/logout', 'fix-typo', 'master']
+    assert sorted(index.published) == ['feature/login', 'master']
+    assert index.head == 'master'
+
+    # Nothing changed, so the stored index is reused as is.
+    assert not load().changed
+
+    git(repo, 'branch', 'feature/one')
+    git(repo, 'checkout', '-q', '-b', 'topic')
+    index = load()
+    assert index.changed
+    assert sorted(index.local) == [
+        'feature/login', 'feature/logout', 'feature/one', 'fix-typo', 'master', 'topic']
+    assert index.head == 'topic'
+
+    git(repo, 'pack-refs', '--all')
+    git(repo, 'branch', '-D', 'feature/one', 'feature/logout')
+    assert sorted(load().local) == ['feature/login', 'fix-typo', 'master', 'topic']
+    assert sorted(b.name for b in scm.get_branches()) == [
+        'feature/login', 'fix-typo', 'master', 'topic']
+
+
+def test_render_branches():
+    from legit.scm import Branch, render_branches
+
+    branches = [Branch('dev', False), Branch('master', True), Branch('topic', False)]
+    chunks = list(render_branches(branches, 'master', chunk_size=2))
+    assert len(chunks) == 2
+    assert ''.join(chunks).splitlines() == [
+        '   dev     (unpublished)  ',
+        '*  master  (published)    ',
+        '   topic   (unpublished)  ',
+    ]
+
+
+def test_render_branches_with_status():
+    from legit.scm import BranchStatus, render_branches
+
+    branches = [BranchStatus('dev', False, None, None), BranchStatus('master', True, 0, 0),
+                BranchStatus('topic', True, 2, 1)]
+    assert ''.join(render_branches(branches, 'master', status=True)).splitlines() == [
+        '   dev     (unpublished)  ',
+        '*  master  (published)    up to date',
+        '   topic   (published)    ahead 2, behind 1',
+    ]
+
+
+def test_ahead_behind(scm, repo):
+    git(repo, 'branch', '--set-upstream-to=origin/master', 'master')
+    for branch in ('tracked', 'published', 'local'):
+        git(repo, 'branch', branch)
+    # 'tracked' follows its upstream, 'published' is only compared by name.
+    git(repo, 'push', '-q', '-u', 'origin', 'tracked')
+    git(repo, 'push', '-q', 'origin', 'published')
+    git(repo, 'checkout', '-q', 'tracked')
+    commit(repo, 'ahead')
+    git(repo, 'checkout', '-q', 'published')
+    commit(repo, 'ahead')
+    commit(repo, 'ahead again')
+    git(repo, 'push', '-q', 'origin', 'published')
+    git(repo, 'reset', '-q', '--hard', 'HEAD~2')
+    commit(repo, 'diverged')
+    git(repo, 'checkout', '-q', 'master')
+
+    scm.refresh()
+    calls = record_commands(scm)
+
+    expected = {'master': (0, 0), 'tracked': (1, 0), 'published': (1, 2)}
+    assert scm.get_ahead_behind(['master', 'tracked', 'published', 'local']) == expected
+    assert sum(1 for command in calls if 'rev-list' in command) == 1
+
+    # Counts are cached by the commits compared.
+    del calls[:]
+    assert scm.get_ahead_behind(['tracked', 'published']) == {
+        'tracked': (1, 0), 'published': (1, 2)}
+    assert [command[1] for command in calls] == ['for-each-ref']
+
+    branches = scm.get_branches(status=True)
+    assert [(b.name, b.ahead, b.behind) for b in branches] == [
+        ('feature/login', 0, 0), ('feature/logout', None, None), ('fix-typo', None, None),
+        ('local', None, None), ('master', 0, 0), ('published', 1, 2), ('tracked', 1, 0)]
+
+
+def test_merged_branches(scm, repo):
+
+    def branch(name, *files):
+        git(repo, 'checkout', '-q', '-b', name, 'master')
+        for path in files:
+            (repo / path).write_text(path)
+            git(repo, 'add', path)
+            commit(repo, path)
+        git(repo, 'checkout', '-q', 'master')
+
+    branch('plain', 'a')
+    branch('squashed', 'b', 'c')
+    branch('picked', 'd', 'e')
+    branch('open', 'f')
+    git(repo, 'merge', '-q', '--no-ff', '-m', 'merge', 'plain')
+    git(repo, 'merge', '-q', '--squash', 'squashed')
+    commit(repo, 'squash')
+    git(repo, 'cherry-pick', 'picked~1', 'picked')
+    # A change reverted before the branch forks off doesn't make it merged.
+    (repo / 'g').write_text('g')
+    git(repo, 'add', 'g')
+    commit(repo, 'g')
+    git(repo, 'revert', '--no-edit', 'HEAD')
+    branch('late', 'g')
+    git(repo, 'push', '-q', 'origin', 'master', 'plain', 'squashed', 'open')
+    git(repo, 'remote', 'set-head', 'origin', 'master')
+
+    scm.refresh()
+    merged = scm.get_merged_branches('master')
+    assert [(b.name, b.is_published, b.by_patch) for b in merged] == [
+        ('feature/login', False, False), ('feature/logout', False, False),
+        ('fix-typo', False, False), ('picked', False, True), ('plain', False, False),
+        ('squashed', False, True), ('feature/login', True, False), ('plain', True, False),
+        ('squashed', True, True)]
+
+    git(repo, 'branch', '--set-upstream-to=origin/plain', 'plain')
+    scm.refresh()
+    scm.delete_branches({b.name: b.oid for b in merged if not b.is_published})
+    assert sorted(git(repo, 'branch', '--format=%(refname:short)').split()) == [
+        'late', 'master', 'open']
+    # The upstream of the deleted branch is forgotten with it.
+    assert scm.config().subsections('branch') == []
+
+
+def test_config_snapshot(scm):
+    config = scm.config()
+    assert scm.config() is config
+    assert scm.smart_merge_enabled() is True
+
+    # Config written by legit invalidates the snapshot.
+    scm.git_exec(['config', 'legit.smartMerge', 'false'])
+    assert scm.config() is not config
+    assert scm.smart_merge_enabled() is False
+    assert scm.get_remote_names() == ['origin']
+
+
+def test_fetch_remotes(scm, repo, origin, tmp_path):
+    git(repo, 'remote', 'add', 'mirror', origin)
+    git(repo, 'remote', 'add', 'broken', str(tmp_path / 'missing.git'))
+
+    scm.refresh()
+    reported = []
+    results = scm.fetch_remotes(callback=reported.append)
+    assert [r.remote for r in results] == ['origin', 'mirror', 'broken']
+    assert [r.ok for r in results] == [True, True, False]
+    assert sorted(r.remote for r in reported) == ['broken', 'mirror', 'origin']
+    assert scm.rev_parse('mirror/master') == scm.rev_parse('master')
+
+
+def test_prefetch(scm, repo, origin, capsys):
+    from legit.prefetch import (
+        PrefetchLock, PrefetchLocked, is_fresh, next_delay, run_prefetch)
+
+    fetched = scm.rev_parse('origin/master')
+    commit(repo, 'new')
+    # Pushed by path, so origin/master stays behind.
+    git(repo, 'push', '-q', origin, 'master')
+
+    reported = []
+    run_prefetch(scm, callback=lambda *args: reported.append(args))
+    assert reported == [('origin', True)]
+    assert scm.rev_parse('refs/prefetch/remotes/origin/master') == scm.rev_parse('master')
+    # Remote-tracking branches are left alone.
+    assert scm.rev_parse('refs/remotes/origin/master') == fetched
+    assert is_fresh(scm, 'origin')
+
+    # Not due yet, unless forced.
+    run_prefetch(scm, callback=lambda *args: reported.append(args))
+    assert len(reported) == 1
+    with PrefetchLock(scm.state_path('prefetch.lock')):
+        with pytest.raises(PrefetchLocked):
+            run_prefetch(scm, force=True)
+
+    # The final fetch of a sync only negotiates from the prefetched tips.
+    scm.fake = True
+    scm.smart_pull()
+    assert '--negotiation-tip=refs/prefetch/remotes/origin/*' in capsys.readouterr().out
+
+    # A faked prefetch doesn't take the lock.
+    with PrefetchLock(scm.state_path('prefetch.lock')):
+        run_prefetch(scm, force=True)
+    assert 'git fetch origin --prune' in capsys.readouterr().out
+
+    assert 900 <= next_delay(900, 0) <= 990
+    assert 3600 <= next_delay(900, 2) <= 3960
+    assert next_delay(900, 20, max_backoff=7200) <= 7920
+
+
+def test_record_and_replay(scm, repo, tmp_path, monkeypatch):
+    from git.exc import GitCommandError
+
+    cassette = str(tmp_path / 'cassette.json')
+    git(repo, 'checkout', '-q', '-b', 'topic')
+    commit(repo, 'topic commit')
+    stash(repo, 'Legit: stashing before switching branches.')
+    stash(repo, 'unrelated')
+
+    monkeypatch.setenv('LEGIT_RECORD', cassette)
+    recording = SCMRepo()
+    expected = (recording.has_merges('master', 'topic'), recording.unstash_index(),
+                recording.is_dirty(), recording.rev_parse('topic'))
+    with pytest.raises(GitCommandError):
+        recording.git_exec(['rev-parse', '--verify', 'no-such-branch'])
+    recording.backend.close()
+    assert expected == (False, 1, False, git(repo, 'rev-parse', 'topic').strip())
+
+    monkeypatch.delenv('LEGIT_RECORD')
+    monkeypatch.setenv('LEGIT_REPLAY', cassette)
+
+    def no_subprocess(*args, **kwargs):
+        raise AssertionError('git was run during a replay')
+
+    monkeypatch.setattr(subprocess, 'Popen', no_subprocess)
+    replaying = SCMRepo()
+    assert (replaying.has_merges('master', 'topic'), replaying.unstash_index(),
+            replaying.is_dirty(), replaying.rev_parse('topic')) == expected
+    with pytest.raises(GitCommandError):
+        replaying.git_exec(['rev-parse', '--verify', 'no-such-branch'])
+
+
+def test_fetch_branch_scope(scm, repo, origin, tmp_path):
+    other = str(tmp_path / 'other')
+    git(origin, 'config', 'uploadpack.allowFilter', 'true')
+    git(repo, 'branch', 'topic')
+    git(repo, 'push', '-q', '-u', 'origin', 'master', 'topic')
+
+    git(tmp_path, 'clone', '-q', origin, other)
+    for branch in ('master', 'topic'):
+        git(other, 'checkout', '-q', branch)
+        git(other, '-c', 'user.name=Other', '-c', 'user.email=other@example.com',
+            'commit', '-q', '--allow-empty', '-m', 'remote ' + branch)
+    git(other, 'tag', 'v1')
+    git(other, 'push', '-q', 'origin', 'master', 'topic', 'v1')
+
+    git(repo, 'config', 'legit.fetchScope', 'branch')
+    git(repo, 'config', 'remote.origin.promisor', 'true')
+    git(repo, 'config', 'remote.origin.partialCloneFilter', 'blob:none')
+    scm.refresh()
+    calls = record_commands(scm)
+
+    topic = scm.rev_parse('origin/topic')
+    scm.smart_pull()
+    fetch = next(command for command in calls if command[1] == 'fetch')
+    assert fetch[2:] == ['origin', '--no-tags', '--negotiation-tip=refs/heads/master',
+                         '--negotiation-tip=refs/remotes/origin/master', '--filter=blob:none',
+                         '+refs/heads/master:refs/remotes/origin/master']
+    # Only the current branch moved, and no tags came along.
+    assert scm.rev_parse('master') == scm.rev_parse('origin/master')
+    assert git(repo, 'log', '-1', '--format=%s', 'master').strip() == 'remote master'
+    assert scm.rev_parse('origin/topic') == topic
+    assert git(repo, 'tag') == ''
+
+
+def test_live_heads(scm, repo, origin):
+    git(repo, 'branch', 'topic')
+    # Pushed by path, so there is no remote-tracking branch.
+    git(repo, 'push', '-q', origin, 'fix-typo')
+
+    calls = record_commands(scm)
+
+    def ls_remote_calls():
+        return sum(1 for command in calls if 'ls-remote' in command)
+
+    assert scm.get_branches(remote_branches=True) == [
+        ('feature/login', True), ('feature/logout', False), ('fix-typo', False),
+        ('master', True), ('topic', False)]
+    assert scm.get_branches(live=True) == [
+        ('feature/login', True), ('feature/logout', False), ('fix-typo', True),
+        ('master', True), ('topic', False)]
+    assert sorted(scm.get_live_heads()) == ['feature/login', 'fix-typo', 'master']
+    assert ls_remote_calls() == 1
+
+    # Pushing through legit drops the cached answer.
+    scm.git_exec(['push', 'origin', 'topic'])
+    assert sorted(scm.get_live_heads()) == ['feature/login', 'fix-typo', 'master', 'topic']
+    assert ls_remote_calls() == 2
+
+    git(repo, 'config', 'legit.lsRemoteTTL', '0')
+    scm.refresh()
+    scm.get_live_heads()
+    scm.get_live_heads()
+    assert ls_remote_calls() == 4
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from legit import settings
+from legit.settings import load_settings, write_default_settings
+
+
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache' / 'settings.json')
+    monkeypatch.setattr(settings, 'settings_cache_path', lambda: path)
+    return path
+
+
+def write_config(tmp_path, body):
+    path = tmp_path / 'config.ini'
+    path.write_text('[legit]\n' + body)
+    return str(path)
+
+
+def test_defaults_without_config_file(tmp_path):
+    loaded = load_settings(str(tmp_path / 'missing.ini'), environ={})
+    assert loaded.allow_black_foreground is True
+    assert loaded.disable_colors is False
+    assert not os.path.exists(str(tmp_path / 'missing.ini'))
+
+
+def test_typed_values(tmp_path):
+    path = write_config(tmp_path, 'allow_black_foreground = nope\ndisable_colors = maybe\n')
+    loaded = load_settings(path, environ={})
+    assert loaded.allow_black_foreground is False
+    # Invalid values fall back to the default.
+    assert loaded.disable_colors is False
+
+
+def test_parsed_once_per_mtime(tmp_path, monkeypatch, cache_path):
+    path = write_config(tmp_path, 'disable_colors = true\n')
+    before = os.stat(path)
+    assert load_settings(path, environ={}).disable_colors is True
+    assert os.path.exists(cache_path)
+
+    # Neither the in-memory nor the on-disk cache needs the INI parser.
+    def fail(path):
+        raise AssertionError('config parsed again')
+
+    monkeypatch.setattr(settings, '_parse_config', fail)
+    assert load_settings(path, environ={}).disable_colors is True
+    settings._cache.clear()
+    assert load_settings(path, environ={}).disable_colors is True
+
+    after = os.stat(path)
+    assert (before.st_mtime_ns, before.st_size) == (after.st_mtime_ns, after.st_size)
+    # Nothing is written next to the config file.
+    assert sorted(os.listdir(str(tmp_path))) == ['cache', 'config.ini']
+
+
+def test_environment_override(tmp_path):
+    path = write_config(tmp_path, 'disable_colors = false\n')
+    loaded = load_settings(path, environ={'LEGIT_DISABLE_COLORS': '1'})
+    assert loaded.disable_colors is True
+
+
+def test_write_default_settings(tmp_path):
+    path = write_default_settings(str(tmp_path / 'legit' / 'config.ini'))
+    with open(path) as f:
+        content = f.read()
+    assert 'allow_black_foreground = True' in content
+    assert 'disable_colors = False' in content
@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Generous upper bound for importing legit.cli, in microseconds.
+IMPORT_TIME_BUDGET = 150000
+
+PROBE = """
+import sys
+from legit.cli import cli
+try:
+    cli({args!r})
+except SystemExit:
+    pass
+print(sorted(m for m in sys.modules if m.split('.')[0] in ('git', 'gitdb', 'legit')))
+"""
+
+
+def loaded_modules(*args):
+    output = subprocess.check_output(
+        [sys.executable, '-c', PROBE.format(args=list(args))], universal_newlines=True)
+    return eval(output.splitlines()[-1])
+
+
+@pytest.mark.cli
+@pytest.mark.parametrize('args', [['--version'], ['--help'], ['-h'], ['sync', '-h']])
+def test_help_and_version_skip_gitpython(args):
+    modules = loaded_modules(*args)
+    assert 'git' not in modules
+    assert 'gitdb' not in modules
+    assert 'legit.scm' not in modules
+
+
+def import_times():
+    """Returns the cumulative import time of every module imported by legit.cli."""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import legit.cli'],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+
+    cumulative = {}
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, total, name = line[len('import time:'):].split('|')
+            if total.strip().isdigit():
+                cumulative[name.strip()] = int(total)
+    return cumulative
+
+
+@pytest.mark.cli
+def test_import_skips_gitpython():
+    probe = (
+        "import sys\n"
+        "import legit.cli\n"
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in ('git', 'gitdb')))\n")
+    output = subprocess.check_output([sys.executable, '-c', probe], universal_newlines=True)
+    assert eval(output.splitlines()[-1]) == []
+
+
+@pytest.mark.cli
+@pytest.mark.timing
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='-X importtime needs Python 3.7')
+def test_import_time_budget():
+    assert import_times()['legit.cli'] < IMPORT_TIME_BUDGET
+
+
+@pytest.mark.cli
+def test_complete_skips_click_and_gitpython():
+    probe = (
+        "import sys\n"
+        "sys.argv = ['legit', '__complete', 'switch', '']\n"
+        "from legit.__main__ import main\n"
+        "try:\n"
+        "    main()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in ('click', 'git', 'gitdb')))\n")
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    output = subprocess.check_output(
+        [sys.executable, '-c', probe], cwd='test_repo', env=env, universal_newlines=True)
+    assert eval(output.splitlines()[-1]) == []
@@ -0,0 +1,36 @@
+import json
+
+from legit import trace
+
+
+def test_disabled_spans_are_shared_noops():
+    assert trace.tracer is None
+    assert trace.span('phase') is trace.NULL_SPAN
+    assert trace.git_span(['git', 'status']) is trace.NULL_SPAN
+
+
+def test_nested_spans(tmp_path):
+    tracer = trace.enable()
+    try:
+        with trace.span('legit sync', 'command'):
+            with trace.span('\x1b[33mPulling\x1b[0m commits.'):
+                with trace.git_span(['git', 'fetch', 'origin']) as span:
+                    span.set(exit_code=0, bytes=12)
+    finally:
+        assert trace.disable() is tracer
+
+    events = sorted(tracer.events, key=lambda event: event.start)
+    assert [(event.name, event.depth) for event in events] == [
+        ('legit sync', 0), ('Pulling commits.', 1), ('git fetch', 2)]
+    assert events[2].args == {'argv': ['git', 'fetch', 'origin'], 'exit_code': 0, 'bytes': 12}
+
+    summary = tracer.summary()
+    assert '    git fetch' in summary
+    assert 'git commands' in summary
+
+    path = tmp_path / 'trace.json'
+    tracer.write_chrome_trace(str(path))
+    trace_events = json.loads(path.read_text())['traceEvents']
+    assert [event['name'] for event in trace_events] == [
+        'legit sync', 'Pulling commits.', 'git fetch']
+    assert all(event['ph'] == 'X' for event in trace_events)
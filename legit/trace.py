@@ -0,0 +1,189 @@
+"""
+legit.trace
+~~~~~~~~~~~
+
+This module records where the time of a legit command goes.
+
+Commands, phases (the steps announced by ``status_log``) and every git
+process are recorded as nested spans once tracing is enabled, with
+``legit --timings`` or ``LEGIT_TRACE=<file>``. While it is disabled,
+``span`` hands out a shared no-op object, so the instrumentation costs a
+global lookup and a function call.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+ANSI_ESCAPE_RE = re.compile(r'\x1b\[[0-9;]*m')
+
+TraceEvent = namedtuple(
+    'TraceEvent', ['name', 'category', 'start', 'duration', 'depth', 'tid', 'args'])
+
+# The active Tracer, None while tracing is disabled.
+tracer = None
+
+
+class NullSpan:
+    """The span handed out while tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    """A timed section; ``set`` attaches details such as exit codes."""
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start', 'depth')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.depth = self.tracer.push()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if exc is not None:
+            # GitCommandError carries the exit code of the failed command.
+            status = getattr(exc, 'status', None)
+            self.args.setdefault('exit_code', status if isinstance(status, int) else None)
+            self.args['error'] = exc_type.__name__
+        self.tracer.pop()
+        self.tracer.record(self, duration)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+class Tracer:
+    """Collects the finished spans of all threads."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.threads = {}
+
+    def push(self):
+        depth = getattr(self.local, 'depth', 0)
+        self.local.depth = depth + 1
+        return depth
+
+    def pop(self):
+        self.local.depth -= 1
+
+    def record(self, span, duration):
+        thread = threading.get_ident()
+        with self.lock:
+            tid = self.threads.setdefault(thread, len(self.threads) + 1)
+            self.events.append(TraceEvent(
+                span.name, span.category, span.start - self.origin, duration,
+                span.depth, tid, span.args))
+
+    def chrome_trace(self):
+        """Returns the spans in the Chrome trace-event format (for Perfetto)."""
+        pid = os.getpid()
+        return {
+            'traceEvents': [{
+                'name': event.name,
+                'cat': event.category,
+                'ph': 'X',
+                'ts': round(event.start * 1e6, 3),
+                'dur': round(event.duration * 1e6, 3),
+                'pid': pid,
+                'tid': event.tid,
+                'args': event.args,
+            } for event in sorted(self.events, key=lambda event: event.start)],
+            'displayTimeUnit': 'ms',
+        }
+
+    def summary(self):
+        """Returns a table of all spans in start order, and git totals per command."""
+        lines = ['{:<60} {:>10} {:>6} {:>10}'.format('Timings', 'ms', 'exit', 'bytes')]
+        for event in sorted(self.events, key=lambda event: (event.start, event.depth)):
+            label = '  ' * event.depth + event.name
+            if len(label) > 60:
+                label = label[:57] + '...'
+            lines.append('{:<60} {:>10.1f} {:>6} {:>10}'.format(
+                label, event.duration * 1000,
+                '' if event.args.get('exit_code') is None else event.args['exit_code'],
+                event.args.get('bytes', '')))
+
+        totals = {}
+        for event in self.events:
+            if event.category == 'git':
+                count, duration = totals.get(event.name, (0, 0.0))
+                totals[event.name] = (count + 1, duration + event.duration)
+        if totals:
+            lines.append('')
+            lines.append('{:<60} {:>10} {:>6}'.format('git commands', 'ms', 'calls'))
+            for name, (count, duration) in sorted(totals.items(), key=lambda item: -item[1][1]):
+                lines.append('{:<60} {:>10.1f} {:>6}'.format(name, duration * 1000, count))
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def enable():
+    """Starts recording spans, returns the Tracer."""
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def disable():
+    """Stops recording spans, returns the Tracer which was active."""
+    global tracer
+    active, tracer = tracer, None
+    return active
+
+
+def span(name, category='phase', **args):
+    """Returns a context manager timing the enclosed code as ``name``."""
+    if tracer is None:
+        return NULL_SPAN
+    return Span(tracer, ANSI_ESCAPE_RE.sub('', str(name)), category, args)
+
+
+def git_span(command):
+    """Returns the span of the git process running ``command``."""
+    if tracer is None:
+        return NULL_SPAN
+    name = 'git {}'.format(command[1]) if len(command) > 1 else 'git'
+    return Span(tracer, name, 'git', {'argv': list(command)})
+
+
+def output_size(result):
+    """Returns the bytes of output of a git command result."""
+    parts = result[1:] if isinstance(result, tuple) else (result,)
+    size = 0
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8', 'replace')
+        if isinstance(part, bytes):
+            size += len(part)
+    return size
@@ -1,9 +1,9 @@
 import click
-from clint.textui import colored, columns
 import crayons
 import os
 import sys
 
+from . import trace
 from .settings import legit_settings
 
 
@@ -11,7 +11,8 @@ def status_log(func, message, *args, **kwargs):
     """Emits header message, executes a callable, and echoes the return strings."""
 
     click.echo(message)
-    log = func(*args, **kwargs)
+    with trace.span(message):
+        log = func(*args, **kwargs)
 
     if log:
         out = []
@@ -37,6 +38,8 @@ def verbose_echo(str, verbose=False, fake=False):
 
 def output_aliases(aliases):
     """Display git aliases"""
+    from clint.textui import colored, columns
+
     for alias in aliases:
         cmd = '!legit ' + alias
         click.echo(columns([colored.yellow('git ' + alias), 20], [cmd, None]))
@@ -51,6 +54,9 @@ def order_manually(sub_commands):
         "unpublish",
         "undo",
         "branches",
+        "prune",
+        "prefetch",
+        "daemon",
     ]
     ordered = []
     commands = dict(zip([cmd for cmd in sub_commands], sub_commands))
@@ -78,6 +84,9 @@ def format_help(help):
     help = help.replace('  unpublish', str(crayons.green('  unpublish', bold=True)))
     help = help.replace('  undo', str(crayons.green('  undo', bold=True)))
     help = help.replace('  branches', str(crayons.yellow('  branches', bold=True)))
+    help = help.replace('  prune', str(crayons.green('  prune', bold=True)))
+    help = help.replace('  prefetch', str(crayons.green('  prefetch', bold=True)))
+    help = help.replace('  daemon', str(crayons.green('  daemon', bold=True)))
 
     additional_help = \
         """Usage Examples:
@@ -102,6 +111,15 @@ $ {}
 List branches matching wildcard pattern:
 $ {}
 
+Delete branches merged into the current branch:
+$ {}
+
+Fetch remotes in the background ahead of the next sync:
+$ {}
+
+Keep legit loaded to run commands faster:
+$ {}
+
 Commands:""".format(
             crayons.red('legit sw <branch>'),
             crayons.red('legit sync'),
@@ -110,6 +128,9 @@ Commands:""".format(
             crayons.red('legit publish <branch>'),
             crayons.red('legit unpublish <branch>'),
             crayons.red('legit branches [<wildcard pattern>]'),
+            crayons.red('legit prune'),
+            crayons.red('legit prefetch --daemon'),
+            crayons.red('legit daemon'),
         )
 
     help = help.replace('Commands:', additional_help)
@@ -117,6 +138,11 @@ Commands:""".format(
     return help
 
 
+def is_wildcard_pattern(s):
+    """Returns True if ``s`` contains fnmatch wildcard characters."""
+    return bool(s) and any(c in s for c in '*?[')
+
+
 def black(s, **kwargs):
     if legit_settings.allow_black_foreground:
         return crayons.black(s, **kwargs)
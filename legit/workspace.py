@@ -0,0 +1,98 @@
+"""
+legit.workspace
+~~~~~~~~~~~~~~~
+
+This module runs legit commands across many repositories concurrently.
+"""
+
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+RepoResult = namedtuple('RepoResult', ['path', 'returncode', 'output', 'duration'])
+
+
+def default_jobs():
+    return min(8, (os.cpu_count() or 1) * 2)
+
+
+def read_manifest(path):
+    """Returns the repository paths listed in a workspace manifest.
+
+    A manifest lists one repository per line; blank lines and lines starting
+    with ``#`` are ignored. Relative paths are relative to the manifest.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    paths = []
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            paths.append(os.path.normpath(os.path.join(base, os.path.expanduser(line))))
+
+    return paths
+
+
+def legit_command():
+    """Returns the command line which starts this very legit."""
+    if getattr(sys, 'frozen', False):  # standalone executable
+        return [sys.executable]
+    return [sys.executable, '-m', 'legit']
+
+
+def child_environment():
+    """Returns the environment making a child process import this very legit.
+
+    An installed legit is found by the child as it is. Running from a source
+    checkout, the checkout is put on ``PYTHONPATH``. The directory holding
+    an installed package never is, as it would shadow the standard library
+    with whatever else is installed there.
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if not os.path.isfile(os.path.join(package_root, 'setup.py')):
+        return None
+
+    python_path = os.environ.get('PYTHONPATH')
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [package_root] + ([python_path] if python_path else [])))
+
+
+def run_in_repository(path, args):
+    """Runs ``legit <args>`` in ``path`` and captures its combined output."""
+    start = time.time()
+
+    if not os.path.isdir(path):
+        return RepoResult(path, 1, 'No such directory.', 0.0)
+
+    proc = subprocess.run(
+        legit_command() + list(args),
+        cwd=path, env=child_environment(), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, universal_newlines=True)
+
+    return RepoResult(path, proc.returncode, proc.stdout, time.time() - start)
+
+
+def run_workspace(paths, args, jobs=None, callback=None):
+    """Runs ``legit <args>`` in every repository of ``paths`` concurrently.
+
+    At most ``jobs`` repositories are processed at a time. ``callback`` is
+    called with each RepoResult as soon as it is available. Returns all
+    results in the order of ``paths``.
+    """
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=jobs or default_jobs()) as pool:
+        futures = {pool.submit(run_in_repository, path, args): path for path in paths}
+
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if callback is not None:
+                callback(result)
+
+    return [results[path] for path in paths]
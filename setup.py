@@ -92,7 +92,7 @@ settings.update(
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3 :: Only",
     ],
-    entry_points={"console_scripts": ["legit = legit.cli:cli"]},
+    entry_points={"console_scripts": ["legit = legit.__main__:main"]},
     cmdclass={"publish": UploadCommand}
 )
 